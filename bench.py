@@ -0,0 +1,615 @@
+"""Headless benchmarks for the per-message hot paths.
+
+    python bench.py                       # synthetic messages
+    python bench.py --log capture.log     # decode recorded frames too
+    xvfb-run python bench.py              # include Tk label updates without a display
+
+Reports messages/sec, p50/p99 latency per message, peak bytes allocated per
+message, chart redraw time against candle count, alert cost per tick
+against rule count, stream throughput on threads versus one asyncio loop and
+bar synthesis cost per trade.
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from lib import (
+    CANDLE_DTYPE,
+    AlertEngine,
+    AlertRule,
+    AsyncStreamHub,
+    BarBuilder,
+    BarRule,
+    EventLoop,
+    DecodePipeline,
+    KlineTracker,
+    LiquidityHeatmap,
+    LocalStreamServer,
+    OrderBook,
+    StreamHub,
+    TRADE_DTYPE,
+    TickerTracker,
+    TraderTracker,
+    UpdateQueue,
+    bookDepthTracker,
+    decode_batch,
+    read_frames,
+    store,
+)
+
+
+def tracker_for(stream, first_event):
+    """A tracker ready to take `stream` without any network access."""
+    symbol, _, kind = stream.partition("@")
+    if kind == "ticker":
+        return TickerTracker(symbol, kind)
+    if kind == "trade":
+        return TraderTracker(symbol, kind)
+    if kind.startswith("depth@"):
+        tracker = bookDepthTracker(symbol, kind)
+        tracker.book.last_update_id = first_event["U"] - 1
+        return tracker
+    if kind.startswith("kline_"):
+        tracker = KlineTracker(symbol, kind[len("kline_"):])
+        tracker.seeded = True
+        return tracker
+    return None
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def measure(name, items, fn):
+    """Time `fn` over every item and print one result row."""
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter_ns()
+        fn(item)
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - started
+
+    sample = items[: min(len(items), 2000)]
+    tracemalloc.start()
+    peak = 0
+    for item in sample:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(item)
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    print(
+        f"{name:<28}{len(items) / elapsed:>12,.0f}"
+        f"{percentile(latencies, 50) / 1000:>10.1f}"
+        f"{percentile(latencies, 99) / 1000:>10.1f}"
+        f"{peak / max(len(sample), 1):>12,.0f}"
+    )
+
+
+def header(title):
+    print(f"\n{title}")
+    print(f"{'':<28}{'msgs/s':>12}{'p50 us':>10}{'p99 us':>10}{'bytes/msg':>12}")
+
+
+def envelope(stream, data):
+    return json.dumps({"stream": stream, "data": data})
+
+
+def ticker_frames(n):
+    frames = []
+    for i in range(n):
+        price = 60000 + random.uniform(-500, 500)
+        data = {"e": "24hrTicker", "E": i, "s": "BTCUSDT", "c": f"{price:.2f}"}
+        data.update({"p": f"{price - 60000:.2f}", "P": f"{(price - 60000) / 600:.3f}"})
+        frames.append(envelope("btcusdt@ticker", data))
+    return frames
+
+
+def trade_frames(n):
+    frames = []
+    for i in range(n):
+        data = {
+            "e": "trade",
+            "E": i,
+            "s": "BTCUSDT",
+            "t": i,
+            "p": f"{60000 + random.uniform(-50, 50):.2f}",
+            "q": f"{random.uniform(0.0001, 2):.5f}",
+            "T": i,
+            "m": random.random() < 0.5,
+        }
+        frames.append(envelope("btcusdt@trade", data))
+    return frames
+
+
+def depth_snapshot(levels=1000):
+    bids = [[f"{60000 - i * 0.01:.2f}", "1.0"] for i in range(1, levels + 1)]
+    asks = [[f"{60000 + i * 0.01:.2f}", "1.0"] for i in range(1, levels + 1)]
+    return {"lastUpdateId": 0, "bids": bids, "asks": asks}
+
+
+def depth_frames(n, levels=20):
+    frames = []
+    for i in range(n):
+        bids = [
+            [f"{60000 - random.randint(1, 1000) * 0.01:.2f}", f"{random.choice([0, 1.5]):.1f}"]
+            for _ in range(levels)
+        ]
+        asks = [
+            [f"{60000 + random.randint(1, 1000) * 0.01:.2f}", f"{random.choice([0, 1.5]):.1f}"]
+            for _ in range(levels)
+        ]
+        data = {"e": "depthUpdate", "E": i, "U": i + 1, "u": i + 1, "b": bids, "a": asks}
+        frames.append(envelope("btcusdt@depth@100ms", data))
+    return frames
+
+
+def kline_frames(n):
+    frames = []
+    for i in range(n):
+        price = f"{60000 + random.uniform(-50, 50):.2f}"
+        k = {"t": (i // 60) * 60_000, "T": (i // 60) * 60_000 + 59_999, "x": i % 60 == 59}
+        k.update({"o": price, "h": price, "l": price, "c": price, "v": "1.0"})
+        frames.append(envelope("btcusdt@kline_1m", {"e": "kline", "E": i, "k": k}))
+    return frames
+
+
+def bench_decode(args):
+    """Raw frame -> envelope decode -> tracker on_message."""
+    header("decode + on_message (per frame)")
+    hub = StreamHub()
+
+    def route(frames, tracker):
+        tracker.hub = hub
+        tracker.is_active = True
+        hub.routes[tracker.stream] = (tracker.on_message,)
+        return frames
+
+    measure("ticker", route(ticker_frames(args.messages), TickerTracker("btcusdt", "ticker")),
+            lambda frame: hub.on_message(None, frame))
+    measure("trade", route(trade_frames(args.messages), TraderTracker("btcusdt", "trade")),
+            lambda frame: hub.on_message(None, frame))
+
+    book = bookDepthTracker("btcusdt", "depth@100ms")
+    book.book.load_snapshot(depth_snapshot())
+    measure("depth diff (20 levels)", route(depth_frames(args.messages), book),
+            lambda frame: hub.on_message(None, frame))
+
+    kline = KlineTracker("btcusdt", "1m")
+    kline.seeded = True
+    measure("kline", route(kline_frames(args.messages), kline),
+            lambda frame: hub.on_message(None, frame))
+
+    if args.log:
+        frames = [frame for _, frame in read_frames(args.log)]
+        for frame in frames:
+            envelope = json.loads(frame)
+            stream = envelope.get("stream")
+            if stream and stream not in hub.routes:
+                tracker = tracker_for(stream, envelope["data"])
+                if tracker:
+                    route([], tracker)
+        measure(f"recorded ({len(frames)} frames)", frames,
+                lambda frame: hub.on_message(None, frame))
+
+
+def bench_book(args):
+    """OrderBook updates and top-N reads on a 1000-level book."""
+    header("order book (per operation)")
+    tracker = bookDepthTracker("btcusdt", "depth@100ms")
+    tracker.book.load_snapshot(depth_snapshot())
+    diffs = [json.loads(frame)["data"] for frame in depth_frames(args.messages)]
+    measure("apply_diff (20 levels)", diffs, tracker.book.apply_diff)
+    measure("top(10)", list(range(args.messages)), lambda _: tracker.book.top(10))
+
+
+def bench_dispatch(args, root):
+    """Posting into the conflating queue, draining it and rendering labels."""
+    header("UI dispatch (per message)")
+    queue = UpdateQueue()
+    keys = [("ticker", 0), ("trade", 0), ("book", 0)]
+    measure("UpdateQueue.post", list(range(args.messages)),
+            lambda i: queue.post(keys[i % 3], print, i))
+    queue.drain()
+
+    drained = []
+
+    def post_and_drain(i):
+        queue.post(keys[i % 3], drained.append, i)
+        if i % 100 == 0:
+            for handler, payload, _ in queue.drain():
+                handler(payload)
+
+    measure("post + drain every 100", list(range(args.messages)), post_and_drain)
+    print(f"  queue stats: {queue.stats()}")
+
+    if root is None:
+        print("  (Tk label updates skipped: no display, try xvfb-run)")
+        return
+
+    from widget import BookDepth
+
+    class Direct:
+        def bind(self, key, handler):
+            return handler
+
+    panel = BookDepth(root, "btcusdt", "", 10, Direct(), autostart=False)
+    tracker = bookDepthTracker("btcusdt", "depth@100ms")
+    tracker.book.load_snapshot(depth_snapshot())
+    books = [tracker.book.top(10) for _ in range(min(args.messages, 2000))]
+
+    def render(book):
+        panel.update_information(book)
+        root.update_idletasks()
+
+    measure("BookDepth.update_information", books, render)
+
+
+def bench_pipeline(args):
+    """Decode throughput against worker count, and main-process CPU per frame."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    frames = []
+    for make in (ticker_frames, trade_frames, depth_frames, kline_frames):
+        frames += make(args.messages // 4)
+    frames.sort(key=lambda frame: json.loads(frame)["data"]["E"])
+    typed = frozenset(json.loads(frame)["stream"] for frame in frames[:100])
+    batches = [frames[i : i + 256] for i in range(0, len(frames), 256)]
+
+    print(f"\n{'decode pipeline':<28}{'workers':>12}{'msgs/s':>10}{'main us':>10}")
+    for workers in args.workers:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(decode_batch, batches[:workers], [typed] * workers))
+            started = time.perf_counter()
+            list(pool.map(decode_batch, batches, [typed] * len(batches)))
+            rate = len(frames) / (time.perf_counter() - started)
+
+        hub = StreamHub(autoconnect=False)
+        trackers = [
+            TickerTracker("btcusdt", "ticker"),
+            TraderTracker("btcusdt", "trade"),
+            bookDepthTracker("btcusdt", "depth@100ms"),
+            KlineTracker("btcusdt", "1m"),
+        ]
+        trackers[2].book.load_snapshot(depth_snapshot())
+        trackers[3].seeded = True
+        for tracker in trackers:
+            tracker.hub = hub
+            tracker.is_active = True
+            hub.subscribe(tracker.stream, tracker.on_message, tracker.on_records)
+
+        pipeline = DecodePipeline(hub, workers)
+        started = time.process_time()
+        for frame in frames:
+            hub.on_message(None, frame)
+        while pipeline.batch or not pipeline.pending.empty():
+            time.sleep(0.001)
+        time.sleep(0.05)
+        cpu = (time.process_time() - started) / len(frames) * 1e6
+        pipeline.close()
+        print(f"{'':<28}{workers:>12}{rate:>10,.0f}{cpu:>10.1f}")
+
+
+def bench_alerts(args):
+    """Per-tick alert cost against rule count, indexed vs. scanning every rule."""
+    print(
+        f"\n{'alerts (us/tick)':<28}{'rules':>12}{'indexed':>10}{'p99':>10}{'scan':>12}"
+    )
+    ticks = 60000 + np.cumsum(np.random.randn(args.messages) * 5)
+    low, high = ticks.min(), ticks.max()
+    for count in args.rules:
+        engine = AlertEngine(f"{tempfile.mkdtemp(prefix='bench-alerts-')}/alerts.json")
+        engine.add(AlertRule("btcusdt", "move", "above", 50, window=60), save=False)
+        # Rules sit outside the walk, as most alerts are far from the price.
+        levels = np.concatenate(
+            [
+                np.random.uniform(low * 0.5, low, count // 2),
+                np.random.uniform(high, high * 1.5, count - count // 2),
+            ]
+        )
+        for level in levels:
+            direction = "above" if level > high else "below"
+            engine.add(AlertRule("btcusdt", "price", direction, level), save=False)
+
+        latencies = []
+        for i, price in enumerate(ticks.tolist()):
+            t0 = time.perf_counter_ns()
+            engine.price("btcusdt", price, i * 100)
+            latencies.append(time.perf_counter_ns() - t0)
+
+        rules = list(engine.rules.values())
+        sample = ticks[: max(200_000 // count, 10)].tolist()
+        previous = sample[0]
+        started = time.perf_counter()
+        for price in sample:
+            [
+                rule
+                for rule in rules
+                if (rule.direction == "above" and previous < rule.threshold <= price)
+                or (rule.direction == "below" and price <= rule.threshold < previous)
+            ]
+            previous = price
+        scan = (time.perf_counter() - started) / len(sample)
+
+        print(
+            f"{'':<28}{count:>12,}{percentile(latencies, 50) / 1000:>10.1f}"
+            f"{percentile(latencies, 99) / 1000:>10.1f}{scan * 1e6:>12.1f}"
+        )
+
+
+def bench_bars(args):
+    """Bar synthesis per trade, one trade at a time and in stream-sized batches,
+    and the vectorized rebuild of every bar when the rule changes."""
+    print(
+        f"\n{'bars (us/trade)':<28}{'rule':>12}{'bars':>10}{'single':>10}"
+        f"{'batch':>10}{'rebuild ms':>12}"
+    )
+    trades = np.zeros(args.trades, dtype=TRADE_DTYPE)
+    trades["price"] = 60000 + np.cumsum(np.random.randn(args.trades) * 2)
+    trades["qty"] = np.random.exponential(0.05, args.trades)
+    trades["time"] = 1_700_000_000_000 + np.cumsum(np.random.randint(0, 20, args.trades))
+    rows = trades.tolist()
+
+    for text in ["5s", "100t", "10v", "1M$"]:
+        rule = BarRule.parse(text)
+        builder = BarBuilder(rule)
+        started = time.perf_counter()
+        for price, qty, time_ms, _ in rows:
+            builder.add(price, qty, time_ms)
+        single = (time.perf_counter() - started) / len(rows)
+
+        builder = BarBuilder(rule)
+        started = time.perf_counter()
+        for i in range(0, len(trades), 50):
+            builder.extend(trades[i : i + 50])
+        batch = (time.perf_counter() - started) / len(rows)
+
+        started = time.perf_counter()
+        builder.rebuild(trades)
+        rebuild = time.perf_counter() - started
+
+        print(
+            f"{'':<28}{text:>12}{len(builder.series):>10,}{single * 1e6:>10.2f}"
+            f"{batch * 1e6:>10.2f}{rebuild * 1e3:>12.1f}"
+        )
+
+
+def bench_depth(args):
+    """Book arrays, heatmap column and depth chart frame against level count."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from chart import DepthChart
+
+    print(
+        f"\n{'depth chart':<28}{'levels':>12}{'arrays us':>10}{'heatmap us':>12}"
+        f"{'blit ms':>10}{'redraws':>9}"
+    )
+    for levels in args.levels:
+        book = OrderBook("btcusdt")
+        book.load_snapshot(depth_snapshot(levels))
+        heatmap = LiquidityHeatmap()
+        fig = Figure(figsize=(4, 4), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        chart = DepthChart(fig, canvas, "BTC", heatmap)
+
+        timings = {"arrays": [], "heatmap": [], "render": []}
+        redraws = 0
+        for _ in range(200):
+            for _ in range(20):
+                price = 60000 + random.choice([-1, 1]) * random.randint(1, levels) * 0.01
+                side = book.bids if price < 60000 else book.asks
+                side.set(price, random.choice([0, 0.5, 1.0, 2.5]))
+
+            t0 = time.perf_counter()
+            arrays = book.arrays(levels)
+            t1 = time.perf_counter()
+            heatmap.add(*arrays)
+            t2 = time.perf_counter()
+            moved = heatmap.moved or chart.background is None
+            chart.render(arrays)
+            if moved or chart.background is None:
+                canvas.draw()
+                redraws += 1
+            t3 = time.perf_counter()
+            timings["arrays"].append(t1 - t0)
+            timings["heatmap"].append(t2 - t1)
+            if not moved:
+                timings["render"].append(t3 - t2)
+
+        print(
+            f"{'':<28}{levels:>12,}{percentile(timings['arrays'], 50) * 1e6:>10.0f}"
+            f"{percentile(timings['heatmap'], 50) * 1e6:>12.0f}"
+            f"{percentile(timings['render'], 50) * 1000:>10.2f}{redraws:>9}"
+        )
+
+
+def bench_runtime(args):
+    """Delivery over a local server: threaded hub against the asyncio loop."""
+    import threading
+
+    print(
+        f"\n{'stream runtime':<28}{'streams':>12}{'msgs/s':>10}{'cpu us':>10}"
+        f"{'threads':>9}"
+    )
+    server = LocalStreamServer("127.0.0.1", 9477)
+    server.start()
+    streams = [f"s{i}usdt@trade" for i in range(args.streams)]
+    frames = [
+        (stream, envelope(stream, {"e": "trade", "E": i, "p": "1.0", "q": "1.0"}))
+        for i, stream in enumerate(streams * max(args.messages // len(streams), 1))
+    ]
+
+    for name in ("threads", "asyncio"):
+        # Threads of the previous run may still be exiting, so count by identity.
+        before = set(threading.enumerate())
+        runtime = EventLoop() if name == "asyncio" else None
+        hub = AsyncStreamHub(runtime, server.url) if runtime else StreamHub(server.url)
+        received = []
+        done = threading.Event()
+
+        def handler(data):
+            received.append(data)
+            if len(received) == len(frames):
+                done.set()
+
+        for stream in streams:
+            hub.subscribe(stream, handler)
+        while sum(len(client.streams) for client in server.clients) < len(streams):
+            time.sleep(0.01)
+        threads = len(set(threading.enumerate()) - before) - len(server.clients)
+
+        started = time.perf_counter()
+        cpu = time.process_time()
+        for stream, frame in frames:
+            server.publish_raw(stream, frame)
+        done.wait(60)
+        elapsed = time.perf_counter() - started
+        cpu = (time.process_time() - cpu) / len(received) * 1e6
+
+        hub.close()
+        if runtime:
+            runtime.stop()
+        while server.clients:
+            time.sleep(0.01)
+        print(
+            f"{name:<28}{len(streams):>12}{len(received) / elapsed:>10,.0f}"
+            f"{cpu:>10.1f}{threads:>9}"
+        )
+    server.close()
+
+
+def bench_chart(args):
+    """Full redraw, append and live-candle update against candle count."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from chart import CandleChart
+
+    print(
+        f"\n{'chart redraw (ms)':<28}{'candles':>12}{'full':>10}{'append':>10}"
+        f"{'live':>12}{'viewport':>10}"
+    )
+    for count in args.candles:
+        candles = np.zeros(count + 1, dtype=CANDLE_DTYPE)
+        candles["open_time"] = np.arange(count + 1) * 60_000 + 1_700_000_000_000
+        candles["close_time"] = candles["open_time"] + 59_999
+        candles["open"] = 60000 + np.cumsum(np.random.randn(count + 1))
+        candles["close"] = candles["open"] + np.random.randn(count + 1)
+        candles["high"] = np.maximum(candles["open"], candles["close"]) + 1
+        candles["low"] = np.minimum(candles["open"], candles["close"]) - 1
+        candles["volume"] = np.random.rand(count + 1) * 10
+
+        fig = Figure(figsize=(6, 4), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        chart = CandleChart(fig, canvas, "BTC")
+
+        t0 = time.perf_counter()
+        chart.render(candles[:count], full=True)
+        canvas.draw()
+        full = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        chart.render(candles)
+        canvas.draw()
+        append = time.perf_counter() - t0
+
+        live = []
+        for _ in range(50):
+            candles["close"][-1] += 0.01
+            t0 = time.perf_counter()
+            chart.render(candles)
+            live.append(time.perf_counter() - t0)
+
+        # Bucketed to the axes width, as KlineGraph draws long histories.
+        fig = Figure(figsize=(6, 4), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        chart = CandleChart(fig, canvas, "BTC")
+        t0 = time.perf_counter()
+        chart.render(candles, full=True, pixels=int(chart.ax_price.bbox.width))
+        canvas.draw()
+        viewport = time.perf_counter() - t0
+
+        print(
+            f"{'':<28}{count:>12,}{full * 1000:>10.1f}{append * 1000:>10.1f}"
+            f"{percentile(live, 50) * 1000:>12.2f}{viewport * 1000:>10.1f}"
+        )
+
+
+BENCHES = [
+    "decode",
+    "book",
+    "dispatch",
+    "chart",
+    "depth",
+    "pipeline",
+    "alerts",
+    "runtime",
+    "bars",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--candles", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rules", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--levels", type=int, nargs="+", default=[20, 200, 1000])
+    parser.add_argument("--streams", type=int, default=300)
+    parser.add_argument("--trades", type=int, default=1_000_000)
+    parser.add_argument("--log", help="recorded frames from main.py --record")
+    parser.add_argument(
+        "--only", nargs="+", choices=BENCHES,
+    )
+    args = parser.parse_args()
+    selected = set(args.only or BENCHES)
+    random.seed(1)
+    np.random.seed(1)
+    # Candles closed during the bench must not land in the real cache.
+    store.root = tempfile.mkdtemp(prefix="bench-candles-")
+
+    root = None
+    if "dispatch" in selected:
+        import tkinter as tk
+
+        try:
+            root = tk.Tk()
+            root.withdraw()
+        except tk.TclError:
+            root = None
+
+    if "decode" in selected:
+        bench_decode(args)
+    if "book" in selected:
+        bench_book(args)
+    if "dispatch" in selected:
+        bench_dispatch(args, root)
+    if "chart" in selected:
+        bench_chart(args)
+    if "depth" in selected:
+        bench_depth(args)
+    if "pipeline" in selected:
+        bench_pipeline(args)
+    if "alerts" in selected:
+        bench_alerts(args)
+    if "runtime" in selected:
+        bench_runtime(args)
+    if "bars" in selected:
+        bench_bars(args)
+
+    if root is not None:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main()
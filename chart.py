@@ -0,0 +1,470 @@
+"""Matplotlib candle chart. Imported on demand so the window opens without it."""
+
+import datetime
+
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.lines import Line2D
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from lib import IndicatorEngine, aggregate
+
+
+BG_COLOR = "#F5F7FA"
+GRID_COLOR = "#E1E5EB"
+TEXT_COLOR = "#2C2F36"
+
+UP_COLOR = "#2DA44E"
+DOWN_COLOR = "#D73A49"
+VOLUME_UP_COLOR = "#9AD6B4"
+VOLUME_DOWN_COLOR = "#F1A7A7"
+LINE_COLORS = ["#0969DA", "#8250DF", "#BF8700", "#1A7F37", "#1B7C83", "#CF222E", "#57606A"]
+
+
+class CandleChart:
+    """Candles and volume drawn by a fixed set of artists mutated in place."""
+
+    def __init__(self, fig, canvas, title, indicators=()) -> None:
+        self.fig = fig
+        self.canvas = canvas
+        self.engine = IndicatorEngine(indicators)
+
+        panels = []
+        for indicator in indicators:
+            if indicator.panel != "price" and indicator.panel not in panels:
+                panels.append(indicator.panel)
+        ratios = [3, 1] + [1] * len(panels) if panels else [1, 1]
+        grid = fig.add_gridspec(len(ratios), 1, height_ratios=ratios)
+
+        self.ax_price = fig.add_subplot(grid[0])
+        self.ax_vol = fig.add_subplot(grid[1], sharex=self.ax_price)
+        self.panel_axes = {"price": self.ax_price}
+        for row, panel in enumerate(panels, start=2):
+            self.panel_axes[panel] = fig.add_subplot(grid[row], sharex=self.ax_price)
+        self.axes = [self.ax_price, self.ax_vol] + list(self.panel_axes.values())[1:]
+        self.style(title)
+
+        self.bodies = PolyCollection([], linewidths=0)
+        self.wicks = LineCollection([], linewidths=1)
+        self.volume = PolyCollection([], linewidths=0)
+        self.live_body = PolyCollection([], linewidths=0, animated=True)
+        self.live_wick = LineCollection([], linewidths=1, animated=True)
+        self.live_volume = PolyCollection([], linewidths=0, animated=True)
+
+        for artist in [self.bodies, self.wicks, self.live_body, self.live_wick]:
+            self.ax_price.add_collection(artist)
+        for artist in [self.volume, self.live_volume]:
+            self.ax_vol.add_collection(artist)
+        self.live_artists = [self.live_body, self.live_wick, self.live_volume]
+
+        self.lines = []
+        self.outputs = [indicator for indicator, _, _ in self.engine.series(0)]
+        for i, (indicator, name, _) in enumerate(self.engine.series(0)):
+            ax = self.panel_axes[indicator.panel]
+            color = LINE_COLORS[i % len(LINE_COLORS)]
+            line = Line2D([], [], linewidth=1, color=color, label=name)
+            live = Line2D([], [], linewidth=1, color=color, animated=True)
+            ax.add_line(line)
+            ax.add_line(live)
+            self.lines.append((line, live))
+            self.live_artists.append(live)
+        if self.lines:
+            self.ax_price.legend(loc="upper left", fontsize=7)
+        if "RSI" in self.panel_axes:
+            self.panel_axes["RSI"].set_ylim(0, 100)
+            for level in (30, 70):
+                self.panel_axes["RSI"].axhline(level, color=GRID_COLOR, linewidth=1)
+
+        self.count = 0
+        self.window = None
+        self.width = 0.8
+        # Tick, volume and dollar bars are spaced by index, not open time.
+        self.by_index = False
+        self.times = None
+        self.body_verts = np.empty((0, 4, 2))
+        self.wick_segments = np.empty((0, 2, 2))
+        self.volume_verts = np.empty((0, 4, 2))
+        self.body_colors = np.empty((0, 4))
+        self.volume_colors = np.empty((0, 4))
+        self.values = np.empty((0, len(self.outputs)))
+
+        self.status = self.ax_price.text(
+            0.5,
+            0.5,
+            "Loading...",
+            transform=self.ax_price.transAxes,
+            ha="center",
+            va="center",
+            color=TEXT_COLOR,
+        )
+
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def style(self, title):
+        self.fig.set_facecolor(BG_COLOR)
+
+        for ax in self.axes:
+            ax.set_facecolor(BG_COLOR)
+
+            for spine in ax.spines.values():
+                spine.set_color(TEXT_COLOR)
+
+            ax.tick_params(axis="x", colors=TEXT_COLOR)
+            ax.tick_params(axis="y", colors=TEXT_COLOR)
+            ax.yaxis.label.set_color(TEXT_COLOR)
+
+            ax.grid(True, color=GRID_COLOR, linestyle="--", alpha=0.6)
+
+        bottom = self.axes[-1]
+        self.date_axis()
+        bottom.tick_params(axis="x", labelrotation=15, labelsize=10)
+
+        self.ax_price.set_title(f"{title} Candlestick + Volume", color=TEXT_COLOR)
+        for ax in self.axes[:-1]:
+            ax.tick_params(labelbottom=False)
+        for panel, ax in list(self.panel_axes.items())[1:]:
+            ax.set_ylabel(panel, fontsize=8)
+
+    def date_axis(self):
+        locator = mdates.AutoDateLocator(maxticks=7)
+        # Sub-minute bars span a few minutes, more than 7 ticks at 30s.
+        locator.intervald[mdates.SECONDLY] = [1, 5, 10, 15, 30, 60]
+        self.axes[-1].xaxis.set_major_locator(locator)
+        self.axes[-1].xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+    def index_axis(self, enabled):
+        """Space candles evenly, labelled with their open time, or go back to dates."""
+        if enabled == self.by_index:
+            return
+        self.by_index = enabled
+        self.count = 0
+        if enabled:
+            self.axes[-1].xaxis.set_major_locator(MaxNLocator(7, integer=True))
+            self.axes[-1].xaxis.set_major_formatter(FuncFormatter(self.index_label))
+        else:
+            self.date_axis()
+
+    def index_label(self, x, pos=None):
+        i = int(round(x))
+        if self.times is None or not 0 <= i < len(self.times):
+            return ""
+        opened = datetime.datetime.fromtimestamp(self.times[i] / 1000)
+        return opened.strftime("%H:%M:%S")
+
+    def set_status(self, text):
+        """Show a centred message over the chart, or hide it with ''."""
+        self.status.set_text(text)
+        self.status.set_visible(bool(text))
+        self.canvas.draw_idle()
+
+    def positions(self, candles, index, step):
+        """x of each candle: its open date, or on an index axis the position
+        of its first candle in the whole series."""
+        if self.by_index:
+            return index + step * np.arange(len(candles), dtype=float)
+        return mdates.date2num(candles["open_time"].astype("datetime64[ms]"))
+
+    def shapes(self, candles, x, start):
+        """Vertices and colors for candles[start:], built with NumPy."""
+        x = x[start:]
+        open_ = candles["open"][start:]
+        close = candles["close"][start:]
+        half = self.width / 2
+        left, right = x - half, x + half
+
+        body = np.empty((len(x), 4, 2))
+        body[:, :, 0] = np.column_stack([left, left, right, right])
+        body[:, :, 1] = np.column_stack([open_, close, close, open_])
+
+        wick = np.empty((len(x), 2, 2))
+        wick[:, :, 0] = x[:, None]
+        wick[:, 0, 1] = candles["low"][start:]
+        wick[:, 1, 1] = candles["high"][start:]
+
+        volume = body.copy()
+        volume[:, :, 1] = 0
+        volume[:, 1:3, 1] = candles["volume"][start:, None]
+
+        up = (close >= open_)[:, None]
+        body_colors = np.where(up, to_rgba(UP_COLOR), to_rgba(DOWN_COLOR))
+        volume_colors = np.where(
+            up, to_rgba(VOLUME_UP_COLOR), to_rgba(VOLUME_DOWN_COLOR)
+        )
+        return body, wick, volume, body_colors, volume_colors
+
+    def buckets(self, candles, start, stop, step):
+        """candles[start:stop] merged `step` at a time, with the index of the
+        last candle in each bucket."""
+        if step == 1:
+            return candles[start:stop], np.arange(start, stop)
+        starts = np.arange(0, stop - start, step)
+        ends = np.r_[starts[1:], stop - start] - 1 + start
+        return aggregate(candles[start:stop], starts), ends
+
+    def render(self, candles, full=False, window=None, pixels=None):
+        """Show candles[start:stop], touching only what changed since the last call.
+
+        Indicators run over all of `candles` but only the `window` slice is
+        drawn. When it holds more candles than `pixels`, neighbouring candles
+        are merged into OHLC buckets, so drawing cost follows the screen
+        width rather than the length of the history.
+
+        Without `full` the caller promises earlier candles are unchanged, so
+        a same-length view only redraws the live candle and a longer one
+        only appends the newly closed candles.
+        """
+        total = len(candles["open_time"])
+        if total == 0:
+            return
+        self.engine.update(candles, full=full)
+
+        start, stop = window or (0, total)
+        step = max(1, -(-(stop - start) // pixels)) if pixels else 1
+        # Bucket edges stay on fixed indices, so panning only shifts them.
+        start -= start % step
+        count = -(-(stop - start) // step)
+
+        window = (start, step, candles["open_time"][start])
+        rebuild = full or self.count == 0 or count < self.count or window != self.window
+        self.window = window
+
+        first = 0 if rebuild else self.count - 1
+        view, ends = self.buckets(candles, start + first * step, stop, step)
+        values = self.engine.values[ends]
+        x = self.positions(view, start + first * step, step)
+        self.times = candles["open_time"]
+
+        if rebuild:
+            if self.by_index:
+                self.width = step * 0.8
+            elif count > 1:
+                spacing = np.diff(view["open_time"][:2])[0] / 86_400_000
+                self.width = spacing * 0.8
+            shapes = self.shapes(view, x, 0)
+            self.body_verts, self.wick_segments, self.volume_verts = shapes[:3]
+            self.body_colors, self.volume_colors = shapes[3:]
+            self.values = values
+        elif count > self.count:
+            shapes = self.shapes(view, x, 0)
+            self.body_verts = np.concatenate([self.body_verts[:-1], shapes[0]])
+            self.wick_segments = np.concatenate([self.wick_segments[:-1], shapes[1]])
+            self.volume_verts = np.concatenate([self.volume_verts[:-1], shapes[2]])
+            self.body_colors = np.concatenate([self.body_colors[:-1], shapes[3]])
+            self.volume_colors = np.concatenate([self.volume_colors[:-1], shapes[4]])
+            self.values = np.concatenate([self.values[:-1], values])
+        else:
+            self.values[-1] = values[-1]
+            self.update_live(view, x)
+            return
+
+        self.count = count
+        self.status.set_visible(False)
+        self.bodies.set_verts(self.body_verts[:-1])
+        self.bodies.set_facecolor(self.body_colors[:-1])
+        self.wicks.set_segments(self.wick_segments[:-1])
+        self.wicks.set_color(self.body_colors[:-1])
+        self.volume.set_verts(self.volume_verts[:-1])
+        self.volume.set_facecolor(self.volume_colors[:-1])
+        self.set_live(self.shapes(view, x, len(view) - 1))
+
+        x = self.wick_segments[:, 0, 0]
+        for column, (line, _) in enumerate(self.lines):
+            line.set_data(x[:-1], self.values[:-1, column])
+
+        self.rescale()
+        self.canvas.draw_idle()
+
+    def set_live(self, shapes):
+        body, wick, volume, body_colors, volume_colors = shapes
+        self.body_verts[-1:] = body
+        self.wick_segments[-1:] = wick
+        self.volume_verts[-1:] = volume
+        self.live_body.set_verts(body)
+        self.live_body.set_facecolor(body_colors)
+        self.live_wick.set_segments(wick)
+        self.live_wick.set_color(body_colors)
+        self.live_volume.set_verts(volume)
+        self.live_volume.set_facecolor(volume_colors)
+
+        x = self.wick_segments[-2:, 0, 0]
+        for column, (_, live) in enumerate(self.lines):
+            live.set_data(x, self.values[-2:, column])
+
+    def update_live(self, view, x):
+        """Redraw just the live candle by blitting over the cached background."""
+        self.set_live(self.shapes(view, x, len(view) - 1))
+
+        low, high = self.ax_price.get_ylim()
+        top = self.ax_vol.get_ylim()[1]
+        fits = (
+            low <= view["low"][-1]
+            and view["high"][-1] <= high
+            and view["volume"][-1] <= top
+        )
+        for column, (indicator, (_, live)) in enumerate(zip(self.outputs, self.lines)):
+            low, high = live.axes.get_ylim()
+            value = self.values[-1, column]
+            # NaN (an indicator still warming up) draws nothing, so it fits.
+            if indicator.panel != "RSI" and not np.isnan(value) and not low <= value <= high:
+                fits = False
+        if not fits or self.background is None:
+            self.rescale()
+            self.canvas.draw_idle()
+            return
+
+        self.canvas.restore_region(self.background)
+        for artist in self.live_artists:
+            artist.axes.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+
+    def rescale(self):
+        """Fit every axis to the drawn window."""
+        low = self.wick_segments[:, 0, 1].min()
+        high = self.wick_segments[:, 1, 1].max()
+        margin = (high - low) * 0.05 or high * 0.01
+        self.ax_price.set_ylim(low - margin, high + margin)
+        self.ax_vol.set_ylim(0, self.volume_verts[:, 1, 1].max() * 1.1 or 1)
+
+        x = self.wick_segments[:, 0, 0]
+        self.ax_price.set_xlim(x[0] - self.width, x[-1] + self.width)
+
+        for panel, ax in self.panel_axes.items():
+            if panel in ("price", "RSI"):
+                continue
+            columns = [i for i, indicator in enumerate(self.outputs) if indicator.panel == panel]
+            values = self.values[:, columns]
+            if np.isnan(values).all():
+                continue
+            low, high = np.nanmin(values), np.nanmax(values)
+            margin = (high - low) * 0.05 or 1
+            ax.set_ylim(low - margin, high + margin)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.live_artists:
+            artist.axes.draw_artist(artist)
+
+
+class DepthChart:
+    """Cumulative depth curves over a liquidity heatmap, blitted per update.
+
+    The price axis of both panels follows the heatmap's bucket range, so a
+    normal update only changes animated artists: the curves, their fills
+    and the heatmap image. The axes are redrawn when the heatmap re-centres
+    or the depth outgrows its y range.
+    """
+
+    def __init__(self, fig, canvas, title, heatmap) -> None:
+        self.fig = fig
+        self.canvas = canvas
+        self.heatmap = heatmap
+
+        grid = fig.add_gridspec(2, 1, height_ratios=[1, 1])
+        self.ax_depth = fig.add_subplot(grid[0])
+        self.ax_heat = fig.add_subplot(grid[1])
+        self.axes = [self.ax_depth, self.ax_heat]
+
+        fig.set_facecolor(BG_COLOR)
+        for ax in self.axes:
+            ax.set_facecolor(BG_COLOR)
+            for spine in ax.spines.values():
+                spine.set_color(TEXT_COLOR)
+            ax.tick_params(colors=TEXT_COLOR, labelsize=8)
+        self.ax_depth.grid(True, color=GRID_COLOR, linestyle="--", alpha=0.6)
+        self.ax_depth.set_title(f"{title} Depth", color=TEXT_COLOR)
+        self.ax_depth.set_ylabel("Cumulative qty", fontsize=8, color=TEXT_COLOR)
+        self.ax_heat.set_ylabel("Price", fontsize=8, color=TEXT_COLOR)
+        self.ax_heat.set_xlabel(
+            f"Last {heatmap.columns} updates", fontsize=8, color=TEXT_COLOR
+        )
+        self.ax_heat.set_xticks([])
+
+        self.bid_line = Line2D([], [], color=UP_COLOR, linewidth=1, animated=True)
+        self.ask_line = Line2D([], [], color=DOWN_COLOR, linewidth=1, animated=True)
+        self.bid_fill = PolyCollection(
+            [], facecolors=[to_rgba(UP_COLOR, 0.25)], linewidths=0, animated=True
+        )
+        self.ask_fill = PolyCollection(
+            [], facecolors=[to_rgba(DOWN_COLOR, 0.25)], linewidths=0, animated=True
+        )
+        for artist in [self.bid_fill, self.ask_fill]:
+            self.ax_depth.add_collection(artist)
+        for artist in [self.bid_line, self.ask_line]:
+            self.ax_depth.add_line(artist)
+
+        self.image = self.ax_heat.imshow(
+            heatmap.grid,
+            aspect="auto",
+            origin="lower",
+            interpolation="nearest",
+            cmap="magma",
+            animated=True,
+        )
+        self.live_artists = [
+            self.bid_fill,
+            self.ask_fill,
+            self.bid_line,
+            self.ask_line,
+            self.image,
+        ]
+
+        self.top = 0
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    @staticmethod
+    def curve(prices, quantities):
+        """Cumulative quantity from the best level outwards, and its fill."""
+        cumulative = np.cumsum(quantities)
+        outline = np.column_stack([prices, cumulative])
+        fill = np.concatenate([[[prices[0], 0]], outline, [[prices[-1], 0]]])
+        return outline, fill
+
+    def render(self, levels):
+        """Show one book update; a blit unless an axis has to change."""
+        bid_prices, bid_quantities, ask_prices, ask_quantities = levels
+        heatmap = self.heatmap
+        if heatmap.step is None or not len(bid_prices) or not len(ask_prices):
+            return
+
+        bids, bid_fill = self.curve(bid_prices, bid_quantities)
+        asks, ask_fill = self.curve(ask_prices, ask_quantities)
+        self.bid_line.set_data(bids[:, 0], bids[:, 1])
+        self.ask_line.set_data(asks[:, 0], asks[:, 1])
+        self.bid_fill.set_verts([bid_fill])
+        self.ask_fill.set_verts([ask_fill])
+
+        # Only the depth that falls inside the price range sets the y axis.
+        shown = max(
+            bids[bids[:, 0] >= heatmap.low, 1].max(initial=0),
+            asks[asks[:, 0] <= heatmap.high, 1].max(initial=0),
+        )
+        image = np.log1p(heatmap.image())
+        self.image.set_data(image)
+        self.image.set_clim(0, image.max() or 1)
+
+        if heatmap.moved or not self.top / 2 <= shown <= self.top:
+            heatmap.moved = False
+            self.top = shown * 1.25 or 1
+            self.ax_depth.set_xlim(heatmap.low, heatmap.high)
+            self.ax_depth.set_ylim(0, self.top)
+            self.image.set_extent((0, heatmap.columns, heatmap.low, heatmap.high))
+            self.ax_heat.set_xlim(0, heatmap.columns)
+            self.ax_heat.set_ylim(heatmap.low, heatmap.high)
+            self.canvas.draw_idle()
+            return
+        if self.background is None:
+            return
+
+        self.canvas.restore_region(self.background)
+        for artist in self.live_artists:
+            artist.axes.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.live_artists:
+            artist.axes.draw_artist(artist)
@@ -1,138 +1,3888 @@
+import asyncio
+import base64
+import bisect
+import collections
+import gzip
+import hashlib
+import http.client
+import io
 import json
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import ssl
+import subprocess
+import sys
 import threading
+import urllib.parse
 from datetime import datetime, timedelta, timezone
 import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import certifi
+import numpy as np
 import requests
 import websocket
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+REST_URL = "https://api.binance.com/api/v3"
+
+
+class WeightLimiter:
+    """Token bucket over Binance request weight, corrected by response headers."""
+
+    def __init__(self, limit=6000, window=60.0, reserve=300) -> None:
+        self.capacity = limit - reserve
+        self.rate = self.capacity / window
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self, weight):
+        """Block until `weight` can be spent without crossing the limit."""
+        while True:
+            wait = self.reserve(weight)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def reserve(self, weight):
+        """Spend `weight` and return 0, or return the seconds to wait first."""
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= weight:
+                self.tokens -= weight
+                return 0
+            return (weight - self.tokens) / self.rate
+
+    def observe(self, used):
+        """Trust the exchange's own count of weight used this minute."""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens = min(self.tokens, self.capacity - used)
+
+    def back_off(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+TLS_CONTEXT = None
+
+
+def tls_context():
+    """The shared client SSLContext; the CA bundle is parsed only once."""
+    global TLS_CONTEXT
+    if TLS_CONTEXT is None:
+        TLS_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+    return TLS_CONTEXT
+
+
+class RestClient:
+    """Keep-alive session and weight limiter shared by every REST call."""
+
+    def __init__(self, base_url=REST_URL, timeout=10, retries=3, pool_size=8) -> None:
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = WeightLimiter()
+        # Set by use_event_loop, whose thread must never block on a request.
+        self.runtime = None
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params=None, weight=1):
+        if self.runtime and self.runtime.in_loop():
+            # A blocking call here would stall every socket on the loop.
+            raise RuntimeError(f"blocking REST call to {path} on the event loop")
+
+        self.limiter.acquire(weight)
+        response = self.session.get(
+            f"{self.base_url}/{path}", params=params, timeout=self.timeout
+        )
+        self.account(response.status_code, response.headers)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_async(self, path, params=None, weight=1):
+        """`get` awaited from the event loop; the session call runs on the
+        fetch pool, so it keeps its connection pool, retries and limiter."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(fetcher.pool, self.get, path, params, weight)
+
+    def account(self, status, headers):
+        """Track weight from the response headers; pause on 418/429.
+
+        Names are looked up lower-cased, which the session's headers match
+        case-insensitively.
+        """
+        used = headers.get("x-mbx-used-weight-1m")
+        if used is not None:
+            self.limiter.observe(int(used))
+
+        if status in (418, 429):
+            retry_after = int(headers.get("retry-after", 60))
+            print(f"REST rate limited ({status}), pausing {retry_after}s")
+            self.limiter.back_off(retry_after)
+
+    def klines(self, symbol, interval, limit=500, start_time=None, end_time=None):
+        params = {"symbol": symbol.upper(), "interval": interval, "limit": limit}
+        if start_time is not None:
+            params["startTime"] = start_time
+        if end_time is not None:
+            params["endTime"] = end_time
+        return self.get("klines", params, weight=2)
+
+    def agg_trades(self, symbol, limit=1000, start_time=None, end_time=None, from_id=None):
+        params = {"symbol": symbol.upper(), "limit": limit}
+        if start_time is not None:
+            params["startTime"] = start_time
+        if end_time is not None:
+            params["endTime"] = end_time
+        if from_id is not None:
+            params["fromId"] = from_id
+        return self.get("aggTrades", params, weight=4)
+
+    def depth(self, symbol, limit=1000):
+        return self.get("depth", *self.depth_request(symbol, limit))
+
+    async def depth_async(self, symbol, limit=1000):
+        return await self.get_async("depth", *self.depth_request(symbol, limit))
+
+    @staticmethod
+    def depth_request(symbol, limit):
+        if limit <= 100:
+            weight = 5
+        elif limit <= 500:
+            weight = 25
+        elif limit <= 1000:
+            weight = 50
+        else:
+            weight = 250
+        return {"symbol": symbol.upper(), "limit": limit}, weight
+
+    def exchange_info(self):
+        return self.get("exchangeInfo", weight=20)
+
+    async def exchange_info_async(self):
+        return await self.get_async("exchangeInfo", weight=20)
+
+
+rest = RestClient()
+
+
+class BackgroundFetcher:
+    """Runs REST calls on a thread pool, sharing one future per in-flight key.
+
+    Coroutine functions run as tasks on the event loop instead, once
+    use_event_loop has set `runtime`.
+    """
+
+    def __init__(self, workers=4) -> None:
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+        self.inflight = {}
+        self.runtime = None
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Start `fn` unless a call for `key` is already running."""
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                return future
+            if asyncio.iscoroutinefunction(fn):
+                future = self.runtime.spawn(fn(*args, **kwargs))
+            else:
+                future = self.pool.submit(fn, *args, **kwargs)
+            self.inflight[key] = future
+
+        future.add_done_callback(lambda done: self.forget(key, done))
+        return future
+
+    def forget(self, key, future):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+fetcher = BackgroundFetcher()
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of microsecond latencies.
+
+    Each power of two is split into 32 linear buckets, so any recorded value
+    is reported within ~3% while memory stays fixed.
+    """
+
+    SUB_BITS = 5
+
+    def __init__(self, max_micros=2**36) -> None:
+        self.max_micros = max_micros
+        self.counts = [0] * (self.index(max_micros) + 1)
+        self.total = 0
+
+    def index(self, value):
+        shift = max(value.bit_length() - self.SUB_BITS - 1, 0)
+        return (shift << self.SUB_BITS) + (value >> shift)
+
+    def value(self, index):
+        if index < 2 << self.SUB_BITS:
+            return index
+        shift = (index >> self.SUB_BITS) - 1
+        return (index - (shift << self.SUB_BITS)) << shift
+
+    def record(self, micros):
+        micros = min(max(int(micros), 0), self.max_micros)
+        self.counts[self.index(micros)] += 1
+        self.total += 1
+
+    def percentile(self, pct):
+        if not self.total:
+            return None
+        target = self.total * pct / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return self.value(index)
+        return self.max_micros
+
+
+class StreamMetrics:
+    """Counters and per-stage latency histograms for one stream."""
+
+    STAGES = ("network", "decode", "handle", "queue", "render", "total")
+
+    def __init__(self) -> None:
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.messages = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.rendered = 0
+        self.rate = 0.0
+        self.last_count = 0
+        self.last_time = time.monotonic()
+
+
+class Metrics:
+    """Stamps messages at receive, decode, dispatch and render, per stream.
+
+    Stage latencies:
+      network  exchange event time E -> frame received (includes clock skew)
+      decode   received -> JSON decoded
+      handle   decoded -> update posted to the UI queue
+      queue    posted -> picked up by the Tk main loop
+      render   time spent applying the update to the widgets
+      total    E -> update on screen
+    """
+
+    def __init__(self) -> None:
+        self.enabled = True
+        self.streams = {}
+        self.local = threading.local()
+
+    def stream(self, name):
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams.setdefault(name, StreamMetrics())
+        return stream
+
+    def received(self, name, event_time, received, decoded):
+        """Record the wire and decode stages and remember them for dispatch."""
+        stream = self.stream(name)
+        stream.messages += 1
+        if event_time:
+            stream.histograms["network"].record(received - event_time * 1000)
+        stream.histograms["decode"].record(decoded - received)
+        self.local.message = (name, event_time, decoded)
+
+    def stamp(self):
+        """Capture the message being handled on this thread as a dispatch stamp."""
+        if not self.enabled:
+            return None
+        message = getattr(self.local, "message", None)
+        if message is None:
+            return None
+        name, event_time, decoded = message
+        posted = time.time_ns() // 1000
+        self.stream(name).histograms["handle"].record(posted - decoded)
+        return name, event_time, posted
+
+    def clear(self):
+        self.local.message = None
+
+    def conflated(self, stamp):
+        if stamp:
+            self.stream(stamp[0]).conflated += 1
+
+    def dropped(self, stamp):
+        if stamp:
+            self.stream(stamp[0]).dropped += 1
+
+    def rendered(self, stamp, started, finished):
+        if not stamp:
+            return
+        name, event_time, posted = stamp
+        stream = self.stream(name)
+        stream.rendered += 1
+        stream.histograms["queue"].record(started - posted)
+        stream.histograms["render"].record(finished - started)
+        if event_time:
+            stream.histograms["total"].record(finished - event_time * 1000)
+
+    def snapshot(self):
+        """One row per stream with message rates and p50/p99 per stage (us)."""
+        now = time.monotonic()
+        rows = []
+        for name, stream in sorted(self.streams.items()):
+            elapsed = now - stream.last_time
+            if elapsed >= 0.5:
+                stream.rate = (stream.messages - stream.last_count) / elapsed
+                stream.last_count = stream.messages
+                stream.last_time = now
+
+            row = {
+                "stream": name,
+                "messages": stream.messages,
+                "rate": stream.rate,
+                "conflated": stream.conflated,
+                "dropped": stream.dropped,
+                "rendered": stream.rendered,
+            }
+            for stage, histogram in stream.histograms.items():
+                row[f"{stage}_p50"] = histogram.percentile(50)
+                row[f"{stage}_p99"] = histogram.percentile(99)
+            rows.append(row)
+        return rows
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+metrics = Metrics()
+
+
+class StartupTimer:
+    """Milliseconds from launch to each startup milestone, first time only."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        """Record `name` unless already seen; True if this was the first time."""
+        if name in self.marks:
+            return False
+        self.marks[name] = (time.perf_counter() - self.started) * 1000
+        return True
+
+    def report(self):
+        return ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.marks.items())
+
+
+startup = StartupTimer()
+
+
+class FrameRecorder:
+    """Tees raw stream frames to a log of `<epoch ms>\t<frame>` lines."""
+
+    def __init__(self, path) -> None:
+        self.path = path
+        opener = gzip.open if path.endswith(".gz") else open
+        self.file = opener(path, "at", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        with self.lock:
+            self.file.write(f"{int(time.time() * 1000)}\t{message}\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_frames(path):
+    """Yield (epoch ms, raw frame) pairs from a FrameRecorder log."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            stamp, _, frame = line.rstrip("\n").partition("\t")
+            if frame:
+                yield int(stamp), frame
+
+
+STREAM_URL = "wss://stream.binance.com:9443"
+
+
+class StreamHub:
+    """One combined-stream connection shared by every Framework.
+
+    A supervisor thread reopens the socket with jittered exponential backoff
+    whenever it drops, and a watchdog closes it when no data has arrived for
+    `stale_after` seconds or it nears Binance's 24 h connection limit.
+    Subscription changes are batched and sent at most every `frame_interval`
+    seconds, as Binance drops connections sending more than 5 frames a second.
+    Trackers registered with `watch` are told after every reconnect so they
+    can resync whatever they missed.
+    """
+
+    def __init__(
+        self,
+        base_url=STREAM_URL,
+        ping_interval=20,
+        ping_timeout=10,
+        stale_after=30,
+        max_backoff=60,
+        max_age=23.5 * 3600,
+        frame_interval=0.2,
+        autoconnect=True,
+    ) -> None:
+        self.base_url = base_url
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.stale_after = stale_after
+        self.max_backoff = max_backoff
+        self.max_age = max_age
+        self.frame_interval = frame_interval
+        # False keeps subscribe() from opening the socket, for feeding
+        # on_message by hand as the benchmarks do.
+        self.autoconnect = autoconnect
+        self.routes = {}
+        self.batches = {}
+        self.typed = frozenset()
+        self.active = set()
+        # Streams whose upstream subscription may be out of date; flush()
+        # compares them with `routes` and `active` when it next runs.
+        self.pending = set()
+        self.watchers = []
+        self.pipeline = None
+        self.lock = threading.Lock()
+        self.ws = None
+        self.supervisor = None
+        # Each connect() gets a fresh event, so close() stops exactly the
+        # threads of that generation even if a new one starts right after.
+        self.closing = threading.Event()
+        self.connected = False
+        self.connected_at = 0
+        self.opened = 0
+        self.last_message = 0
+        self.last_seen = {}
+        self.request_id = 0
+        self.recorder = None
+        # Set when base_url is a server.py fan-out server, which answers
+        # SNAPSHOT requests so trackers need no REST calls.
+        self.snapshots = False
+        self.requests = {}
+        # Rows of paged snapshots received so far, joined on the last page.
+        self.parts = {}
+
+    def subscribe(self, stream, handler, batch=None):
+        """Route `stream` to `handler`, subscribing upstream if needed.
+
+        `batch` takes typed records from a DecodePipeline instead; a stream
+        is decoded that way only when every handler on it has one.
+        """
+        with self.lock:
+            handlers = self.routes.get(stream, ())
+            self.routes[stream] = handlers + (handler,)
+            if batch:
+                self.batches[stream] = self.batches.get(stream, ()) + (batch,)
+            self.retype()
+            if not handlers:
+                self.pending.add(stream)
+
+        if self.supervisor is None and self.autoconnect:
+            self.connect()
+
+    def unsubscribe(self, stream, handler, batch=None):
+        """Remove `handler`, dropping the upstream stream once unused."""
+        with self.lock:
+            handlers = tuple(h for h in self.routes.get(stream, ()) if h != handler)
+            batches = tuple(b for b in self.batches.get(stream, ()) if b != batch)
+            self.batches[stream] = batches
+            if handlers:
+                self.routes[stream] = handlers
+                self.retype()
+                return
+            self.routes.pop(stream, None)
+            self.batches.pop(stream, None)
+            self.retype()
+            self.pending.add(stream)
+
+    def retype(self):
+        self.typed = frozenset(
+            stream
+            for stream, handlers in self.routes.items()
+            if len(self.batches.get(stream, ())) == len(handlers)
+        )
+
+    def request_snapshot(self, stream, parse=None, fallback=None):
+        """Future for the fan-out server's snapshot of `stream`.
+
+        When the server has none, `fallback()` runs on the fetch pool and
+        its already-parsed result fills the future instead.
+        """
+        with self.lock:
+            if stream in self.requests and not self.requests[stream][0].cancelled():
+                return self.requests[stream][0]
+            future = Future()
+            self.requests[stream] = (future, parse, fallback)
+            connected = self.connected
+
+        if connected:
+            self.send("SNAPSHOT", [stream])
+        return future
+
+    def record_snapshot(self, stream, snapshot):
+        """Log a REST snapshot of `stream` next to its frames, for replay.py.
+
+        Snapshots served over the stream are already in the log as frames.
+        """
+        if self.recorder:
+            self.recorder.write(json.dumps({"stream": stream, "snapshot": snapshot}))
+
+    def watch(self, callback):
+        """Call `callback()` after every reconnect."""
+        with self.lock:
+            self.watchers.append(callback)
+
+    def unwatch(self, callback):
+        with self.lock:
+            if callback in self.watchers:
+                self.watchers.remove(callback)
+
+    def connect(self):
+        """Start the supervisor that keeps the combined stream open."""
+        with self.lock:
+            if self.supervisor is not None:
+                return
+            closing = self.closing = threading.Event()
+            self.supervisor = threading.Thread(
+                target=self.supervise, args=(closing,), daemon=True
+            )
+
+        self.supervisor.start()
+        threading.Thread(target=self.watchdog, args=(closing,), daemon=True).start()
+        threading.Thread(target=self.flusher, args=(closing,), daemon=True).start()
+
+    def supervise(self, closing):
+        """Open the stream with everything registered, reopening until closed."""
+        attempt = 0
+        while not closing.is_set():
+            with self.lock:
+                if closing.is_set():
+                    break
+                ws = self.ws = websocket.WebSocketApp(
+                    self.stream_url(),
+                    on_message=self.on_message,
+                    on_error=lambda ws, err: print(f"stream error: {err}"),
+                    on_close=self.on_close,
+                    on_open=self.on_open,
+                )
+
+            ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+
+            attempt, delay = self.dropped(ws, attempt)
+            if closing.is_set():
+                break
+            print(f"stream reconnecting in {delay:.1f}s")
+            closing.wait(delay)
+
+    def stream_url(self):
+        """URL opening every registered stream at once; the lock is held."""
+        self.active = set(self.routes)
+        self.pending.clear()
+        self.parts.clear()
+        self.connected_at = 0
+        ws_url = f"{self.base_url}/stream"
+        if self.active:
+            ws_url += "?streams=" + "/".join(sorted(self.active))
+        return ws_url
+
+    def dropped(self, ws, attempt):
+        """Forget a finished connection; the next attempt number and its delay."""
+        with self.lock:
+            # A socket from an earlier generation must not mark the new one down.
+            if self.ws is ws:
+                self.ws = None
+                self.connected = False
+            lived = time.time() - self.connected_at / 1e6 if self.connected_at else 0
+            fed = self.connected_at and self.last_message > self.connected_at
+
+        # A connection that stayed up and carried data starts the backoff over.
+        attempt = 1 if fed and lived > self.stale_after else attempt + 1
+        delay = min(self.max_backoff, 2 ** (attempt - 1))
+        return attempt, delay * random.uniform(0.5, 1.0)
+
+    def watchdog(self, closing):
+        while not closing.wait(5):
+            self.check_stale()
+
+    def flusher(self, closing):
+        while not closing.wait(self.frame_interval):
+            self.flush()
+
+    def flush(self):
+        """Send one frame for the pending streams: SUBSCRIBE first, then
+        UNSUBSCRIBE on the next call.
+
+        A stream subscribed and dropped again in between needs neither.
+        """
+        with self.lock:
+            if not self.connected or not self.pending:
+                return
+            adding = sorted(
+                stream for stream in self.pending
+                if stream in self.routes and stream not in self.active
+            )
+            dropping = sorted(
+                stream for stream in self.pending
+                if stream not in self.routes and stream in self.active
+            )
+            self.pending = set(dropping) if adding else set()
+
+        if adding:
+            self.send("SUBSCRIBE", adding)
+        elif dropping:
+            self.send("UNSUBSCRIBE", dropping)
+
+    def check_stale(self):
+        """Close a socket that has gone silent or is near the 24 h limit."""
+        with self.lock:
+            ws = self.ws
+            live = self.connected and bool(self.routes)
+            connected_at = self.connected_at
+        if ws is None or not live:
+            return
+
+        now = time.time_ns() // 1000
+        silent = (now - max(self.last_message, connected_at)) / 1e6
+        if silent > self.stale_after:
+            print(f"stream silent for {silent:.0f}s, reconnecting")
+            ws.close()
+        elif (now - connected_at) / 1e6 > self.max_age:
+            print("stream near the 24h limit, reconnecting")
+            ws.close()
+
+    def later(self, delay, fn, *args):
+        """Call `fn(*args)` after `delay` seconds; cancelling the returned
+        Future first stops it."""
+        future = Future()
+
+        def fire():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except Exception as error:
+                    future.set_exception(error)
+
+        timer = threading.Timer(delay, fire)
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda done: timer.cancel())
+        return future
+
+    def close(self):
+        """Close the shared connection and stop reconnecting."""
+        with self.lock:
+            self.closing.set()
+            ws, self.ws = self.ws, None
+            self.supervisor = None
+            self.connected = False
+            self.active = set()
+        if ws:
+            ws.close()
+
+    def health(self, stream):
+        """(state, seconds since `stream` last had data) for status displays."""
+        if not self.connected:
+            return ("reconnecting" if self.supervisor else "offline"), None
+        seen = self.last_seen.get(stream)
+        if seen is None:
+            return "live", None
+        return "live", (time.time_ns() // 1000 - seen) / 1e6
+
+    def send(self, method, streams):
+        with self.lock:
+            ws = self.ws
+            self.request_id += 1
+            frame = {"method": method, "params": streams, "id": self.request_id}
+            if method == "SUBSCRIBE":
+                self.active.update(streams)
+            elif method == "UNSUBSCRIBE":
+                self.active.difference_update(streams)
+        if ws:
+            ws.send(json.dumps(frame))
+
+    def on_open(self, ws):
+        """Catch up on streams registered while the socket was opening."""
+        with self.lock:
+            # close() ran while this socket was still connecting.
+            current = ws is self.ws
+            if current:
+                self.connected = True
+                self.connected_at = time.time_ns() // 1000
+                reconnected = self.opened > 0
+                self.opened += 1
+                # Registered while the socket was opening; flush() sends them.
+                self.pending.update(set(self.routes) ^ self.active)
+                watchers = list(self.watchers)
+                requested = sorted(self.requests)
+        if not current:
+            ws.close()
+            return
+
+        print(f"stream connected ({len(self.active)} streams)")
+        if requested:
+            self.send("SNAPSHOT", requested)
+
+        if reconnected:
+            for callback in watchers:
+                callback()
+
+    def on_close(self, ws, status, message):
+        print("stream closed")
+
+    def on_message(self, ws, message):
+        """Hand each {"stream", "data"} envelope to its registered handlers."""
+        if self.recorder:
+            self.recorder.write(message)
+
+        received = time.time_ns() // 1000
+        self.last_message = received
+        if self.pipeline:
+            self.pipeline.put(message, received, self.typed)
+            return
+
+        envelope = json.loads(message)
+        stream = envelope.get("stream")
+        if stream is None or "data" not in envelope:
+            self.on_control(envelope)
+            return
+
+        data = envelope["data"]
+        self.last_seen[stream] = received
+        if metrics.enabled:
+            if isinstance(data, dict):
+                event_time = data.get("E")
+            else:
+                event_time = data[0].get("E") if data else None
+            metrics.received(stream, event_time, received, time.time_ns() // 1000)
+
+        for handler in self.routes.get(stream, ()):
+            handler(data)
+        metrics.clear()
+
+    def deliver(self, groups, controls, received):
+        """Route one batch decoded by the pipeline, stream by stream."""
+        for envelope in controls:
+            self.on_control(envelope)
+
+        decoded = time.time_ns() // 1000
+        for stream, records, event_time in groups:
+            self.last_seen[stream] = received
+            if metrics.enabled:
+                metrics.received(stream, event_time, received, decoded)
+            if isinstance(records, list):
+                for handler in self.routes.get(stream, ()):
+                    for data in records:
+                        handler(data)
+            else:
+                for handler in self.batches.get(stream, ()):
+                    handler(records)
+            metrics.clear()
+
+    def on_control(self, envelope):
+        """Envelopes without stream data: snapshots, errors and replies."""
+        if "snapshot" in envelope:
+            more = envelope.get("more", False)
+            self.on_snapshot(envelope["stream"], envelope["snapshot"], more)
+        elif "error" in envelope and envelope.get("stream") in self.requests:
+            self.on_snapshot_error(envelope["stream"], envelope["error"])
+        elif "error" in envelope:
+            print(f"stream error: {envelope['error']}")
+
+    def on_snapshot(self, stream, snapshot, more=False):
+        with self.lock:
+            if more:
+                self.parts.setdefault(stream, []).extend(snapshot)
+                return
+            if stream in self.parts:
+                snapshot = self.parts.pop(stream) + snapshot
+            future, parse, _ = self.requests.pop(stream, (None, None, None))
+        if future is None or not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(parse(snapshot) if parse else snapshot)
+        except Exception as error:
+            future.set_exception(error)
+
+    def on_snapshot_error(self, stream, error):
+        """The server has no snapshot of `stream`: fall back, or fail the future."""
+        with self.lock:
+            self.parts.pop(stream, None)
+            future, _, fallback = self.requests.pop(stream, (None, None, None))
+        if future is None or future.cancelled():
+            return
+        if fallback is None:
+            future.set_exception(ConnectionError(f"{stream} snapshot: {error}"))
+            return
+
+        def chain(fetched):
+            if not future.set_running_or_notify_cancel():
+                return
+            error = None if fetched.cancelled() else fetched.exception()
+            if fetched.cancelled() or error:
+                future.set_exception(error or ConnectionError(f"{stream} snapshot cancelled"))
+            else:
+                future.set_result(fetched.result())
+
+        fetcher.submit(("snapshot", stream), fallback).add_done_callback(chain)
+
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def ws_accept(key):
+    """The Sec-WebSocket-Accept value answering `key`."""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def ws_frame(payload, opcode=0x1):
+    """One unfragmented, unmasked frame, as a server sends them."""
+    payload = payload.encode() if isinstance(payload, str) else payload
+    return websocket.ABNF(1, 0, 0, 0, opcode, 0, payload).format()
+
+
+class StreamClient:
+    """A local WebSocket client and the streams it has subscribed to."""
+
+    def __init__(self, sock, streams) -> None:
+        self.sock = sock
+        self.streams = set(streams)
+        self.lock = threading.Lock()
+        self.open = True
+
+    def send(self, text, opcode=0x1):
+        frame = ws_frame(text, opcode)
+        with self.lock:
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.open = False
+
+    def recv_exact(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        return data
+
+    def read_frame(self):
+        """Read one client frame as (opcode, payload)."""
+        first, second = self.recv_exact(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(self.recv_exact(2), "big")
+        elif length == 127:
+            length = int.from_bytes(self.recv_exact(8), "big")
+
+        mask = self.recv_exact(4) if second & 0x80 else None
+        payload = self.recv_exact(length)
+        if mask:
+            payload = websocket.ABNF.mask(mask, payload)
+        return first & 0x0F, payload
+
+
+class LocalStreamServer:
+    """Minimal combined-stream WebSocket server that speaks Binance's protocol.
+
+    Clients connect to `/stream?streams=a/b` and may SUBSCRIBE/UNSUBSCRIBE
+    afterwards, so a StreamHub can point at it instead of the exchange.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=9443,
+        on_subscribe=None,
+        on_unsubscribe=None,
+        on_snapshot=None,
+    ) -> None:
+        self.sock = socket.create_server((host, port))
+        self.url = f"ws://{host}:{port}"
+        self.on_subscribe = on_subscribe
+        self.on_unsubscribe = on_unsubscribe
+        self.on_snapshot = on_snapshot
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.has_client = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handshake(self, conn):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                raise ConnectionError("client went away")
+            request += chunk
+
+        lines = request.decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        accept = ws_accept(headers["sec-websocket-key"])
+        conn.sendall(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+
+        _, _, query = path.partition("streams=")
+        return [stream for stream in query.split("&")[0].split("/") if stream]
+
+    def handle(self, conn):
+        client = None
+        try:
+            streams = self.handshake(conn)
+            client = StreamClient(conn, streams)
+            with self.lock:
+                self.clients.add(client)
+            self.subscribed(client, streams)
+
+            while client.open:
+                opcode, payload = client.read_frame()
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    client.send(payload, opcode=0xA)
+                elif opcode == 0x1:
+                    self.on_control(client, json.loads(payload))
+        except (OSError, ConnectionError, ValueError, KeyError, IndexError):
+            pass
+        finally:
+            if client:
+                with self.lock:
+                    self.clients.discard(client)
+                if self.on_unsubscribe and client.streams:
+                    self.on_unsubscribe(client, sorted(client.streams))
+            conn.close()
+
+    def on_control(self, client, request):
+        streams = request.get("params", [])
+        if request.get("method") == "SUBSCRIBE":
+            streams = [stream for stream in streams if stream not in client.streams]
+            client.streams.update(streams)
+            self.subscribed(client, streams)
+        elif request.get("method") == "UNSUBSCRIBE":
+            streams = [stream for stream in streams if stream in client.streams]
+            client.streams.difference_update(streams)
+            if self.on_unsubscribe and streams:
+                self.on_unsubscribe(client, streams)
+        elif request.get("method") == "SNAPSHOT" and self.on_snapshot:
+            self.on_snapshot(client, streams)
+        client.send(json.dumps({"result": None, "id": request.get("id")}))
+
+    def subscribed(self, client, streams):
+        if streams:
+            self.has_client.set()
+        if self.on_subscribe and streams:
+            self.on_subscribe(client, streams)
+
+    def publish_raw(self, stream, frame):
+        """Send an already-encoded envelope to every client on `stream`."""
+        with self.lock:
+            clients = [client for client in self.clients if stream in client.streams]
+        for client in clients:
+            client.send(frame)
+
+    def publish(self, stream, data):
+        self.publish_raw(stream, json.dumps({"stream": stream, "data": data}))
+
+    def close(self):
+        # shutdown() wakes the accept loop so the port is released at once.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        with self.lock:
+            clients, self.clients = self.clients, set()
+        for client in clients:
+            client.send(b"", opcode=0x8)
+            client.sock.close()
+
+
+class AsyncWebSocket:
+    """websocket-client's frame codec over asyncio streams.
+
+    Frames are built, validated and reassembled by websocket-client's ABNF
+    and continuous_frame, as on the threaded hub; only the bytes move over
+    asyncio. `send` and `close` may be called from any thread, like the
+    websocket-client app StreamHub otherwise holds.
+    """
+
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        # UTF-8 is checked by bytes.decode, in C, rather than per frame.
+        self.fragments = websocket.continuous_frame(False, True)
+        self.pong_at = time.monotonic()
+
+    @classmethod
+    async def connect(cls, url, timeout=10):
+        parts = urllib.parse.urlsplit(url)
+        secure = parts.scheme == "wss"
+        port = parts.port or (443 if secure else 80)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parts.hostname, port, ssl=tls_context() if secure else None
+            ),
+            timeout,
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            (
+                f"GET {target} HTTP/1.1\r\n"
+                f"Host: {parts.netloc}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            ).encode()
+        )
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+            status, _, fields = head.partition(b"\r\n")
+            status = status.decode("latin-1")
+            headers = http.client.parse_headers(io.BytesIO(fields))
+            if (
+                status.split(" ")[1:2] != ["101"]
+                or headers.get("Upgrade", "").lower() != "websocket"
+                or headers.get("Sec-WebSocket-Accept") != ws_accept(key)
+            ):
+                raise ConnectionError(f"websocket handshake failed: {status}")
+        except BaseException:
+            writer.close()
+            raise
+        return cls(reader, writer)
+
+    def send(self, text, opcode=websocket.ABNF.OPCODE_TEXT):
+        frame = websocket.ABNF.create_frame(text, opcode).format()
+        self.loop.call_soon_threadsafe(self.write, frame)
+
+    def write(self, frame):
+        if not self.writer.is_closing():
+            self.writer.write(frame)
+
+    def ping(self):
+        """Send a ping; `pong_at` moves on when the answer arrives."""
+        self.write(websocket.ABNF.create_frame(b"", websocket.ABNF.OPCODE_PING).format())
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.abort)
+
+    def abort(self):
+        """Send a close frame and drop the connection; on the loop thread."""
+        self.write(websocket.ABNF.create_frame(b"", websocket.ABNF.OPCODE_CLOSE).format())
+        self.writer.close()
+
+    async def read_frame(self):
+        """The next frame off the wire, checked by ABNF.validate."""
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(await self.reader.readexactly(2), "big")
+        elif length == 127:
+            length = int.from_bytes(await self.reader.readexactly(8), "big")
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask:
+            payload = websocket.ABNF.mask(mask, payload)
+
+        frame = websocket.ABNF(
+            first >> 7 & 1,
+            first >> 6 & 1,
+            first >> 5 & 1,
+            first >> 4 & 1,
+            first & 0x0F,
+            int(mask is not None),
+            payload,
+        )
+        frame.validate(skip_utf8_validation=True)
+        return frame
+
+    async def recv(self):
+        """The next text message, answering pings and noting pongs on the way."""
+        ABNF = websocket.ABNF
+        while True:
+            frame = await self.read_frame()
+            if frame.opcode == ABNF.OPCODE_PING:
+                self.write(ABNF.create_frame(frame.data, ABNF.OPCODE_PONG).format())
+            elif frame.opcode == ABNF.OPCODE_PONG:
+                self.pong_at = time.monotonic()
+            elif frame.opcode == ABNF.OPCODE_CLOSE:
+                raise ConnectionError("stream closed by server")
+            else:
+                self.fragments.validate(frame)
+                self.fragments.add(frame)
+                if self.fragments.is_fire(frame):
+                    _, frame = self.fragments.extract(frame)
+                    return frame.data.decode()
+
+
+class EventLoop:
+    """One asyncio loop on one daemon thread for every socket, fetch and timer.
+
+    Tasks started with `spawn` are tracked, so `stop` can cancel them all
+    and wait for their cleanup before the loop goes away.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.tasks = set()
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="event-loop", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self):
+        return threading.current_thread() is self.thread
+
+    def spawn(self, coroutine):
+        """Run `coroutine` as a task; the returned Future cancels it from any thread.
+
+        Raises RuntimeError once `stop` has begun, as nothing would run it.
+        """
+        with self.lock:
+            if self.stopped:
+                coroutine.close()
+                raise RuntimeError("event loop stopped")
+            return asyncio.run_coroutine_threadsafe(self.track(coroutine), self.loop)
+
+    async def track(self, coroutine):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await coroutine
+        finally:
+            self.tasks.discard(task)
+
+    def call_later(self, delay, fn, *args):
+        """Call `fn(*args)` on the loop after `delay` seconds, as a cancellable task."""
+        return self.spawn(self.delayed(delay, fn, args))
+
+    @staticmethod
+    async def delayed(delay, fn, args):
+        await asyncio.sleep(delay)
+        return fn(*args)
+
+    def stop(self, timeout=5):
+        """Cancel every task, wait for them to unwind, then end the thread."""
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+
+        async def cancel_all():
+            tasks = list(self.tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        future = asyncio.run_coroutine_threadsafe(cancel_all(), self.loop)
+        if not wait([future], timeout).done:
+            print("event loop tasks did not stop in time")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class AsyncStreamHub(StreamHub):
+    """A StreamHub whose socket, pings, watchdog and backoff are tasks on an
+    EventLoop rather than threads; routing and resync are unchanged.
+
+    Handlers run on the loop thread and must not block it.
+    """
+
+    def __init__(self, runtime, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.runtime = runtime
+        self.watchdog_task = None
+        self.flusher_task = None
+
+    def connect(self):
+        with self.lock:
+            if self.supervisor is not None:
+                return
+            closing = self.closing = threading.Event()
+            self.supervisor = self.runtime.spawn(self.supervise(closing))
+            self.watchdog_task = self.runtime.spawn(self.watchdog(closing))
+            self.flusher_task = self.runtime.spawn(self.flusher(closing))
+
+    async def supervise(self, closing):
+        attempt = 0
+        while not closing.is_set():
+            with self.lock:
+                ws_url = self.stream_url()
+
+            ws = None
+            try:
+                ws = await AsyncWebSocket.connect(ws_url)
+                with self.lock:
+                    self.ws = ws
+                self.on_open(ws)
+                pinger = asyncio.ensure_future(self.ping(ws))
+                try:
+                    while True:
+                        message = await ws.recv()
+                        try:
+                            self.on_message(ws, message)
+                        except Exception as error:
+                            print(f"stream handler error: {error!r}")
+                finally:
+                    pinger.cancel()
+            except Exception as error:
+                # Anything else would end the task and the stream for good.
+                if not closing.is_set():
+                    print(f"stream error: {error!r}")
+            finally:
+                if ws is not None:
+                    ws.abort()
+                    self.on_close(ws, None, None)
+
+            attempt, delay = self.dropped(ws, attempt)
+            if closing.is_set():
+                break
+            print(f"stream reconnecting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def ping(self, ws):
+        """Ping every `ping_interval`; drop a socket whose pong is more than
+        `ping_timeout` late, as a half-open one may never error."""
+        while True:
+            await asyncio.sleep(max(self.ping_interval - self.ping_timeout, 0))
+            sent = time.monotonic()
+            ws.ping()
+            await asyncio.sleep(self.ping_timeout)
+            if ws.pong_at < sent:
+                print(f"stream pong overdue after {self.ping_timeout}s, reconnecting")
+                ws.abort()
+                return
+
+    async def watchdog(self, closing):
+        while not closing.is_set():
+            await asyncio.sleep(5)
+            self.check_stale()
+
+    async def flusher(self, closing):
+        while not closing.is_set():
+            await asyncio.sleep(self.frame_interval)
+            self.flush()
+
+    def later(self, delay, fn, *args):
+        return self.runtime.call_later(delay, fn, *args)
+
+    def close(self):
+        with self.lock:
+            tasks = [self.supervisor, self.watchdog_task, self.flusher_task]
+            self.watchdog_task = self.flusher_task = None
+        super().close()
+        for task in tasks:
+            if task is not None:
+                task.cancel()
+
+
+def use_event_loop(**hub_options):
+    """Move the stream hub, REST calls and retry timers onto one asyncio loop.
+
+    Call before any tracker starts. Returns the EventLoop to stop on exit.
+    """
+    runtime = EventLoop()
+    Framework.hub = AsyncStreamHub(runtime, **hub_options)
+    rest.runtime = runtime
+    fetcher.runtime = runtime
+    return runtime
+
+
+class UpdateQueue:
+    """Bounded queue that keeps only the latest payload per key."""
+
+    def __init__(self, max_keys=256) -> None:
+        self.max_keys = max_keys
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.posted = 0
+        self.conflated = 0
+        self.dropped = 0
+
+    def post(self, key, handler, payload):
+        """Queue `handler(payload)`, replacing anything pending for `key`."""
+        stamp = metrics.stamp()
+        with self.lock:
+            self.posted += 1
+            if key in self.pending:
+                self.conflated += 1
+                previous = self.pending[key][1]
+                metrics.conflated(self.pending[key][2])
+                # A skipped full redraw must not become an incremental one.
+                if (
+                    isinstance(payload, dict)
+                    and isinstance(previous, dict)
+                    and previous.get("full")
+                    and payload.get("full") is False
+                ):
+                    payload = {**payload, "full": True}
+            elif len(self.pending) >= self.max_keys:
+                self.dropped += 1
+                metrics.dropped(stamp)
+                return False
+            self.pending[key] = (handler, payload, stamp)
+        return True
+
+    def drain(self):
+        """Take every pending (handler, payload, stamp), oldest key first."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return list(pending.values())
+
+    def stats(self):
+        return {
+            "posted": self.posted,
+            "conflated": self.conflated,
+            "dropped": self.dropped,
+            "pending": len(self.pending),
+        }
+
+
+class Framework:
+    hub = StreamHub()
+
+    def __init__(self, symbol, typeOf, callback=None) -> None:
+        self.symbol = symbol
+        self.typeOf = typeOf
+        self.callback = callback
+        self.is_active = False
+        self.information = None
+        # Fetches and retry timers in flight; stop() cancels them.
+        self.pending = set()
+
+    @property
+    def stream(self):
+        return f"{self.symbol}@{self.typeOf}"
+
+    def start(self):
+        """Subscribe to the stream on the shared hub."""
+        if self.is_active:
+            return
+
+        self.is_active = True
+        self.hub.watch(self.on_reconnect)
+        self.hub.subscribe(self.stream, self.on_message, self.on_records)
+
+    def stop(self):
+        """Unsubscribe from the stream."""
+        if not self.is_active:
+            return
+
+        self.is_active = False
+        self.hub.unwatch(self.on_reconnect)
+        self.hub.unsubscribe(self.stream, self.on_message, self.on_records)
+        for future in list(self.pending):
+            future.cancel()
+
+    def track(self, future):
+        """Keep `future` until it is done, so stop() can cancel it."""
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def later(self, delay, fn, *args):
+        """Retry `fn(*args)` after `delay` seconds unless stopped first."""
+        if self.is_active:
+            self.track(self.hub.later(delay, fn, *args))
+
+    def on_message(self, data):
+        pass
+
+    # Trackers that can take a batch of typed records from a DecodePipeline
+    # override this with a method.
+    on_records = None
+
+    def on_reconnect(self):
+        """Resync anything missed while the stream was down."""
+
+    def health(self):
+        return self.hub.health(self.stream)
+
+
+class TickerTracker(Framework):
+    def on_message(self, data):
+        """Handle price updates."""
+        if not self.is_active:
+            return
+
+        self.publish(float(data["c"]), float(data["p"]), float(data["P"]))
+
+    def on_records(self, records):
+        """Only the newest of a batch of TICKER_DTYPE records matters."""
+        if not self.is_active:
+            return
+
+        _, price, change, percent = records[-1].tolist()
+        self.publish(price, change, percent)
+
+    def publish(self, price, change, percent):
+        self.information = {
+            "symbol": self.symbol,
+            "price": price,
+            "change": change,
+            "percent": percent,
+        }
+
+        if self.callback:
+            self.callback(self.information)
+
+
+class MarketTable:
+    """Latest 24h mini ticker of every symbol, one NumPy column per field.
+
+    Rows are assigned on first sight and never move, so a row index stays a
+    valid handle for a symbol; `version` increases with every update.
+    """
+
+    FIELDS = ["price", "open", "high", "low", "volume", "quote_volume"]
+
+    def __init__(self, capacity=4096) -> None:
+        self.symbols = []
+        self.index = {}
+        self.columns = {name: np.zeros(capacity) for name in self.FIELDS + ["percent"]}
+        self.updated = np.zeros(capacity, dtype=np.int64)
+        self.tradable = None
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol):
+        row = len(self.symbols)
+        if row == len(self.updated):
+            for name, column in self.columns.items():
+                self.columns[name] = np.concatenate([column, np.zeros(len(column))])
+            self.updated = np.concatenate([self.updated, np.zeros_like(self.updated)])
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        return row
+
+    def update(self, tickers):
+        """Apply a batch of miniTicker (or ticker) events in one vectorized write."""
+        rows = []
+        values = []
+        with self.lock:
+            for ticker in tickers:
+                symbol = ticker["s"]
+                row = self.index.get(symbol)
+                if row is None:
+                    row = self.add(symbol)
+                rows.append(row)
+                values.append(
+                    (ticker["c"], ticker["o"], ticker["h"], ticker["l"], ticker["v"], ticker["q"])
+                )
+                self.updated[row] = ticker["E"]
+            if not rows:
+                return
+
+            rows = np.array(rows)
+            values = np.array(values, dtype=float)
+            for i, name in enumerate(self.FIELDS):
+                self.columns[name][rows] = values[:, i]
+            open_ = values[:, 1]
+            percent = np.zeros(len(rows))
+            np.divide(values[:, 0] - open_, open_, out=percent, where=open_ > 0)
+            self.columns["percent"][rows] = percent * 100
+            self.version += 1
+
+    def restrict(self, symbols):
+        """Only list `symbols` from now on, e.g. the TRADING pairs."""
+        with self.lock:
+            self.tradable = set(symbols)
+            self.version += 1
+
+    def order(self, key="quote_volume", descending=True, text=""):
+        """Row indices sorted by `key`, keeping symbols that contain `text`."""
+        text = text.strip().upper()
+        with self.lock:
+            rows = np.array(
+                [
+                    row
+                    for row, symbol in enumerate(self.symbols)
+                    if text in symbol
+                    and (self.tradable is None or symbol in self.tradable)
+                ],
+                dtype=int,
+            )
+            if key == "symbol":
+                rows = np.array(sorted(rows, key=self.symbols.__getitem__), dtype=int)
+            else:
+                rows = rows[np.argsort(self.columns[key][rows], kind="stable")]
+        return rows[::-1] if descending else rows
+
+    def rows(self, rows):
+        """(symbol, price, percent, quote volume) for each row index."""
+        with self.lock:
+            return [
+                (
+                    self.symbols[row],
+                    self.columns["price"][row],
+                    self.columns["percent"][row],
+                    self.columns["quote_volume"][row],
+                )
+                for row in rows
+            ]
+
+    def row(self, symbol):
+        """Latest values for `symbol` shaped like TickerTracker information."""
+        with self.lock:
+            row = self.index.get(symbol.upper())
+            if row is None:
+                return None
+            price = self.columns["price"][row]
+            return {
+                "symbol": symbol,
+                "price": price,
+                "change": price - self.columns["open"][row],
+                "percent": self.columns["percent"][row],
+            }
+
+
+class MarketTracker(Framework):
+    """Every symbol's mini ticker from one all-market stream."""
+
+    def __init__(self, typeOf="!miniTicker@arr", callback=None, quote=None) -> None:
+        super().__init__(None, typeOf, callback)
+        self.quote = quote
+        self.table = MarketTable()
+
+    @property
+    def stream(self):
+        return self.typeOf
+
+    def start(self):
+        """Subscribe, and fetch the TRADING symbols in the background."""
+        if self.is_active:
+            return
+
+        super().start()
+        if self.table.tradable is None:
+            fetch = rest.exchange_info_async if fetcher.runtime else rest.exchange_info
+            future = fetcher.submit(("exchange_info",), fetch)
+            self.track(future).add_done_callback(self.load_symbols)
+
+    def load_symbols(self, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error:
+            if error:
+                print(f"exchange info error: {error}")
+            return
+
+        self.table.restrict(
+            info["symbol"]
+            for info in future.result()["symbols"]
+            if info["status"] == "TRADING"
+            and (self.quote is None or info["quoteAsset"] == self.quote)
+        )
+
+    def on_message(self, data):
+        if not self.is_active:
+            return
+
+        self.table.update(data)
+        if self.callback:
+            self.callback(self.table)
+
+
+TRADE_DTYPE = np.dtype(
+    [("price", "<f8"), ("qty", "<f8"), ("time", "<i8"), ("buyer_maker", "?")]
+)
+
+
+class RollingWindow:
+    """Running trade statistics over the last `seconds` of a TradeTape."""
+
+    def __init__(self, seconds) -> None:
+        self.seconds = seconds
+        self.span_ms = int(seconds * 1000)
+        self.start = 0
+        self.count = 0
+        self.volume = 0.0
+        self.notional = 0.0
+        self.buy_volume = 0.0
+        self.sell_volume = 0.0
+        # Sequence numbers with decreasing qty; the front is the largest trade.
+        self.largest = collections.deque()
+
+    def add(self, seq, price, qty, buyer_maker, tape):
+        self.count += 1
+        self.volume += qty
+        self.notional += price * qty
+        if buyer_maker:
+            self.sell_volume += qty
+        else:
+            self.buy_volume += qty
+
+        while self.largest and tape.qty[self.largest[-1] % tape.capacity] <= qty:
+            self.largest.pop()
+        self.largest.append(seq)
+
+    def expire(self, tape, before_seq, before_time):
+        """Drop trades older than `before_time` or about to be overwritten."""
+        while self.start < tape.count:
+            i = self.start % tape.capacity
+            if self.start >= before_seq and tape.time[i] > before_time:
+                break
+
+            qty = tape.qty[i]
+            self.count -= 1
+            self.volume -= qty
+            self.notional -= tape.price[i] * qty
+            if tape.buyer_maker[i]:
+                self.sell_volume -= qty
+            else:
+                self.buy_volume -= qty
+            if self.largest and self.largest[0] == self.start:
+                self.largest.popleft()
+            self.start += 1
+
+        if self.count == 0:
+            # Reset so floating-point drift cannot accumulate forever.
+            self.volume = self.notional = self.buy_volume = self.sell_volume = 0.0
+
+
+class TradeTape:
+    """Fixed-capacity ring buffer of trades with O(1) rolling statistics."""
+
+    def __init__(self, capacity=100_000, windows=(10, 60, 300)) -> None:
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=TRADE_DTYPE)
+        self.price = self.data["price"]
+        self.qty = self.data["qty"]
+        self.time = self.data["time"]
+        self.buyer_maker = self.data["buyer_maker"]
+        self.count = 0
+        self.windows = [RollingWindow(seconds) for seconds in windows]
+        self.lock = threading.Lock()
+        # Local monotonic time the newest trade arrived.
+        self.arrived = 0.0
+
+    def append(self, price, qty, time_ms, buyer_maker):
+        with self.lock:
+            self.add(price, qty, time_ms, buyer_maker)
+            self.arrived = time.monotonic()
+
+    def extend(self, trades):
+        """Append TRADE_DTYPE records under a single lock acquisition."""
+        with self.lock:
+            for price, qty, time_ms, buyer_maker in trades.tolist():
+                self.add(price, qty, time_ms, buyer_maker)
+            self.arrived = time.monotonic()
+
+    def add(self, price, qty, time_ms, buyer_maker):
+        oldest = self.count - self.capacity
+        for window in self.windows:
+            if window.start <= oldest:
+                window.expire(self, oldest + 1, time_ms - window.span_ms)
+
+        seq = self.count
+        i = seq % self.capacity
+        self.price[i] = price
+        self.qty[i] = qty
+        self.time[i] = time_ms
+        self.buyer_maker[i] = buyer_maker
+        self.count += 1
+
+        for window in self.windows:
+            window.add(seq, price, qty, buyer_maker, self)
+            window.expire(self, 0, time_ms - window.span_ms)
+
+    def latest(self, n):
+        """The newest `n` trades, newest first."""
+        with self.lock:
+            n = min(n, self.count, self.capacity)
+            index = (self.count - 1 - np.arange(n)) % self.capacity
+            return self.data[index]
+
+    def stats(self, now_ms=None):
+        """Rolling VWAP, buy/sell volume, trade rate and largest trade per window.
+
+        Windows are expired up to `now_ms` first, so a quiet market does not
+        keep showing trades from minutes ago. It defaults to the newest trade
+        time plus the local time since it arrived, which keeps recorded
+        timestamps in a replay working too.
+        """
+        with self.lock:
+            if now_ms is None and self.count:
+                newest = int(self.time[(self.count - 1) % self.capacity])
+                now_ms = newest + int((time.monotonic() - self.arrived) * 1000)
+            rows = []
+            for window in self.windows:
+                if now_ms is not None:
+                    window.expire(self, 0, now_ms - window.span_ms)
+                largest = None
+                if window.largest:
+                    row = self.data[window.largest[0] % self.capacity]
+                    largest = (float(row["price"]), float(row["qty"]))
+                rows.append(
+                    {
+                        "seconds": window.seconds,
+                        "trades": window.count,
+                        "vwap": window.notional / window.volume if window.volume else None,
+                        "buy_volume": window.buy_volume,
+                        "sell_volume": window.sell_volume,
+                        "rate": window.count / window.seconds,
+                        "largest": largest,
+                    }
+                )
+            return rows
+
+
+class TraderTracker(Framework):
+    def __init__(self, symbol, typeOf, callback=None) -> None:
+        super().__init__(symbol, typeOf, callback)
+        self.tape = TradeTape()
+
+    def on_message(self, data):
+        """Record the trade on the tape and report it."""
+        if not self.is_active:
+            return
+
+        price = data["p"]
+        quantity = data["q"]
+        self.tape.append(float(price), float(quantity), data["T"], data["m"])
+
+        self.publish(price, quantity)
+
+    def on_records(self, trades):
+        if not self.is_active:
+            return
+
+        self.tape.extend(trades)
+        price, quantity = trades[-1].tolist()[:2]
+        self.publish(f"{price}", f"{quantity}")
+
+    def publish(self, price, quantity):
+        self.information = {"symbol": self.symbol, "price": price, "quantity": quantity}
+
+        if self.callback:
+            self.callback(self.information)
+
+
+class SubscriptionPool:
+    """Keeps trackers for pinned and recently used symbols subscribed.
+
+    `acquire` hands back a running tracker, reusing a warm one when it can,
+    so its last `information` is available straight away. Beyond `budget`
+    trackers the least recently used unpinned ones are stopped.
+    """
+
+    def __init__(self, factory, budget=8, pinned=()) -> None:
+        self.factory = factory
+        self.budget = budget
+        self.pinned = set(pinned)
+        self.trackers = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def warm(self, symbol):
+        tracker = self.trackers.get(symbol)
+        if tracker is None:
+            tracker = self.factory(symbol)
+            tracker.start()
+            self.trackers[symbol] = tracker
+            self.trackers.move_to_end(symbol, last=False)
+        return tracker
+
+    def acquire(self, symbol):
+        """Running tracker for `symbol`, now the most recently used."""
+        with self.lock:
+            tracker = self.warm(symbol)
+            self.trackers.move_to_end(symbol)
+            self.evict()
+        return tracker
+
+    def prefetch(self, symbols):
+        """Start trackers for symbols likely to be picked next, as least recent."""
+        with self.lock:
+            for symbol in symbols:
+                self.warm(symbol)
+            self.evict()
+
+    def pin(self, symbol):
+        with self.lock:
+            self.pinned.add(symbol)
+            self.warm(symbol)
+
+    def evict(self):
+        """Stop least recently used unpinned trackers until within `budget`.
+
+        The most recently used tracker is the one on screen and is never
+        stopped, so only `budget` or more pinned symbols can exceed it.
+        """
+        current = next(reversed(self.trackers), None)
+        unpinned = [
+            symbol
+            for symbol in self.trackers
+            if symbol not in self.pinned and symbol != current
+        ]
+        while len(self.trackers) > self.budget and unpinned:
+            self.trackers.pop(unpinned.pop(0)).stop()
+
+    def stop(self):
+        with self.lock:
+            for tracker in self.trackers.values():
+                tracker.stop()
+            self.trackers.clear()
+
+
+class BookSide:
+    """One side of an order book as a sorted array of numeric price levels.
+
+    A quantity change is a dict update. Adding or removing a level finds its
+    slot by bisection but shifts the key list to make or close the gap, so
+    it is O(n); at the few thousand levels of a Binance book that is one
+    short memmove.
+    """
+
+    def __init__(self, descending=False) -> None:
+        # Bids are keyed by -price so both sides sort best level first.
+        self.sign = -1.0 if descending else 1.0
+        self.keys = []
+        self.levels = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys = []
+        self.levels = {}
+
+    def set(self, price, quantity):
+        """Insert, update or (with zero quantity) remove a price level."""
+        key = self.sign * price
+        if quantity == 0:
+            if self.levels.pop(key, None) is not None:
+                del self.keys[bisect.bisect_left(self.keys, key)]
+            return
+
+        if key not in self.levels:
+            bisect.insort(self.keys, key)
+        self.levels[key] = quantity
+
+    def top(self, n):
+        """Best `n` levels as (price, quantity) pairs."""
+        return [(self.sign * key, self.levels[key]) for key in self.keys[:n]]
+
+    def arrays(self, n):
+        """Best `n` levels as price and quantity arrays."""
+        keys = self.keys[:n]
+        quantities = np.fromiter(map(self.levels.__getitem__, keys), float, len(keys))
+        return np.array(keys) * self.sign, quantities
+
+
+class OrderBook:
+    """Local book built from a REST snapshot plus diff-depth events."""
+
+    def __init__(self, symbol) -> None:
+        self.symbol = symbol
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide()
+        self.last_update_id = None
+
+    def load_snapshot(self, snapshot):
+        self.bids.clear()
+        self.asks.clear()
+        for price, quantity in snapshot["bids"]:
+            self.bids.set(float(price), float(quantity))
+        for price, quantity in snapshot["asks"]:
+            self.asks.set(float(price), float(quantity))
+        self.last_update_id = snapshot["lastUpdateId"]
+
+    def apply_diff(self, event):
+        """Apply one depth event; return False if a sequence gap means resync."""
+        if self.last_update_id is None:
+            return False
+        if event["u"] <= self.last_update_id:
+            return True
+        if event["U"] > self.last_update_id + 1:
+            return False
+
+        for price, quantity in event["b"]:
+            self.bids.set(float(price), float(quantity))
+        for price, quantity in event["a"]:
+            self.asks.set(float(price), float(quantity))
+        self.last_update_id = event["u"]
+        return True
+
+    def top(self, n):
+        return self.bids.top(n), self.asks.top(n)
+
+    def arrays(self, n):
+        """(bid prices, bid quantities, ask prices, ask quantities), best first."""
+        return self.bids.arrays(n) + self.asks.arrays(n)
+
+
+class LiquidityHeatmap:
+    """Resting quantity per price bucket over the last `columns` book updates.
+
+    A fixed (buckets, columns) array used as a ring, one column per update.
+    Buckets are `bucket_bps` of the first mid price wide; when the mid
+    drifts into the outer quarter of the range the rows shift to re-centre
+    it and `moved` is set so the price axis can be redrawn.
+    """
+
+    def __init__(self, columns=240, buckets=160, bucket_bps=0.5) -> None:
+        self.columns = columns
+        self.buckets = buckets
+        self.bucket_bps = bucket_bps
+        self.grid = np.zeros((buckets, columns))
+        self.head = 0
+        self.low = None
+        self.step = None
+        self.mid = None
+        self.moved = False
+
+    @property
+    def high(self):
+        return self.low + self.step * self.buckets
+
+    def add(self, bid_prices, bid_quantities, ask_prices, ask_quantities):
+        if not len(bid_prices) or not len(ask_prices):
+            return
+
+        self.mid = (bid_prices[0] + ask_prices[0]) / 2
+        if self.step is None:
+            self.step = self.mid * self.bucket_bps / 10_000
+            self.low = self.mid - self.step * self.buckets / 2
+            self.moved = True
+        elif not self.buckets / 4 <= (self.mid - self.low) / self.step <= self.buckets * 3 / 4:
+            self.recentre()
+
+        prices = np.concatenate([bid_prices, ask_prices])
+        quantities = np.concatenate([bid_quantities, ask_quantities])
+        rows = np.floor((prices - self.low) / self.step).astype(np.intp)
+        keep = (rows >= 0) & (rows < self.buckets)
+        self.grid[:, self.head] = np.bincount(
+            rows[keep], weights=quantities[keep], minlength=self.buckets
+        )
+        self.head = (self.head + 1) % self.columns
+
+    def recentre(self):
+        shift = int(round((self.mid - self.low) / self.step - self.buckets / 2))
+        self.low += shift * self.step
+        self.moved = True
+        if abs(shift) >= self.buckets:
+            self.grid[:] = 0
+            return
+        self.grid = np.roll(self.grid, -shift, axis=0)
+        if shift > 0:
+            self.grid[-shift:] = 0
+        else:
+            self.grid[:-shift] = 0
+
+    def image(self):
+        """The grid oldest column first, lowest price bucket in row 0."""
+        return np.roll(self.grid, -self.head, axis=1)
+
+
+class bookDepthTracker(Framework):
+    def __init__(
+        self, symbol, typeOf="depth@100ms", callback=None, limit=10, buffer_limit=1000
+    ):
+        super().__init__(symbol, typeOf, callback)
+        self.limit = limit
+        # Publish NumPy arrays (see OrderBook.arrays) instead of level pairs.
+        self.arrays = False
+        self.book = OrderBook(symbol)
+        # Diffs wait here for the snapshot; the oldest go first if it is slow.
+        self.buffer = collections.deque(maxlen=buffer_limit)
+        self.syncing = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.is_active:
+            return
+
+        super().start()
+        self.resync()
+
+    def resync(self):
+        """Buffer diffs and reload the book from a fresh REST snapshot."""
+        with self.lock:
+            if self.syncing or not self.is_active:
+                return
+            self.syncing = True
+            self.buffer.clear()
+            self.book.last_update_id = None
+
+        if self.hub.snapshots:
+            future = self.hub.request_snapshot(self.stream, fallback=self.fetch_snapshot)
+        else:
+            fetch = self.fetch_snapshot_async if fetcher.runtime else self.fetch_snapshot
+            future = fetcher.submit(("depth", self.symbol), fetch)
+        self.track(future).add_done_callback(self.load_snapshot)
+
+    def fetch_snapshot(self):
+        snapshot = rest.depth(self.symbol, 1000)
+        self.hub.record_snapshot(self.stream, snapshot)
+        return snapshot
+
+    async def fetch_snapshot_async(self):
+        snapshot = await rest.depth_async(self.symbol, 1000)
+        self.hub.record_snapshot(self.stream, snapshot)
+        return snapshot
+
+    def load_snapshot(self, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error or not self.is_active:
+            with self.lock:
+                self.syncing = False
+            if error:
+                print(f"{self.symbol} depth snapshot error: {error}")
+                self.later(2, self.resync)
+            return
+
+        with self.lock:
+            self.book.load_snapshot(future.result())
+            buffered = list(self.buffer)
+            self.buffer.clear()
+            self.syncing = False
+            in_sync = all(self.book.apply_diff(event) for event in buffered)
+
+        if not in_sync:
+            print(f"{self.symbol} depth gap, resyncing")
+            self.resync()
+            return
+
+        self.publish()
+
+    def on_message(self, data):
+        """Apply a depth diff to the local book."""
+        if self.is_active and self.apply(data):
+            self.publish()
+
+    def on_records(self, records):
+        """Apply a batch of decoded diffs, publishing the book once."""
+        if not self.is_active:
+            return
+
+        events, levels = records
+        changed = False
+        start = 0
+        for first, last, bids, asks in events.tolist():
+            bid_levels = levels[start : start + bids].tolist()
+            ask_levels = levels[start + bids : start + bids + asks].tolist()
+            start += bids + asks
+            diff = {"U": first, "u": last, "b": bid_levels, "a": ask_levels}
+            changed = self.apply(diff) or changed
+        if changed:
+            self.publish()
+
+    def apply(self, data):
+        """True if the diff landed on an in-sync book."""
+        with self.lock:
+            if self.syncing:
+                self.buffer.append(data)
+                return False
+            in_sync = self.book.apply_diff(data)
+
+        if not in_sync:
+            print(f"{self.symbol} depth gap, resyncing")
+            self.resync()
+            with self.lock:
+                self.buffer.append(data)
+            return False
+
+        return True
+
+    def on_reconnect(self):
+        self.resync()
+
+    def health(self):
+        state, age = super().health()
+        return ("syncing" if self.syncing and state == "live" else state), age
+
+    def publish(self):
+        if self.arrays:
+            self.information = self.book.arrays(self.limit)
+        else:
+            self.information = self.book.top(self.limit)
+
+        if self.callback:
+            self.callback(self.information)
+
+
+CANDLE_DTYPE = np.dtype(
+    [
+        ("open_time", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+        ("close_time", "<i8"),
+    ]
+)
+
+
+class CandleSeries:
+    """Growable candle history stored as one structured NumPy array."""
+
+    def __init__(self, capacity=1024) -> None:
+        self.data = np.zeros(capacity, dtype=CANDLE_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def view(self):
+        """Candles so far; later appends do not change this view's length."""
+        return self.data[: self.size]
+
+    def reserve(self, extra):
+        if self.size + extra <= len(self.data):
+            return
+        capacity = max(len(self.data) * 2, self.size + extra)
+        grown = np.zeros(capacity, dtype=CANDLE_DTYPE)
+        grown[: self.size] = self.data[: self.size]
+        self.data = grown
+
+    def extend(self, candles):
+        """Append candles newer than the last one held."""
+        if self.size:
+            candles = candles[candles["open_time"] > self.data["open_time"][self.size - 1]]
+        self.reserve(len(candles))
+        self.data[self.size : self.size + len(candles)] = candles
+        self.size += len(candles)
+
+    def prepend(self, candles):
+        """Insert candles older than the first one held; copies the series."""
+        if self.size:
+            candles = candles[candles["open_time"] < self.data["open_time"][0]]
+        if len(candles) == 0:
+            return
+        grown = np.zeros(max(len(self.data), self.size + len(candles)), dtype=CANDLE_DTYPE)
+        grown[: len(candles)] = candles
+        grown[len(candles) : len(candles) + self.size] = self.data[: self.size]
+        self.data = grown
+        self.size += len(candles)
+
+    def merge(self, candles):
+        """Replace everything from the first of `candles` onwards."""
+        if len(candles) == 0:
+            return
+        first = candles["open_time"][0]
+        self.size = int(np.searchsorted(self.data["open_time"][: self.size], first))
+        self.extend(candles)
+
+    def upsert(self, row):
+        """Update the open candle in place or append a newer one."""
+        if self.size and row[0] == self.data["open_time"][self.size - 1]:
+            self.data[self.size - 1] = row
+            return False
+        if self.size and row[0] < self.data["open_time"][self.size - 1]:
+            return False
+
+        self.reserve(1)
+        self.data[self.size] = row
+        self.size += 1
+        return True
+
+
+class KlineTracker(Framework):
+    def __init__(self, symbol, interval="1d", callback=None, history=24):
+        super().__init__(symbol, f"kline_{interval}", callback)
+        self.interval = interval
+        self.history = history
+        self.series = CandleSeries()
+        self.seeded = False
+        self.exhausted = False
+        # Live candles held back while seeding, and the closed ones among them.
+        self.buffer = []
+        self.buffer_closed = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Subscribe, then seed history from the local store in the background."""
+        if self.is_active:
+            return
+
+        super().start()
+        if not self.seeded:
+            self.request_history()
+
+    def request_history(self, count=None):
+        if not self.is_active:
+            return
+
+        self.requested = count or self.history
+        if self.hub.snapshots:
+            self.seeding = self.hub.request_snapshot(
+                self.stream,
+                kline_rows,
+                fallback=lambda: store.sync(self.symbol, self.interval, self.requested),
+            )
+        else:
+            # Keyed on the count too: a longer backfill must not get a shorter one.
+            self.seeding = fetcher.submit(
+                ("klines", self.symbol, self.interval, self.requested),
+                store.sync,
+                self.symbol,
+                self.interval,
+                self.requested,
+            )
+        self.track(self.seeding).add_done_callback(self.seed)
+
+    def seed(self, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error:
+            if error:
+                print(f"{self.symbol} kline history error: {error}")
+                self.later(5, self.request_history, self.requested)
+            return
+
+        with self.lock:
+            self.series.merge(future.result())
+            for row in self.buffer:
+                self.series.upsert(row)
+            closed, self.buffer, self.buffer_closed = self.buffer_closed, [], []
+            self.seeded = True
+
+        # The store resumes from its last row, so these must not be skipped.
+        self.save_closed(closed)
+        self.publish(closed=False, full=True)
+
+    def on_reconnect(self):
+        """Buffer live candles again and backfill the gap from REST."""
+        with self.lock:
+            if not self.seeded or not self.series.size:
+                return
+            self.seeded = False
+            last = int(self.series.data["open_time"][self.series.size - 1])
+
+        missed = (int(time.time() * 1000) - last) // interval_ms(self.interval) + 2
+        self.request_history(max(self.history, missed))
+
+    def health(self):
+        state, age = super().health()
+        return ("syncing" if not self.seeded and state == "live" else state), age
+
+    def load_older(self, count):
+        """Page in up to `count` candles before the oldest one held."""
+        with self.lock:
+            if not self.series.size:
+                return None
+            before = int(self.series.data["open_time"][0])
+
+        future = fetcher.submit(
+            ("older", self.symbol, self.interval, before),
+            store.before,
+            self.symbol,
+            self.interval,
+            before,
+            count,
+        )
+        self.track(future).add_done_callback(self.prepend)
+        return future
+
+    def prepend(self, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error:
+            if error:
+                print(f"{self.symbol} older kline error: {error}")
+            return
+
+        older = future.result()
+        if len(older) == 0:
+            self.exhausted = True
+            return
+
+        with self.lock:
+            self.series.prepend(older)
+
+        self.publish(closed=False, full=True)
+
+    def on_message(self, data):
+        """Update the open candle, appending when a new one starts."""
+        if not self.is_active:
+            return
+
+        k = data["k"]
+        row = (
+            k["t"],
+            float(k["o"]),
+            float(k["h"]),
+            float(k["l"]),
+            float(k["c"]),
+            float(k["v"]),
+            k["T"],
+        )
+        if self.apply([row], [row] if k["x"] else []):
+            self.publish(closed=k["x"], full=False)
+
+    def on_records(self, records):
+        """Apply a batch of KLINE_EVENT_DTYPE records, publishing once."""
+        if not self.is_active:
+            return
+
+        rows = [tuple(row[:7]) for row in records.tolist()]
+        closed = [row for row, done in zip(rows, records["closed"]) if done]
+        if self.apply(rows, closed):
+            self.publish(closed=bool(closed), full=False)
+
+    def apply(self, rows, closed):
+        with self.lock:
+            if not self.seeded:
+                self.buffer.extend(rows)
+                self.buffer_closed.extend(closed)
+                return False
+            for row in rows:
+                self.series.upsert(row)
+
+        self.save_closed(closed)
+        return True
+
+    def save_closed(self, closed):
+        """Append closed candles newer than the stored tail, off this thread."""
+        if closed:
+            store.append_later(self.symbol, self.interval, np.array(closed, dtype=CANDLE_DTYPE))
+
+    def publish(self, closed, full):
+        self.information = {
+            "symbol": self.symbol,
+            "candles": self.series.view(),
+            "closed": closed,
+            "full": full,
+        }
+
+        if self.callback:
+            self.callback(self.information)
+
+
+TICKER_DTYPE = np.dtype(
+    [("event_time", "<i8"), ("price", "<f8"), ("change", "<f8"), ("percent", "<f8")]
+)
+KLINE_EVENT_DTYPE = np.dtype(CANDLE_DTYPE.descr + [("closed", "?")])
+DEPTH_EVENT_DTYPE = np.dtype(
+    [("first", "<i8"), ("last", "<i8"), ("bids", "<i4"), ("asks", "<i4")]
+)
+LEVEL_DTYPE = np.dtype([("price", "<f8"), ("qty", "<f8")])
+
+
+def decode_ticker(items):
+    return np.array(
+        [(d["E"], float(d["c"]), float(d["p"]), float(d["P"])) for d in items],
+        dtype=TICKER_DTYPE,
+    )
+
+
+def decode_trade(items):
+    return np.array(
+        [(float(d["p"]), float(d["q"]), d["T"], d["m"]) for d in items],
+        dtype=TRADE_DTYPE,
+    )
+
+
+def decode_kline(items):
+    rows = []
+    for d in items:
+        k = d["k"]
+        rows.append(
+            (
+                k["t"],
+                float(k["o"]),
+                float(k["h"]),
+                float(k["l"]),
+                float(k["c"]),
+                float(k["v"]),
+                k["T"],
+                k["x"],
+            )
+        )
+    return np.array(rows, dtype=KLINE_EVENT_DTYPE)
+
+
+def decode_depth(items):
+    """(events, levels): each event's bids then asks are consecutive levels."""
+    events = np.array(
+        [(d["U"], d["u"], len(d["b"]), len(d["a"])) for d in items],
+        dtype=DEPTH_EVENT_DTYPE,
+    )
+    levels = [level for d in items for level in d["b"] + d["a"]]
+    levels = np.array(levels, dtype=float).reshape(-1, 2)
+    return events, levels.view(LEVEL_DTYPE).reshape(-1)
+
+
+# Stream kind -> decoder; register more with DECODERS[kind] = fn. Decoders run
+# in worker processes, so they must be importable module-level functions.
+DECODERS = {
+    "ticker": decode_ticker,
+    "trade": decode_trade,
+    "aggTrade": decode_trade,
+    "kline": decode_kline,
+    "depth": decode_depth,
+}
+
+
+def stream_kind(stream):
+    """"btcusdt@kline_1m" -> "kline", "btcusdt@depth@100ms" -> "depth"."""
+    kind = stream.partition("@")[2]
+    return kind.partition("@")[0].partition("_")[0]
+
+
+def decode_batch(frames, typed):
+    """Worker side: group frames by stream and decode the `typed` ones."""
+    groups = {}
+    controls = []
+    for frame in frames:
+        envelope = json.loads(frame)
+        stream = envelope.get("stream")
+        if stream is None or "data" not in envelope:
+            controls.append(envelope)
+            continue
+        groups.setdefault(stream, []).append(envelope["data"])
+
+    decoded = []
+    for stream, items in groups.items():
+        decoder = DECODERS.get(stream_kind(stream)) if stream in typed else None
+        last = items[-1]
+        event_time = last.get("E") if isinstance(last, dict) else None
+        decoded.append((stream, decoder(items) if decoder else items, event_time))
+    return decoded, controls
 
 
-class Framework:
-    def __init__(self, symbol, typeOf, callback=None) -> None:
-        self.symbol = symbol
-        self.typeOf = typeOf
-        self.callback = callback
-        self.is_active = False
-        self.ws = None
+class DecodePipeline:
+    """Parses raw frames in a process pool, batch by batch, in arrival order.
+
+    Batches are shipped once `batch_size` frames arrive or after
+    `max_delay` seconds; up to `in_flight` batches decode in parallel while
+    results are handed back to the hub strictly in order. Creating one
+    routes `hub`'s frames through it.
+
+    Not for an AsyncStreamHub: a full queue blocks the socket reader to
+    push back on the stream, which would stall the whole event loop.
+    """
+
+    def __init__(
+        self, hub, workers=None, batch_size=256, max_delay=0.005, in_flight=None
+    ) -> None:
+        if isinstance(hub, AsyncStreamHub):
+            raise ValueError("a decode pipeline cannot run on the event-loop hub")
+        workers = workers or os.cpu_count() or 1
+        # Forking a process that already runs Tk and socket threads can
+        # deadlock, so workers are spawned, and all of them up front rather
+        # than lazily from the socket thread with the lock held.
+        self.pool = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        wait([self.pool.submit(os.getpid) for _ in range(workers)])
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.batch = []
+        self.received = 0
+        self.typed = frozenset()
+        self.lock = threading.Lock()
+        self.pending = queue.Queue(maxsize=in_flight or 4 * workers)
+        self.hub = hub
+        hub.pipeline = self
+        self.running = True
+        threading.Thread(target=self.deliver_loop, daemon=True).start()
+        threading.Thread(target=self.flush_loop, daemon=True).start()
+
+    def put(self, frame, received, typed):
+        with self.lock:
+            if not self.batch:
+                self.received = received
+            self.batch.append(frame)
+            self.typed = typed
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        frames, self.batch = self.batch, []
+        future = self.pool.submit(decode_batch, frames, self.typed)
+        # Blocks the socket thread when the workers fall behind.
+        self.pending.put((future, self.received))
+
+    def flush_loop(self):
+        while self.running:
+            time.sleep(self.max_delay)
+            with self.lock:
+                if self.batch:
+                    self.flush()
+
+    def deliver_loop(self):
+        while True:
+            future, received = self.pending.get()
+            if future is None:
+                return
+            try:
+                groups, controls = future.result()
+            except Exception as error:
+                print(f"decode error: {error}")
+                continue
+            self.hub.deliver(groups, controls, received)
+
+    def close(self):
+        self.running = False
+        self.pending.put((None, 0))
+        self.pool.shutdown(cancel_futures=True)
+
+
+def ema_series(values, alpha, state=None):
+    """Vectorized EMA of `values` continuing from `state` (seeded by values[0]).
+
+    The recurrence is solved in closed form one chunk at a time, with chunks
+    short enough that (1 - alpha) ** -chunk stays inside float64 range.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values.copy()
+    if alpha >= 1:
+        return values.copy()
+
+    decay = 1 - alpha
+    chunk = int(min(4096, max(1, 200 / -np.log10(decay))))
+    state = values[0] if state is None else state
+    out = np.empty_like(values)
+    for start in range(0, len(values), chunk):
+        block = values[start : start + chunk]
+        powers = decay ** -np.arange(1, len(block) + 1)
+        out[start : start + len(block)] = (
+            state + alpha * np.cumsum(block * powers)
+        ) / powers
+        state = out[start + len(block) - 1]
+    return out
+
+
+class Indicator:
+    """Streaming indicator: O(1) per candle, vectorized on backfill.
+
+    `update(close, closed)` returns the outputs for the given close. Values
+    for the open candle are computed from the last committed state and
+    thrown away; a closed candle commits its state.
+    """
+
+    panel = "price"
+    outputs = ()
+
+    def backfill(self, closes):
+        """Outputs for every close as an (n, len(outputs)) array."""
+        raise NotImplementedError
+
+    def update(self, close, closed):
+        state, values = self.step(close)
+        if closed:
+            self.state = state
+        return values
+
+
+class EMA(Indicator):
+    def __init__(self, period) -> None:
+        self.name = f"EMA {period}"
+        self.outputs = (self.name,)
+        self.alpha = 2 / (period + 1)
+        self.state = None
+
+    def backfill(self, closes):
+        values = ema_series(closes, self.alpha)
+        self.state = values[-1] if len(values) else None
+        return values[:, None]
+
+    def step(self, close):
+        if self.state is None:
+            return close, (close,)
+        value = self.state + self.alpha * (close - self.state)
+        return value, (value,)
+
+
+class RSI(Indicator):
+    panel = "RSI"
+
+    def __init__(self, period=14) -> None:
+        self.name = f"RSI {period}"
+        self.outputs = (self.name,)
+        self.alpha = 1 / period
+        self.state = None
+
+    @staticmethod
+    def rsi(gain, loss):
+        return np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / np.where(loss == 0, 1, loss)))
+
+    def backfill(self, closes):
+        closes = np.asarray(closes, dtype=float)
+        out = np.full((len(closes), 1), np.nan)
+        if len(closes) < 2:
+            self.state = (closes[-1], None, None) if len(closes) else None
+            return out
+
+        delta = np.diff(closes)
+        gain = ema_series(np.maximum(delta, 0), self.alpha)
+        loss = ema_series(np.maximum(-delta, 0), self.alpha)
+        out[1:, 0] = self.rsi(gain, loss)
+        self.state = (closes[-1], gain[-1], loss[-1])
+        return out
+
+    def step(self, close):
+        if self.state is None:
+            return (close, None, None), (np.nan,)
+
+        previous, gain, loss = self.state
+        up, down = max(close - previous, 0.0), max(previous - close, 0.0)
+        if gain is None:
+            gain, loss = up, down
+        else:
+            gain += self.alpha * (up - gain)
+            loss += self.alpha * (down - loss)
+        return (close, gain, loss), (float(self.rsi(gain, loss)),)
+
+
+class Bollinger(Indicator):
+    def __init__(self, period=20, width=2.0) -> None:
+        self.name = f"BB {period}"
+        self.outputs = (f"{self.name} upper", f"{self.name} mid", f"{self.name} lower")
+        self.period = period
+        self.width = width
+        self.state = (collections.deque(maxlen=period), 0.0, 0.0)
+
+    def bands(self, total, squares, count):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0))
+        return mean + self.width * std, mean, mean - self.width * std
+
+    def backfill(self, closes):
+        closes = np.asarray(closes, dtype=float)
+        n = self.period
+        out = np.full((len(closes), 3), np.nan)
+        if len(closes) >= n:
+            sums = np.cumsum(np.concatenate([[0.0], closes]))
+            squares = np.cumsum(np.concatenate([[0.0], closes * closes]))
+            upper, mid, lower = self.bands(sums[n:] - sums[:-n], squares[n:] - squares[:-n], n)
+            out[n - 1 :] = np.column_stack([upper, mid, lower])
+
+        window = collections.deque(closes[-n:].tolist(), maxlen=n)
+        self.state = (window, float(sum(window)), float(sum(x * x for x in window)))
+        return out
+
+    def step(self, close):
+        window, total, squares = self.state
+        if len(window) == self.period:
+            oldest = window[0]
+            total -= oldest
+            squares -= oldest * oldest
+        total += close
+        squares += close * close
+
+        count = min(len(window) + 1, self.period)
+        values = (np.nan,) * 3
+        if count == self.period:
+            values = tuple(float(v) for v in self.bands(total, squares, count))
+        return (window, total, squares, close), values
+
+    def update(self, close, closed):
+        state, values = self.step(close)
+        if closed:
+            window, total, squares, close = state
+            window.append(close)
+            self.state = (window, total, squares)
+        return values
+
+
+class MACD(Indicator):
+    panel = "MACD"
+
+    def __init__(self, fast=12, slow=26, signal=9) -> None:
+        self.name = f"MACD {fast}/{slow}/{signal}"
+        self.outputs = ("MACD", "signal", "histogram")
+        self.alphas = (2 / (fast + 1), 2 / (slow + 1), 2 / (signal + 1))
+        self.state = None
+
+    def backfill(self, closes):
+        fast_alpha, slow_alpha, signal_alpha = self.alphas
+        fast = ema_series(closes, fast_alpha)
+        slow = ema_series(closes, slow_alpha)
+        macd = fast - slow
+        signal = ema_series(macd, signal_alpha)
+        if len(macd):
+            self.state = (fast[-1], slow[-1], signal[-1])
+        return np.column_stack([macd, signal, macd - signal])
+
+    def step(self, close):
+        if self.state is None:
+            return (close, close, 0.0), (0.0, 0.0, 0.0)
+
+        fast, slow, signal = self.state
+        fast_alpha, slow_alpha, signal_alpha = self.alphas
+        fast += fast_alpha * (close - fast)
+        slow += slow_alpha * (close - slow)
+        macd = fast - slow
+        signal += signal_alpha * (macd - signal)
+        return (fast, slow, signal), (macd, signal, macd - signal)
+
+
+class IndicatorEngine:
+    """Keeps indicator outputs in step with a CandleSeries view.
+
+    Closed candles are committed once each; the open (last) candle is
+    re-evaluated on every update without touching committed state. A
+    shrunken or replaced series triggers a vectorized backfill.
+    """
+
+    def __init__(self, indicators) -> None:
+        self.indicators = list(indicators)
+        self.columns = sum(len(indicator.outputs) for indicator in self.indicators)
+        self.values = np.full((0, self.columns), np.nan)
+        self.closed = 0
+        self.first_open_time = None
+
+    def update(self, candles, full=False):
+        count = len(candles)
+        closes = candles["close"]
+        if count == 0:
+            return
+
+        replaced = count - 1 < self.closed or candles["open_time"][0] != self.first_open_time
+        if full or replaced:
+            self.backfill(closes[:-1])
+            self.first_open_time = candles["open_time"][0]
+
+        if len(self.values) < count:
+            grown = np.full((max(count, len(self.values) * 2), self.columns), np.nan)
+            grown[: len(self.values)] = self.values
+            self.values = grown
+
+        for i in range(self.closed, count - 1):
+            self.values[i] = self.step(closes[i], closed=True)
+        self.closed = count - 1
+        self.values[count - 1] = self.step(closes[count - 1], closed=False)
+
+    def backfill(self, closes):
+        self.values = np.full((len(closes) + 1, self.columns), np.nan)
+        column = 0
+        for indicator in self.indicators:
+            width = len(indicator.outputs)
+            self.values[: len(closes), column : column + width] = indicator.backfill(closes)
+            column += width
+        self.closed = len(closes)
+
+    def step(self, close, closed):
+        row = []
+        for indicator in self.indicators:
+            row.extend(indicator.update(float(close), closed))
+        return row
+
+    def series(self, count):
+        """(indicator, output name, values[:count]) for every output."""
+        column = 0
+        for indicator in self.indicators:
+            for name in indicator.outputs:
+                yield indicator, name, self.values[:count, column]
+                column += 1
+
+
+def kline_rows(data):
+    """CANDLE_DTYPE array from REST-shaped kline rows."""
+    converted = np.zeros(len(data), dtype=CANDLE_DTYPE)
+    if data:
+        columns = np.asarray([row[:7] for row in data], dtype=float)
+        for i, name in enumerate(CANDLE_DTYPE.names):
+            converted[name] = columns[:, i]
+
+    return converted
+
+
+class CaddleTracker:
+    def fetch_data(
+        self, symbol, interval="1d", limit=24, start_time=None, end_time=None
+    ):
+        data = rest.klines(
+            symbol, interval, limit, start_time=start_time, end_time=end_time
+        )
+        return kline_rows(data)
+
+
+def interval_ms(interval):
+    """Length of a Binance interval string such as "15m" or "1d" in ms."""
+    units = {
+        "s": 1000,
+        "m": 60_000,
+        "h": 3_600_000,
+        "d": 86_400_000,
+        "w": 604_800_000,
+        "M": 2_592_000_000,
+    }
+    if len(interval) < 2 or interval[-1] not in units or not interval[:-1].isdigit():
+        raise ValueError(f"unknown interval {interval!r}")
+    step = int(interval[:-1]) * units[interval[-1]]
+    if step <= 0:
+        raise ValueError(f"interval must be positive: {interval!r}")
+    return step
+
+
+def interval_offset_ms(interval):
+    """Bucket alignment: Binance weeks start on Monday, the epoch was a Thursday."""
+    return 4 * 86_400_000 if interval.endswith("w") else 0
+
+
+def resample(candles, step_ms, offset_ms=0):
+    """Aggregate candles into `step_ms` buckets with vectorized reductions."""
+    if len(candles) == 0:
+        return np.zeros(0, dtype=CANDLE_DTYPE)
+
+    bucket = (candles["open_time"] - offset_ms) // step_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+
+    out = aggregate(candles, starts)
+    out["open_time"] = bucket[starts] * step_ms + offset_ms
+    out["close_time"] = out["open_time"] + step_ms - 1
+    return out
+
+
+def aggregate(candles, starts):
+    """Merge candles[starts[i]:starts[i + 1]] into one OHLCV candle each."""
+    ends = np.r_[starts[1:] - 1, len(candles) - 1]
+
+    out = np.zeros(len(starts), dtype=CANDLE_DTYPE)
+    out["open_time"] = candles["open_time"][starts]
+    out["open"] = candles["open"][starts]
+    out["high"] = np.maximum.reduceat(candles["high"], starts)
+    out["low"] = np.minimum.reduceat(candles["low"], starts)
+    out["close"] = candles["close"][ends]
+    out["volume"] = np.add.reduceat(candles["volume"], starts)
+    out["close_time"] = candles["close_time"][ends]
+    return out
+
+
+class Resampler:
+    """Keeps a higher timeframe in step with a growing 1m base series.
+
+    Only base candles from the last (possibly open) bucket onwards are
+    re-aggregated on each update; earlier buckets are final.
+    """
+
+    def __init__(self, interval) -> None:
+        if interval.endswith("M"):
+            raise ValueError("months have no fixed length to resample into")
+        self.interval = interval
+        self.step = interval_ms(interval)
+        if self.step % 60_000:
+            raise ValueError(f"{interval!r} is not a whole number of 1m candles")
+        self.offset = interval_offset_ms(interval)
+        self.series = CandleSeries()
+        self.first = None
+        self.tail = 0
+
+    def update(self, base):
+        if len(base) == 0:
+            return self.series.view()
+
+        if base["open_time"][0] != self.first or len(base) < self.tail:
+            self.series = CandleSeries()
+            self.first = base["open_time"][0]
+            self.tail = 0
+
+        tail = resample(base[self.tail :], self.step, self.offset)
+        # The first tail bucket replaces the series' last, still-open bucket.
+        self.series.size = max(self.series.size - 1, 0) if self.tail else 0
+        self.series.extend(tail)
+        self.tail = int(np.searchsorted(base["open_time"], tail["open_time"][-1]))
+        return self.series.view()
+
+
+class BarRule:
+    """How trades are grouped into bars.
+
+    Parsed from text: an interval such as "5s" or "1m" makes time bars,
+    "100t" closes a bar every 100 aggregate trades, "50v" every 50 units of the base
+    asset and "2M$" every 2M of quote notional. Sizes may end in k or M.
+    """
+
+    KINDS = {"t": "tick", "v": "volume", "$": "dollar"}
+
+    def __init__(self, kind, size, offset=0, text=None) -> None:
+        self.kind = kind
+        self.size = size
+        self.offset = offset
+        self.text = text or f"{size:g}{kind[0]}"
+
+    @classmethod
+    def parse(cls, text):
+        text = text.strip()
+        kind = cls.KINDS.get(text[-1:])
+        if kind is None:
+            return cls("time", interval_ms(text), interval_offset_ms(text), text)
+
+        number = text[:-1]
+        scale = {"k": 1e3, "M": 1e6}.get(number[-1:], 1)
+        if scale != 1:
+            number = number[:-1]
+        try:
+            size = float(number) * scale
+        except ValueError:
+            raise ValueError(f"unknown bar rule {text!r}") from None
+        if not size > 0:
+            raise ValueError(f"bar size must be positive: {text!r}")
+        return cls(kind, size, text=text)
+
+    @property
+    def needs_trades(self):
+        """False for whole-minute time bars, which klines already provide."""
+        return self.kind != "time" or self.size % 60_000 != 0
+
+    def locate(self, price, qty, time_ms, total):
+        """(bar id, running total after) for one trade."""
+        if self.kind == "time":
+            return (time_ms - self.offset) // self.size, total
+        if self.kind == "tick":
+            measure = 1.0
+        elif self.kind == "volume":
+            measure = qty
+        else:
+            measure = price * qty
+        return total // self.size, total + measure
+
+    def ids(self, price, qty, times, total):
+        """`locate` for arrays of trades: bar = floor(total before / size).
+
+        The running total is summed in trade order from `total`, so batches
+        get exactly the ids one trade at a time would.
+        """
+        if self.kind == "time":
+            return (times - self.offset) // self.size, total
+        if self.kind == "tick":
+            measure = np.ones(len(price))
+        elif self.kind == "volume":
+            measure = qty
+        else:
+            measure = price * qty
+        running = np.cumsum(np.r_[total, measure])
+        return running[:-1] // self.size, float(running[-1])
+
+    def span(self, bar, first, last):
+        """Open and close time of a bar whose trades run from `first` to `last`."""
+        if self.kind == "time":
+            open_time = bar * self.size + self.offset
+            return open_time, open_time + self.size - 1
+        return first, last
+
+
+class BarBuilder:
+    """Folds trades into OHLCV bars under a BarRule, straight into a CandleSeries.
+
+    Only the open bar carries over between trades, so each trade is O(1)
+    however long the series grows. Batches are bucketed in one vectorized
+    pass, which is also how history is rebuilt when the rule changes.
+    """
+
+    def __init__(self, rule, capacity=1024) -> None:
+        self.rule = rule
+        self.series = CandleSeries(capacity)
+        self.total = 0.0
+        self.bar = None
+        # The open bar as a CANDLE_DTYPE row, written back whole per trade.
+        self.last = None
+
+    def rebuild(self, trades, rule=None):
+        """Start over from TRADE_DTYPE `trades`, under `rule` if given."""
+        self.rule = rule or self.rule
+        self.series = CandleSeries(max(len(self.series.data), 1024))
+        self.total = 0.0
+        self.bar = self.last = None
+        self.extend(trades)
+
+    def add(self, price, qty, time_ms):
+        """One trade; returns True when it opens a new bar."""
+        bar, self.total = self.rule.locate(price, qty, time_ms, self.total)
+        series = self.series
+        last = self.last
+        if bar == self.bar:
+            if price > last[2]:
+                last[2] = price
+            elif price < last[3]:
+                last[3] = price
+            last[4] = price
+            last[5] += qty
+            if self.rule.kind != "time":
+                last[6] = time_ms
+            series.data[series.size - 1] = tuple(last)
+            return False
+
+        self.bar = bar
+        open_time, close_time = self.rule.span(bar, time_ms, time_ms)
+        self.last = [open_time, price, price, price, price, qty, close_time]
+        series.reserve(1)
+        series.data[series.size] = tuple(self.last)
+        series.size += 1
+        return series.size > 1
+
+    def extend(self, trades):
+        """Fold in a batch of TRADE_DTYPE trades; returns how many bars it opened."""
+        if len(trades) == 0:
+            return 0
+
+        price = trades["price"]
+        ids, self.total = self.rule.ids(price, trades["qty"], trades["time"], self.total)
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:] - 1, len(trades) - 1]
+
+        bars = np.zeros(len(starts), dtype=CANDLE_DTYPE)
+        bars["open_time"], bars["close_time"] = self.rule.span(
+            ids[starts], trades["time"][starts], trades["time"][ends]
+        )
+        bars["open"] = price[starts]
+        bars["high"] = np.maximum.reduceat(price, starts)
+        bars["low"] = np.minimum.reduceat(price, starts)
+        bars["close"] = price[ends]
+        bars["volume"] = np.add.reduceat(trades["qty"], starts)
+
+        series = self.series
+        opened = len(bars)
+        if series.size and ids[0] == self.bar:
+            # The batch's first bar continues the open one.
+            last = self.last
+            bars["open_time"][0], bars["open"][0] = last[0], last[1]
+            bars["high"][0] = max(bars["high"][0], last[2])
+            bars["low"][0] = min(bars["low"][0], last[3])
+            bars["volume"][0] += last[5]
+            series.size -= 1
+            opened -= 1
+
+        series.reserve(len(bars))
+        series.data[series.size : series.size + len(bars)] = bars
+        series.size += len(bars)
+        self.bar = ids[-1].item()
+        self.last = list(bars[-1].tolist())
+        return opened
+
+
+class TradeLog:
+    """Growable TRADE_DTYPE history that drops its oldest half past `limit`."""
+
+    def __init__(self, limit=1_000_000) -> None:
+        self.limit = limit
+        self.data = np.zeros(min(4096, limit), dtype=TRADE_DTYPE)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def view(self):
+        return self.data[: self.size]
+
+    def reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.data):
+            return
+        keep = self.size
+        if needed > self.limit:
+            # Halving at once keeps appends amortized O(1).
+            keep = min(self.size, self.limit // 2, self.limit - extra)
+        capacity = min(max(len(self.data) * 2, keep + extra), self.limit)
+        grown = np.zeros(capacity, dtype=TRADE_DTYPE)
+        grown[:keep] = self.data[self.size - keep : self.size]
+        self.data = grown
+        self.size = keep
+
+    def add(self, price, qty, time_ms, buyer_maker):
+        self.reserve(1)
+        self.data[self.size] = (price, qty, time_ms, buyer_maker)
+        self.size += 1
+
+    def extend(self, trades):
+        trades = trades[-self.limit :]
+        self.reserve(len(trades))
+        self.data[self.size : self.size + len(trades)] = trades
+        self.size += len(trades)
+
+
+def fetch_trades(symbol, start_time, end_time=None):
+    """Aggregate trades from `start_time` on, oldest first, as TRADE_DTYPE."""
+    if end_time is None:
+        end_time = int(time.time() * 1000)
+
+    # The first page is found by time, which the API limits to an hour;
+    # later pages follow on by trade id.
+    page = rest.agg_trades(
+        symbol, start_time=start_time, end_time=min(start_time + 3_599_999, end_time)
+    )
+    pages = []
+    while page:
+        pages.append(decode_trade(page))
+        if page[-1]["T"] >= end_time:
+            break
+        page = rest.agg_trades(symbol, from_id=page[-1]["a"] + 1)
+
+    if not pages:
+        return np.zeros(0, dtype=TRADE_DTYPE)
+    trades = np.concatenate(pages)
+    return trades[trades["time"] <= end_time]
+
+
+class BarTracker(Framework):
+    """Bars built locally from the aggregate trade stream, seeded from REST
+    aggTrades, so tick bars count the same unit on both sides.
+
+    Publishes like KlineTracker, so a chart can draw either. Trades are
+    kept, so `set_rule` re-buckets them without going to the network.
+    """
+
+    def __init__(self, symbol, rule, callback=None, backfill=900, keep=1_000_000):
+        super().__init__(symbol, "aggTrade", callback)
+        self.builder = BarBuilder(rule)
+        self.trades = TradeLog(keep)
+        self.backfill = backfill
+        self.seeded = False
+        # Nothing older than the kept trades can be paged in.
+        self.exhausted = True
+        self.seeding = None
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    @property
+    def series(self):
+        return self.builder.series
+
+    @property
+    def rule(self):
+        return self.builder.rule
 
     def start(self):
-        """Start WebSocket connection."""
         if self.is_active:
             return
 
-        self.is_active = True
-        ws_url = f"wss://stream.binance.com:9443/ws/{self.symbol}@{self.typeOf}"
+        super().start()
+        if not self.seeded:
+            self.request_history()
+
+    def request_history(self):
+        """Fetch the trades after the last one kept, or `backfill` seconds' worth."""
+        if not self.is_active:
+            return
+
+        with self.lock:
+            if self.trades.size:
+                since = int(self.trades.data["time"][self.trades.size - 1]) + 1
+            else:
+                since = int(time.time() * 1000) - self.backfill * 1000
 
-        self.ws = websocket.WebSocketApp(
-            ws_url,
-            on_message=self.on_message,
-            on_error=lambda ws, err: print(f"{self.symbol} error: {err}"),
-            on_close=lambda ws, s, m: print(f"{self.symbol} closed"),
-            on_open=lambda ws: print(f"{self.symbol} connected"),
+        self.seeding = fetcher.submit(
+            ("aggTrades", self.symbol, since), fetch_trades, self.symbol, since
         )
+        self.track(self.seeding).add_done_callback(self.seed)
 
-        threading.Thread(target=self.ws.run_forever, daemon=True).start()
+    def seed(self, future):
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or error:
+            if error:
+                print(f"{self.symbol} trade history error: {error}")
+                self.later(5, self.request_history)
+            return
 
-    def stop(self):
-        """Stop WebSocket connection."""
-        self.is_active = False
-        if self.ws:
-            self.ws.close()
-            self.ws = None
+        fresh = future.result()
+        with self.lock:
+            live = np.concatenate(self.buffer) if self.buffer else fresh[:0]
+            self.buffer = []
+            # REST and the stream only meet on time; trades in the
+            # millisecond where they join may be counted once or twice.
+            if len(fresh):
+                live = live[live["time"] > fresh["time"][-1]]
+            trades = np.concatenate([fresh, live])
+            self.trades.extend(trades)
+            self.builder.extend(trades)
+            self.seeded = True
 
-    def on_message(self, ws, message):
-        pass
+        self.publish(closed=False, full=True)
 
+    def set_rule(self, rule):
+        """Rebuild every bar from the kept trades in one vectorized pass.
 
-class TickerTracker(Framework):
-    def on_message(self, ws, message):
-        """Handle price updates."""
+        Returns a done Future of the new candles. The redraw they need is
+        handed to the caller, where conflation with live updates cannot
+        reach it.
+        """
+        future = Future()
+        with self.lock:
+            self.builder.rebuild(self.trades.view(), rule)
+            future.set_result(self.series.view())
+        return future
+
+    def on_reconnect(self):
+        """Fill the gap from aggTrades before taking live trades again."""
+        with self.lock:
+            if not self.seeded:
+                return
+            self.seeded = False
+
+        self.request_history()
+
+    def health(self):
+        state, age = super().health()
+        return ("syncing" if not self.seeded and state == "live" else state), age
+
+    def on_message(self, data):
+        if not self.is_active:
+            return
+
+        price = float(data["p"])
+        qty = float(data["q"])
+        with self.lock:
+            if not self.seeded:
+                self.buffer.append(
+                    np.array([(price, qty, data["T"], data["m"])], dtype=TRADE_DTYPE)
+                )
+                return
+            self.trades.add(price, qty, data["T"], data["m"])
+            opened = self.builder.add(price, qty, data["T"])
+
+        self.publish(closed=opened, full=False)
+
+    def on_records(self, trades):
         if not self.is_active:
             return
 
-        data = json.loads(message)
-        price = float(data["c"])
-        change = float(data["p"])
-        percent = float(data["P"])
+        with self.lock:
+            if not self.seeded:
+                self.buffer.append(trades)
+                return
+            self.trades.extend(trades)
+            opened = self.builder.extend(trades)
+
+        self.publish(closed=bool(opened), full=False)
 
-        self.information = {"price": price, "change": change, "percent": percent}
+    def publish(self, closed, full):
+        self.information = {
+            "symbol": self.symbol,
+            "candles": self.series.view(),
+            "closed": closed,
+            "full": full,
+        }
 
         if self.callback:
             self.callback(self.information)
 
 
-class TraderTracker(Framework):
+STORE_DIR = os.path.join(os.path.expanduser("~"), ".crypto_tracker", "candles")
 
-    def on_message(self, ws, message):
-        """Handle price updates."""
+
+class CandleStore:
+    """Candle files per (symbol, interval), read via numpy.memmap.
+
+    Live candles are appended; older history paged in by `before` is
+    written in front, so it is only downloaded once.
+    """
+
+    def __init__(self, root=STORE_DIR) -> None:
+        self.root = root
+        self.lock = threading.Lock()
+        # One writer thread, so live appends land in the order they closed.
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+
+    def path(self, symbol, interval):
+        return os.path.join(self.root, f"{symbol.lower()}_{interval}.bin")
+
+    def load(self, symbol, interval):
+        """Memory-map every stored candle; nothing is read until sliced."""
+        path = self.path(symbol, interval)
+        count = os.path.getsize(path) // CANDLE_DTYPE.itemsize if os.path.exists(path) else 0
+        if count == 0:
+            return np.zeros(0, dtype=CANDLE_DTYPE)
+        return np.memmap(path, dtype=CANDLE_DTYPE, mode="r", shape=(count,))
+
+    def append(self, symbol, interval, candles):
+        """Append closed candles newer than the last stored one."""
+        with self.lock:
+            stored = self.load(symbol, interval)
+            if len(stored):
+                candles = candles[candles["open_time"] > stored["open_time"][-1]]
+            if len(candles) == 0:
+                return
+
+            path = self.path(symbol, interval)
+            os.makedirs(self.root, exist_ok=True)
+            with open(path, "ab") as f:
+                # Drop a record torn by an earlier crash before appending.
+                f.truncate(len(stored) * CANDLE_DTYPE.itemsize)
+                f.write(np.ascontiguousarray(candles, dtype=CANDLE_DTYPE).tobytes())
+
+    def append_later(self, symbol, interval, candles):
+        """`append` on the writer thread, off the socket thread."""
+        future = self.writer.submit(self.append, symbol, interval, candles)
+        future.add_done_callback(self.written)
+        return future
+
+    def written(self, future):
+        error = None if future.cancelled() else future.exception()
+        if error:
+            print(f"candle store error: {error}")
+
+    def before(self, symbol, interval, before, count):
+        """Up to `count` candles opening before `before`, oldest first.
+
+        Stored candles are sliced from the memmap; anything older comes from
+        REST and is stored in front of them when it joins their first one.
+        """
+        stored = self.load(symbol, interval)
+        end = int(np.searchsorted(stored["open_time"], before))
+        pages = [np.array(stored[max(end - count, 0) : end])]
+        missing = count - len(pages[0])
+        oldest = int(pages[0]["open_time"][0]) if len(pages[0]) else before
+        joins = len(stored) > 0 and oldest == int(stored["open_time"][0])
+        fetched = len(pages)
+
+        while missing > 0:
+            limit = min(missing, 1000)
+            page = CaddleTracker().fetch_data(symbol, interval, limit, end_time=oldest - 1)
+            if len(page):
+                pages.insert(0, page)
+                missing -= len(page)
+                oldest = int(page["open_time"][0])
+            if len(page) < limit:
+                break
+
+        older = pages[: len(pages) - fetched]
+        if joins and older:
+            self.prepend(symbol, interval, np.concatenate(older))
+        return np.concatenate(pages)
+
+    def prepend(self, symbol, interval, candles):
+        """Write candles older than the first stored one in front of it.
+
+        The file is rewritten and swapped in, so open memmaps stay valid.
+        """
+        with self.lock:
+            stored = self.load(symbol, interval)
+            if len(stored):
+                candles = candles[candles["open_time"] < stored["open_time"][0]]
+            if len(candles) == 0:
+                return
+
+            path = self.path(symbol, interval)
+            os.makedirs(self.root, exist_ok=True)
+            temp = f"{path}.tmp"
+            with open(temp, "wb") as f:
+                f.write(np.ascontiguousarray(candles, dtype=CANDLE_DTYPE).tobytes())
+                if len(stored):
+                    f.write(stored.data)
+            os.replace(temp, path)
+
+    def sync(self, symbol, interval, history):
+        """Backfill everything after the last stored candle, then return the
+        latest `history` candles including the still-open one."""
+        step = interval_ms(interval)
+        stored = self.load(symbol, interval)
+        now = int(time.time() * 1000)
+        if len(stored):
+            start = int(stored["open_time"][-1]) + 1
+        else:
+            start = now - history * step
+
+        pages = []
+        while True:
+            page = CaddleTracker().fetch_data(symbol, interval, 1000, start_time=start)
+            pages.append(page)
+            if len(page) < 1000:
+                break
+            start = int(page["open_time"][-1]) + 1
+
+        fresh = np.concatenate(pages)
+        self.append(symbol, interval, fresh[fresh["close_time"] < now])
+
+        stored = self.load(symbol, interval)
+        live = fresh[fresh["close_time"] >= now]
+        return np.concatenate([stored[-history:], live])
+
+
+store = CandleStore()
+
+
+ALERTS_PATH = os.path.join(os.path.expanduser("~"), ".crypto_tracker", "alerts.json")
+
+
+class AlertRule:
+    """Fires when a signal of `symbol` crosses `threshold` going `direction`.
+
+    Signals: "price"; "move", percent change over the last `window`
+    seconds; "spread", best ask minus best bid in basis points of the mid;
+    "imbalance", (bid - ask) / (bid + ask) quantity over the top of the
+    book, from -1 to 1.
+    """
+
+    SIGNALS = ("price", "move", "spread", "imbalance")
+    DIRECTIONS = ("above", "below")
+
+    def __init__(
+        self,
+        symbol,
+        signal,
+        direction,
+        threshold,
+        window=None,
+        repeat=False,
+        note="",
+        rule_id=None,
+    ) -> None:
+        if signal not in self.SIGNALS:
+            raise ValueError(f"unknown alert signal {signal!r}")
+        if direction not in self.DIRECTIONS:
+            raise ValueError(f"unknown alert direction {direction!r}")
+        if signal == "move" and not window:
+            raise ValueError("a move alert needs a window in seconds")
+
+        self.id = rule_id
+        self.symbol = symbol.lower()
+        self.signal = signal
+        self.direction = direction
+        self.threshold = float(threshold)
+        self.window = int(window) if signal == "move" else None
+        self.repeat = repeat
+        self.note = note
+        # Monotonic time a repeat rule last fired, for the engine's cooldown.
+        self.fired_at = None
+
+    @property
+    def key(self):
+        """The (symbol, signal) index this rule lives in."""
+        if self.signal == "move":
+            return self.symbol, f"move_{self.window}"
+        return self.symbol, self.signal
+
+    def describe(self):
+        name = {
+            "price": "price",
+            "move": f"{self.window}s move %",
+            "spread": "spread bps",
+            "imbalance": "imbalance",
+        }[self.signal]
+        return f"{self.symbol.upper()} {name} {self.direction} {self.threshold:g}"
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "symbol": self.symbol,
+            "signal": self.signal,
+            "direction": self.direction,
+            "threshold": self.threshold,
+            "window": self.window,
+            "repeat": self.repeat,
+            "note": self.note,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["symbol"],
+            data["signal"],
+            data["direction"],
+            data["threshold"],
+            window=data.get("window"),
+            repeat=data.get("repeat", False),
+            note=data.get("note", ""),
+            rule_id=data.get("id"),
+        )
+
+
+class ThresholdIndex:
+    """Rule ids on one signal, sorted by threshold for each direction.
+
+    An update only looks at the rules whose thresholds lie between the
+    previous value and the new one: two bisects, then the hits.
+    """
+
+    def __init__(self) -> None:
+        self.levels = {"above": [], "below": []}
+        self.ids = {"above": [], "below": []}
+        self.value = None
+
+    def __len__(self):
+        return len(self.ids["above"]) + len(self.ids["below"])
+
+    def add(self, rule):
+        levels = self.levels[rule.direction]
+        i = bisect.bisect_right(levels, rule.threshold)
+        levels.insert(i, rule.threshold)
+        self.ids[rule.direction].insert(i, rule.id)
+
+    def remove(self, rule):
+        levels = self.levels[rule.direction]
+        ids = self.ids[rule.direction]
+        i = bisect.bisect_left(levels, rule.threshold)
+        while ids[i] != rule.id:
+            i += 1
+        del levels[i]
+        del ids[i]
+
+    def crossed(self, value, low=None, high=None):
+        """(rule id, crossing value) for the rules crossed on the way from
+        the last value to `value`.
+
+        `low` and `high` are the extremes seen in between, e.g. over a batch
+        of trades, so a spike that comes straight back still counts, and is
+        reported at the extreme rather than where the batch ended.
+        """
+        previous, self.value = self.value, value
+        if previous is None:
+            return []
+
+        hits = []
+        top = value if high is None else max(value, high)
+        if top > previous:
+            levels = self.levels["above"]
+            first = bisect.bisect_right(levels, previous)
+            ids = self.ids["above"][first : bisect.bisect_right(levels, top)]
+            hits += [(rule_id, top) for rule_id in ids]
+        bottom = value if low is None else min(value, low)
+        if bottom < previous:
+            levels = self.levels["below"]
+            first = bisect.bisect_left(levels, bottom)
+            ids = self.ids["below"][first : bisect.bisect_left(levels, previous)]
+            hits += [(rule_id, bottom) for rule_id in ids]
+        return hits
+
+
+class PriceMove:
+    """Percent change of a price against its value `seconds` ago."""
+
+    def __init__(self, seconds) -> None:
+        self.span_ms = int(seconds * 1000)
+        self.prices = collections.deque()
+
+    def update(self, price, time_ms):
+        self.prices.append((time_ms, price))
+        # The newest price at or before the window start is the reference.
+        cutoff = time_ms - self.span_ms
+        while len(self.prices) > 1 and self.prices[1][0] <= cutoff:
+            self.prices.popleft()
+        return (price / self.prices[0][1] - 1) * 100
+
+
+class AlertFeed(Framework):
+    """Trades of one symbol into an AlertEngine, a whole batch at a time."""
+
+    def __init__(self, symbol, engine) -> None:
+        super().__init__(symbol, "trade")
+        self.engine = engine
+
+    def on_message(self, data):
         if not self.is_active:
             return
 
-        data = json.loads(message)
-        price = data["p"]
-        quantity = data["q"]
+        self.engine.price(self.symbol, float(data["p"]), data["T"])
 
-        self.information = {"symbol": self.symbol, "price": price, "quantity": quantity}
+    def on_records(self, trades):
+        if not self.is_active:
+            return
 
-        if self.callback:
-            self.callback(self.information)
+        prices = trades["price"]
+        self.engine.price(
+            self.symbol,
+            float(prices[-1]),
+            int(trades["time"][-1]),
+            low=float(prices.min()),
+            high=float(prices.max()),
+        )
 
-class bookDepthTracker(Framework):
-     def __init__(self, symbol, typeOf, callback=None):
-        super().__init__(symbol, typeOf, callback)
-        self.last_update = 0 
 
-     def on_message(self, ws, message):
-        """Handle price updates."""
-        if not self.is_active:
+def desktop_notify(title, text):
+    """Best-effort desktop notification; False if there is no notifier."""
+    if sys.platform == "darwin":
+        script = f"display notification {json.dumps(text)} with title {json.dumps(title)}"
+        command = ["osascript", "-e", script]
+    else:
+        command = ["notify-send", title, text]
+    try:
+        subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    return True
+
+
+class AlertEngine:
+    """Price, move, spread and imbalance alerts checked on every update.
+
+    Rules sit in one ThresholdIndex per (symbol, signal), so an update costs
+    the same with ten rules or a hundred thousand, plus the ones it fires.
+    One-shot rules are removed when they fire; `repeat` rules fire again on
+    later crossings, at most once every `cooldown` seconds so a price
+    chattering around the level does not spawn a notifier per trade.
+    Rules are saved as JSON at `path`.
+    """
+
+    def __init__(
+        self, path=ALERTS_PATH, callback=None, notify=False, book_levels=20, cooldown=60
+    ):
+        self.path = path
+        self.callback = callback
+        self.notify = notify
+        self.book_levels = book_levels
+        self.cooldown = cooldown
+        self.dirty = False
+        self.save_lock = threading.Lock()
+        self.rules = {}
+        self.indexes = {}
+        self.moves = {}
+        self.feeds = {}
+        self.next_id = 1
+        self.running = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path):
             return
+        try:
+            with open(self.path) as f:
+                rules = json.load(f)
+        except (OSError, ValueError) as error:
+            print(f"alert rules error: {error}")
+            return
+        for data in rules:
+            self.add(AlertRule.from_dict(data), save=False)
 
-        current_time = time.time()
-        if current_time - self.last_update < 120: 
-            return 
-    
-        self.last_update = current_time
-        
-        data = json.loads(message)
+    def save(self):
+        # Saves may overlap from the fetch pool; the last one writes last.
+        with self.save_lock:
+            with self.lock:
+                rules = [rule.as_dict() for rule in self.rules.values()]
+                self.dirty = False
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp = f"{self.path}.tmp"
+            with open(temp, "w") as f:
+                json.dump(rules, f, indent=2)
+            os.replace(temp, self.path)
 
-        bids_dict, asks_dict = {}, {}
-        for price, quantity in data["bids"]:
-            bids_dict[f"${float(price):.3f}"] = f"{float(quantity):.5f}"
+    def save_later(self):
+        """Save on the fetch pool, off the stream thread rules fire on and
+        the Tk thread the alert panel edits them from."""
+        self.dirty = True
+        fetcher.pool.submit(self.save).add_done_callback(self.on_saved)
 
-        for price, quantity in data["asks"]:
-            asks_dict[f"${float(price):.3f}"] = f"{float(quantity):.5f}"
+    def on_saved(self, future):
+        error = None if future.cancelled() else future.exception()
+        if error:
+            print(f"alert rules error: {error}")
 
-        self.information = [bids_dict, asks_dict]
+    def add(self, rule, save=True):
+        with self.lock:
+            if rule.id is None:
+                rule.id = self.next_id
+            self.next_id = max(self.next_id, rule.id + 1)
+            self.rules[rule.id] = rule
 
-        if self.callback:
-            self.callback(self.information) 
+            index = self.indexes.get(rule.key)
+            if index is None:
+                index = self.indexes[rule.key] = ThresholdIndex()
+            index.add(rule)
+            if rule.signal == "move":
+                moves = self.moves.setdefault(rule.symbol, {})
+                if rule.window not in moves:
+                    moves[rule.window] = PriceMove(rule.window)
 
-    
+        if self.running:
+            self.sync_feeds()
+        if save:
+            self.save_later()
+        return rule.id
 
-class CaddleTracker:
-    def fetch_data(self, symbol):
-        url = "https://api.binance.com/api/v3/klines"
-        params = {"symbol": symbol.upper(), "interval": "1d", "limit": 24}
-
-        response = requests.get(url, params=params)
-        data = response.json()
-
-        converted = {
-            "open_time": [],
-            "open": [],
-            "high": [],
-            "low": [],
-            "close": [],
-            "volume": [],
-            "close_time": [],
-        }
+    def remove(self, rule_id, save=True):
+        with self.lock:
+            rule = self.rules.pop(rule_id, None)
+            if rule is None:
+                return
+            self.forget(rule)
+
+        if self.running:
+            self.sync_feeds()
+        if save:
+            self.save_later()
+
+    def forget(self, rule):
+        """Take `rule` out of its index; the caller holds the lock."""
+        index = self.indexes[rule.key]
+        index.remove(rule)
+        if index:
+            return
+        del self.indexes[rule.key]
+        if rule.signal == "move":
+            moves = self.moves[rule.symbol]
+            del moves[rule.window]
+            if not moves:
+                del self.moves[rule.symbol]
+
+    def price(self, symbol, price, time_ms=None, low=None, high=None):
+        """Check the price and move rules of `symbol` against a new trade."""
+        with self.lock:
+            hits = []
+            index = self.indexes.get((symbol, "price"))
+            if index is not None:
+                hits += index.crossed(price, low, high)
 
-        for row in data:
-            converted["open_time"].append(row[0])
-            converted["open"].append(float(row[1]))
-            converted["high"].append(float(row[2]))
-            converted["low"].append(float(row[3]))
-            converted["close"].append(float(row[4]))
-            converted["volume"].append(float(row[5]))
-            converted["close_time"].append(row[6])
+            moves = self.moves.get(symbol)
+            if moves:
+                time_ms = time_ms or int(time.time() * 1000)
+                for window, move in moves.items():
+                    index = self.indexes[(symbol, f"move_{window}")]
+                    hits += index.crossed(move.update(price, time_ms))
 
-        return converted
+            fired = self.take(hits)
+        self.fire(fired)
+
+    def book(self, symbol, bids, asks):
+        """Check the spread and imbalance rules of `symbol` against its book."""
+        if not bids or not asks:
+            return
+
+        with self.lock:
+            hits = []
+            index = self.indexes.get((symbol, "spread"))
+            if index is not None:
+                best_bid, best_ask = bids[0][0], asks[0][0]
+                spread = (best_ask - best_bid) / ((best_ask + best_bid) / 2) * 10_000
+                hits += index.crossed(spread)
+
+            index = self.indexes.get((symbol, "imbalance"))
+            if index is not None:
+                bid = sum(quantity for _, quantity in bids)
+                ask = sum(quantity for _, quantity in asks)
+                hits += index.crossed((bid - ask) / (bid + ask))
+
+            fired = self.take(hits)
+        self.fire(fired)
+
+    def take(self, hits):
+        """(rule, value) for every (rule id, value) hit, removing one-shot
+        rules and skipping repeat rules still in their cooldown; lock held."""
+        fired = []
+        now = time.monotonic()
+        for rule_id, value in hits:
+            rule = self.rules[rule_id]
+            if rule.repeat:
+                if rule.fired_at is not None and now - rule.fired_at < self.cooldown:
+                    continue
+                rule.fired_at = now
+            fired.append((rule, value))
+            if not rule.repeat:
+                del self.rules[rule_id]
+                self.forget(rule)
+        return fired
+
+    def fire(self, fired):
+        if not fired:
+            return
+        if not all(rule.repeat for rule, _ in fired):
+            self.save_later()
+
+        for rule, value in fired:
+            text = f"{rule.describe()} (at {value:g})"
+            if rule.note:
+                text += f" - {rule.note}"
+            print(f"alert: {text}")
+            if self.notify:
+                desktop_notify("Crypto alert", text)
+            if self.callback:
+                self.callback((rule, value))
+
+    def start(self):
+        self.running = True
+        self.sync_feeds()
+
+    def sync_feeds(self):
+        """Stream trades for every symbol with rules, and books where needed.
+
+        Feeds of rules that have fired stay up until the next add or remove.
+        """
+        with self.lock:
+            wanted = {
+                (symbol, "book" if signal in ("spread", "imbalance") else "trade")
+                for symbol, signal in self.indexes
+            }
+            stale = [self.feeds.pop(key) for key in list(self.feeds) if key not in wanted]
+            fresh = []
+            for key in wanted:
+                if key in self.feeds:
+                    continue
+                symbol, kind = key
+                if kind == "trade":
+                    feed = AlertFeed(symbol, self)
+                else:
+                    feed = bookDepthTracker(
+                        symbol,
+                        "depth@100ms",
+                        callback=lambda top, symbol=symbol: self.book(symbol, *top),
+                        limit=self.book_levels,
+                    )
+                self.feeds[key] = feed
+                fresh.append(feed)
+
+        for feed in stale:
+            feed.stop()
+        for feed in fresh:
+            feed.start()
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            feeds, self.feeds = self.feeds, {}
+        for feed in feeds.values():
+            feed.stop()
+        if self.dirty:
+            self.save()
@@ -1,16 +1,49 @@
+import time
+
+# Taken before the imports so the startup report covers them.
+launched = time.perf_counter()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk
 from datetime import datetime
 
-from lib import CaddleTracker, TickerTracker, bookDepthTracker
-from widget import BookDepth, KlineGraph, StatusTracker
+from lib import (
+    STREAM_URL,
+    AlertEngine,
+    DecodePipeline,
+    FrameRecorder,
+    Framework,
+    fetcher,
+    metrics,
+    startup,
+    use_event_loop,
+)
+from widget import (
+    AlertPanel,
+    BookDepth,
+    DiagnosticsPanel,
+    KlineGraph,
+    StatusTracker,
+    TimeAndSales,
+    UIDispatcher,
+    Watchlist,
+    when_shown,
+)
+
+startup.started = launched
+startup.mark("imports")
 
 # Styling is really Hard.... 
 
 class MultiTickerApp:
-    def __init__(self, root) -> None:
+    def __init__(self, root, metrics_path=None) -> None:
         self.root = root
+        self.metrics_path = metrics_path
         self.root.title("Crypto Dashboard")
+        self.dispatcher = UIDispatcher(root, fps=30)
+        self.alerts = AlertEngine(callback=self.post_alert, notify=True)
+        self.alerts.load()
 
         self.root.grid_rowconfigure(0, weight=10)
         self.root.grid_rowconfigure(1, weight=1)
@@ -25,10 +58,14 @@ class MultiTickerApp:
         self.top_body.grid_rowconfigure(0, weight=1)
         self.top_body.grid_columnconfigure(0, weight=1)
         self.top_body.grid_columnconfigure(1, weight=3)
+        self.top_body.grid_columnconfigure(2, weight=1)
 
         self.Upper_Part_Left()
         self.Upper_Part_Right()
+        self.Upper_Part_Market()
         self.Lower_Part_Bottom()
+        when_shown(self.top_body, lambda: startup.mark("first paint"))
+        when_shown(self.top_body, self.alerts.start)
 
     def Upper_Part_Left(self):
         log_container = ttk.LabelFrame(self.top_body, text="Order Book SnapShot")
@@ -39,15 +76,15 @@ class MultiTickerApp:
         log_container.grid_rowconfigure(2, weight=0)
         log_container.grid_columnconfigure(0, weight=1)
 
-        self.book_depth = BookDepth(log_container, "btcusdt", "", 10)
+        self.book_depth = BookDepth(log_container, "btcusdt", "", 10, self.dispatcher)
         self.book_depth.frame.grid(row=0, column=0, sticky="nsew")
 
-        self.secondary_log_frame = ttk.LabelFrame(log_container, text="Reminder")
+        self.secondary_log_frame = ttk.LabelFrame(log_container, text="Time & Sales")
         self.secondary_log_frame.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
 
-        ttk.Label(
-            self.secondary_log_frame, text="Order Book Update Every 2 minutes"
-        ).pack(expand=True, fill="both")
+        self.time_and_sales = TimeAndSales(
+            self.secondary_log_frame, lambda: self.status_tracker.widget_trader.tape
+        )
 
         log_button_frame = ttk.Frame(log_container)
         log_button_frame.grid(row=2, column=0, sticky="se", padx=5, pady=5)
@@ -61,9 +98,7 @@ class MultiTickerApp:
         button.configure(command=lambda: self.book_depth.toggle_visibility(button))
 
     def Upper_Part_Right(self):
-        graph_container = ttk.LabelFrame(
-            self.top_body, text="BTC 1 Hour Candlestick Chart"
-        )
+        graph_container = ttk.LabelFrame(self.top_body, text="BTC Candlestick Chart")
         graph_container.grid(row=0, column=1, sticky="nsew", padx=5, pady=5)
 
         graph_container.grid_rowconfigure(0, weight=1)
@@ -71,9 +106,8 @@ class MultiTickerApp:
         graph_container.grid_columnconfigure(0, weight=1)
 
         self.graph = KlineGraph(
-            graph_container, "btcusdt", "BTC 1 Hour Candlestick Chart"
+            graph_container, "btcusdt", "BTC", self.dispatcher, interval="1h"
         )
-        self.graph.UpdateGraph()
         self.graph.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
 
         graph_button_frame = ttk.Frame(graph_container)
@@ -85,19 +119,66 @@ class MultiTickerApp:
         button.pack(side="right")
         button.configure(command=lambda: self.graph.toggle_visibility(button))
 
+    def Upper_Part_Market(self):
+        market_container = ttk.LabelFrame(self.top_body, text="Markets")
+        market_container.grid(row=0, column=2, sticky="nsew", padx=5, pady=5)
+
+        self.watchlist = Watchlist(
+            market_container,
+            on_select=lambda symbol: self.status_tracker.Switch_select_coin(symbol),
+        )
+
     def Lower_Part_Bottom(self):
         bottom_frame = self.bottom_body
-        self.status_tracker = StatusTracker(bottom_frame)
+        self.status_tracker = StatusTracker(
+            bottom_frame, self.dispatcher, market=self.watchlist.market
+        )
         status_frame = ttk.Frame(bottom_frame)
         status_frame.pack(side="bottom", fill="x", padx=10, pady=(0, 5))
         current_time = datetime.now().strftime("%H:%M %m/%d/%Y")
         self.label_time = ttk.Label(status_frame, text=f"Last update at {current_time}")
         self.label_time.pack(side="left")
 
+        self.label_queue = ttk.Label(status_frame, text="")
+        self.label_queue.pack(side="left", padx=10)
+        self.update_queue_stats()
+
+        self.label_alert = ttk.Label(status_frame, text="", foreground="#BF8700")
+        self.label_alert.pack(side="left", padx=10)
+
         ttk.Button(
             status_frame, text="Refresh", command=lambda: self.refresh()
         ).pack(side="right")
+        ttk.Button(
+            status_frame, text="Diagnostics", command=lambda: DiagnosticsPanel(self.root)
+        ).pack(side="right", padx=5)
+        ttk.Button(
+            status_frame,
+            text="Alerts",
+            command=lambda: AlertPanel(
+                self.root, self.alerts, self.status_tracker.symbol
+            ),
+        ).pack(side="right")
     
+    def update_queue_stats(self):
+        stats = self.dispatcher.stats()
+        self.label_queue.configure(
+            text=f"UI queue: {stats['conflated']} conflated, {stats['dropped']} dropped"
+        )
+        self.root.after(1000, self.update_queue_stats)
+
+    def post_alert(self, fired):
+        # Keyed per rule so alerts firing together are not conflated.
+        rule, _ = fired
+        self.dispatcher.post((self, "alert", rule.id), self.show_alert, fired)
+
+    def show_alert(self, fired):
+        rule, value = fired
+        current_time = datetime.now().strftime("%H:%M:%S")
+        self.label_alert.configure(
+            text=f"{current_time} {rule.describe()} (now {value:g})"
+        )
+
     def refresh(self):
         self.graph.UpdateGraph()
         current_time = datetime.now().strftime("%H:%M %m/%d/%Y")
@@ -106,12 +187,67 @@ class MultiTickerApp:
 
     def on_closing(self):
         self.book_depth.stop()
+        self.graph.stop()
         self.status_tracker.stop()
+        self.watchlist.stop()
+        self.alerts.stop()
+        Framework.hub.close()
+        if Framework.hub.recorder:
+            Framework.hub.recorder.close()
+        if Framework.hub.pipeline:
+            Framework.hub.pipeline.close()
+        # Queued fetches go first; running ones see their loop tasks cancelled.
+        fetcher.shutdown()
+        if fetcher.runtime:
+            fetcher.runtime.stop()
+        self.dispatcher.stop()
+        if self.metrics_path:
+            metrics.dump(self.metrics_path)
         self.root.destroy()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crypto Dashboard")
+    parser.add_argument(
+        "--stream-url", default=STREAM_URL, help="combined-stream base URL"
+    )
+    parser.add_argument(
+        "--server",
+        metavar="URL",
+        help="use a server.py fan-out server for streams and snapshots",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        metavar="N",
+        help="parse stream frames in N worker processes",
+    )
+    parser.add_argument(
+        "--runtime",
+        choices=["threads", "asyncio"],
+        default="threads",
+        help="run sockets, REST calls and retries on one asyncio loop",
+    )
+    parser.add_argument("--record", metavar="PATH", help="log raw stream frames")
+    parser.add_argument(
+        "--metrics", metavar="PATH", help="write latency metrics as JSON on exit"
+    )
+    args = parser.parse_args()
+    if args.decode_workers and args.runtime == "asyncio":
+        parser.error("--decode-workers cannot be combined with --runtime asyncio")
+
+    if args.runtime == "asyncio":
+        use_event_loop()
+    Framework.hub.base_url = args.stream_url
+    if args.server:
+        Framework.hub.base_url = args.server
+        Framework.hub.snapshots = True
+    if args.record:
+        Framework.hub.recorder = FrameRecorder(args.record)
+    if args.decode_workers:
+        DecodePipeline(Framework.hub, args.decode_workers)
+
     root = tk.Tk()
-    app = MultiTickerApp(root)
+    app = MultiTickerApp(root, metrics_path=args.metrics)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
@@ -0,0 +1,135 @@
+"""Replay a recorded stream log through a local combined-stream server.
+
+    python main.py --record capture.log            # record a live session
+    python replay.py capture.log --speed 10        # serve it 10x faster
+    python main.py --server ws://127.0.0.1:9443
+"""
+
+import argparse
+import collections
+import json
+import threading
+import time
+
+from lib import LocalStreamServer, read_frames
+
+
+class RecordedSnapshots:
+    """Answers SNAPSHOT requests with the order book snapshots in the log.
+
+    A live REST snapshot would not match the recorded diffs, so a request
+    waits for the next snapshot of its stream in the log, as the recording
+    session waited for its REST reply. Once none are left the last one is
+    sent again, and streams without any get an error so the client falls
+    back to REST. A paged snapshot counts once, at its last page.
+    """
+
+    def __init__(self, path) -> None:
+        self.counts = collections.Counter()
+        for _, frame in read_frames(path):
+            if '"snapshot"' not in frame:
+                continue
+            envelope = json.loads(frame)
+            if "snapshot" in envelope and not envelope.get("more"):
+                self.counts[envelope["stream"]] += 1
+        self.remaining = collections.Counter(self.counts)
+        self.pages = {}
+        self.latest = {}
+        self.waiting = {}
+        self.lock = threading.Lock()
+
+    def rewind(self):
+        with self.lock:
+            self.remaining = collections.Counter(self.counts)
+            self.pages = {}
+
+    def request(self, client, streams):
+        for stream in streams:
+            with self.lock:
+                if self.remaining[stream]:
+                    self.waiting.setdefault(stream, []).append(client)
+                    continue
+                frames = self.latest.get(stream)
+            if frames is None:
+                frames = [json.dumps({"stream": stream, "error": "no snapshot"})]
+            for frame in frames:
+                client.send(frame)
+
+    def recorded(self, stream, frame, more=False):
+        with self.lock:
+            self.pages.setdefault(stream, []).append(frame)
+            if more:
+                return
+            frames = self.latest[stream] = self.pages.pop(stream)
+            self.remaining[stream] -= 1
+            clients = self.waiting.pop(stream, [])
+        for client in clients:
+            for frame in frames:
+                client.send(frame)
+
+
+def replay(server, path, speed, snapshots):
+    """Publish every recorded envelope, paced by its timestamp / `speed`.
+
+    A speed of 0 sends frames as fast as the clients will take them.
+    """
+    sent = 0
+    first_stamp = None
+    started = time.perf_counter()
+    snapshots.rewind()
+
+    for stamp, frame in read_frames(path):
+        if first_stamp is None:
+            first_stamp = stamp
+
+        if speed > 0:
+            delay = (stamp - first_stamp) / 1000 / speed
+            wait = started + delay - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        envelope = json.loads(frame)
+        stream = envelope.get("stream")
+        if stream is None:
+            continue
+        if "snapshot" in envelope:
+            snapshots.recorded(stream, frame, envelope.get("more"))
+            continue
+
+        server.publish_raw(stream, frame)
+        sent += 1
+
+    elapsed = time.perf_counter() - started
+    print(f"replayed {sent} frames in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):,.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="file written by main.py --record")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="replay rate multiplier, 0 = max"
+    )
+    parser.add_argument("--loop", action="store_true", help="replay forever")
+    args = parser.parse_args()
+
+    snapshots = RecordedSnapshots(args.log)
+    server = LocalStreamServer(args.host, args.port, on_snapshot=snapshots.request)
+    server.start()
+    print(f"serving {args.log} on {server.url}, waiting for a client...")
+    server.has_client.wait()
+
+    try:
+        while True:
+            replay(server, args.log, args.speed, snapshots)
+            if not args.loop:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Headless fan-out server: one upstream feed shared by many local clients.
+
+    python server.py --port 9443
+    python main.py --server ws://127.0.0.1:9443
+
+Each stream a client asks for is subscribed upstream once, however many
+clients want it. Order books and candles are kept here, so clients start
+from a snapshot sent over the same socket instead of calling the REST API.
+State-like streams (tickers, klines) are conflated to `--rate` updates per
+second; trades and depth diffs are forwarded as they arrive.
+"""
+
+import argparse
+import collections
+import json
+import threading
+import time
+
+from lib import (
+    STREAM_URL,
+    Framework,
+    KlineTracker,
+    LocalStreamServer,
+    bookDepthTracker,
+)
+
+
+def conflated(stream):
+    """Streams where only the latest message matters."""
+    kind = stream.partition("@")[2]
+    return (
+        stream.startswith("!")
+        or kind in ("ticker", "miniTicker")
+        or kind.startswith("kline_")
+    )
+
+
+class Relay(Framework):
+    """Forwards one upstream stream and remembers its latest message."""
+
+    def __init__(self, stream, fanout) -> None:
+        super().__init__(None, stream)
+        self.fanout = fanout
+        # Latest entry per symbol of an all-market array stream.
+        self.symbols = {}
+
+    @property
+    def stream(self):
+        return self.typeOf
+
+    def on_message(self, data):
+        if not self.is_active:
+            return
+        if isinstance(data, list):
+            self.symbols.update((item["s"], item) for item in data)
+        self.information = data
+        self.fanout.forward(self.stream, data)
+
+    def welcome(self, client):
+        """Send a new client the latest state so it starts with data.
+
+        Trades and other events are not replayed; the client would count
+        them twice.
+        """
+        if self.information is None or not conflated(self.stream):
+            return
+        data = list(self.symbols.values()) if self.symbols else self.information
+        client.send(json.dumps({"stream": self.stream, "data": data}))
+
+
+class BookRelay(bookDepthTracker):
+    """A local order book whose raw diffs go out to every client."""
+
+    # Clients need the raw messages, so no typed batches.
+    on_records = None
+
+    def __init__(self, symbol, typeOf, fanout) -> None:
+        super().__init__(symbol, typeOf)
+        self.fanout = fanout
+        self.waiting = []
+
+    def on_message(self, data):
+        super().on_message(data)
+        self.fanout.forward(self.stream, data)
+
+    def snapshot(self, client):
+        """Send the whole book, or wait until it is in sync."""
+        with self.lock:
+            if self.syncing or self.book.last_update_id is None:
+                self.waiting.append(client)
+                return
+            depth = max(len(self.book.bids), len(self.book.asks))
+            bids, asks = self.book.top(depth)
+            snapshot = {
+                "lastUpdateId": self.book.last_update_id,
+                "bids": bids,
+                "asks": asks,
+            }
+        client.send(json.dumps({"stream": self.stream, "snapshot": snapshot}))
+
+    def publish(self):
+        super().publish()
+        with self.lock:
+            waiting, self.waiting = self.waiting, []
+        for client in waiting:
+            self.snapshot(client)
+
+    def welcome(self, client):
+        pass
+
+
+class KlineRelay(KlineTracker):
+    """A candle series whose history is served to clients as a snapshot.
+
+    A month of 1m candles is several MB of JSON, so the snapshot goes out in
+    frames of `page` rows; all but the last are marked "more".
+    """
+
+    # Clients need the raw messages, so no typed batches.
+    on_records = None
+    page = 1000
+
+    def __init__(self, symbol, interval, fanout, history) -> None:
+        super().__init__(symbol, interval, history=history)
+        self.fanout = fanout
+        self.waiting = []
+
+    def on_message(self, data):
+        super().on_message(data)
+        self.fanout.forward(self.stream, data)
+
+    def snapshot(self, client):
+        with self.lock:
+            if not self.seeded:
+                self.waiting.append(client)
+                return
+            rows = self.series.view().tolist()
+        for start in range(0, max(len(rows), 1), self.page):
+            page = rows[start : start + self.page]
+            envelope = {"stream": self.stream, "snapshot": page}
+            if start + self.page < len(rows):
+                envelope["more"] = True
+            client.send(json.dumps(envelope))
+
+    def publish(self, closed, full):
+        super().publish(closed, full)
+        if not full:
+            return
+        with self.lock:
+            waiting, self.waiting = self.waiting, []
+        for client in waiting:
+            self.snapshot(client)
+
+    def welcome(self, client):
+        pass
+
+
+class FanoutServer:
+    """Reference-counts client subscriptions onto one set of upstream trackers."""
+
+    def __init__(self, host, port, rate=4, history=43_200, linger=30) -> None:
+        self.interval = 1 / rate
+        self.history = history
+        self.linger = linger
+        self.trackers = {}
+        self.counts = collections.Counter()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.running = True
+        self.server = LocalStreamServer(
+            host,
+            port,
+            on_subscribe=self.on_subscribe,
+            on_unsubscribe=self.on_unsubscribe,
+            on_snapshot=self.on_snapshot,
+        )
+
+    def start(self):
+        self.server.start()
+        threading.Thread(target=self.flush_loop, daemon=True).start()
+
+    def tracker_for(self, stream):
+        symbol, _, kind = stream.partition("@")
+        if kind.startswith("depth"):
+            return BookRelay(symbol, kind, self)
+        if kind.startswith("kline_"):
+            return KlineRelay(symbol, kind[len("kline_") :], self, self.history)
+        return Relay(stream, self)
+
+    def on_subscribe(self, client, streams):
+        for stream in streams:
+            with self.lock:
+                self.counts[stream] += 1
+                tracker = self.trackers.get(stream)
+                if tracker is None:
+                    tracker = self.trackers[stream] = self.tracker_for(stream)
+            tracker.start()
+            tracker.welcome(client)
+
+    def on_unsubscribe(self, client, streams):
+        for stream in streams:
+            with self.lock:
+                self.counts[stream] -= 1
+                idle = self.counts[stream] <= 0
+            if idle:
+                # Keep the tracker a while in case a client switches back.
+                threading.Timer(self.linger, self.release, [stream]).start()
+
+    def release(self, stream):
+        with self.lock:
+            if self.counts[stream] > 0:
+                return
+            del self.counts[stream]
+            tracker = self.trackers.pop(stream, None)
+            self.pending.pop(stream, None)
+        if tracker:
+            tracker.stop()
+
+    def on_snapshot(self, client, streams):
+        for stream in streams:
+            tracker = self.trackers.get(stream)
+            if hasattr(tracker, "snapshot"):
+                tracker.snapshot(client)
+            else:
+                # The client falls back to REST instead of waiting forever.
+                client.send(json.dumps({"stream": stream, "error": "no snapshot"}))
+
+    def forward(self, stream, data):
+        """Send deltas now; keep only the latest state-like message per stream."""
+        if not conflated(stream):
+            self.server.publish(stream, data)
+            return
+
+        with self.lock:
+            previous = self.pending.get(stream)
+            if isinstance(data, list) and isinstance(previous, list):
+                # All-market arrays only list the symbols that changed.
+                merged = {item["s"]: item for item in previous}
+                merged.update((item["s"], item) for item in data)
+                data = list(merged.values())
+            self.pending[stream] = data
+            # A finished candle is never folded into the next one.
+            if previous and "k" in data and previous["k"]["t"] != data["k"]["t"]:
+                self.server.publish(stream, previous)
+
+    def flush_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                for stream, data in pending.items():
+                    self.server.publish(stream, data)
+
+    def stats(self):
+        with self.lock:
+            streams = len(self.trackers)
+        return f"{len(self.server.clients)} clients, {streams} upstream streams"
+
+    def close(self):
+        self.running = False
+        self.server.close()
+        for tracker in list(self.trackers.values()):
+            tracker.stop()
+        Framework.hub.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9443)
+    parser.add_argument("--upstream", default=STREAM_URL, help="combined-stream base URL")
+    parser.add_argument(
+        "--rate", type=float, default=4, help="ticker/kline updates per second"
+    )
+    parser.add_argument(
+        "--history", type=int, default=43_200, help="candles kept per kline stream"
+    )
+    args = parser.parse_args()
+
+    Framework.hub.base_url = args.upstream
+    fanout = FanoutServer(args.host, args.port, args.rate, args.history)
+    fanout.start()
+    print(f"fan-out server on {fanout.server.url}, upstream {args.upstream}")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(fanout.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fanout.close()
+
+
+if __name__ == "__main__":
+    main()
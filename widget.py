@@ -1,43 +1,143 @@
+import time
 import tkinter as tk
+from datetime import datetime
 from tkinter import ttk
 
-import pandas as pd
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import numpy as np
+
+from lib import (
+    EMA,
+    MACD,
+    RSI,
+    AlertRule,
+    BarRule,
+    BarTracker,
+    Bollinger,
+    KlineTracker,
+    LiquidityHeatmap,
+    MarketTracker,
+    Resampler,
+    SubscriptionPool,
+    TickerTracker,
+    TraderTracker,
+    UpdateQueue,
+    bookDepthTracker,
+    metrics,
+    startup,
+)
+
+
+def when_shown(widget, callback):
+    """Call `callback` each time `widget` is mapped, once the paint is done."""
+    widget.bind("<Map>", lambda event: widget.after_idle(callback), add="+")
+
+
+class UIDispatcher:
+    """Applies queued stream updates on the Tk main loop at a fixed rate."""
+
+    def __init__(self, root, fps=30) -> None:
+        self.root = root
+        self.interval = max(1000 // fps, 1)
+        self.queue = UpdateQueue()
+        self.rendered = 0
+        self.job = self.root.after(self.interval, self.pump)
+
+    def bind(self, key, handler):
+        """Return a thread-safe callback that posts to `handler` under `key`."""
+        return lambda payload: self.queue.post(key, handler, payload)
+
+    def post(self, key, handler, payload):
+        return self.queue.post(key, handler, payload)
+
+    def on_done(self, key, future, handler):
+        """Call `handler(future)` on the Tk thread once `future` finishes."""
+        future.add_done_callback(lambda done: self.queue.post(key, handler, done))
+
+    def pump(self):
+        self.job = self.root.after(self.interval, self.pump)
+        for handler, payload, stamp in self.queue.drain():
+            started = time.time_ns() // 1000
+            handler(payload)
+            metrics.rendered(stamp, started, time.time_ns() // 1000)
+            self.rendered += 1
+            if stamp and startup.mark("first live tick"):
+                print(f"startup: {startup.report()}")
+
+    def stats(self):
+        return dict(self.queue.stats(), rendered=self.rendered)
 
-from lib import CaddleTracker, TickerTracker, TraderTracker, bookDepthTracker
+    def stop(self):
+        if self.job:
+            self.root.after_cancel(self.job)
+            self.job = None
+
+
+class HealthLabel:
+    """Connection health of a panel's trackers, refreshed once a second."""
+
+    COLORS = {
+        "live": "green",
+        "quiet": "#BF8700",
+        "waiting": "#BF8700",
+        "syncing": "#BF8700",
+        "reconnecting": "red",
+        "offline": "red",
+    }
+
+    def __init__(self, parent, trackers, quiet_after=10) -> None:
+        self.trackers = trackers
+        self.quiet_after = quiet_after
+        self.label = tk.Label(parent, text="", font=("Arial", 9))
+        self.label.after(1000, self.refresh)
+
+    def refresh(self):
+        self.label.after(1000, self.refresh)
+        states = []
+        for tracker in self.trackers():
+            if tracker is None:
+                continue
+            state, age = tracker.health()
+            if state == "live" and age is None:
+                states.append(("waiting", "waiting"))
+            elif state == "live" and age > self.quiet_after:
+                states.append(("quiet", f"quiet {age:.0f}s"))
+            else:
+                states.append((state, state))
+        if not states:
+            return
+
+        # Show the worst state across the trackers.
+        order = list(self.COLORS)
+        state, text = max(states, key=lambda item: order.index(item[0]))
+        self.label.config(text=f"\u25cf {text}", fg=self.COLORS[state])
 
 
 class StatusTracker:
-    def __init__(self, parent) -> None:
+    COINS = [
+        ("BITCOIN", "btcusdt"),
+        ("Ethereum", "ethusdt"),
+        ("Solana", "solusdt"),
+        ("Doge COIN", "dogeusdt"),
+        ("Pepe COIN", "pepeusdt"),
+    ]
+
+    def __init__(self, parent, dispatcher, market=None, budget=8) -> None:
+        self.dispatcher = dispatcher
+        self.market = market
+        self.symbol = "btcusdt"
+
         ticker_frame = ttk.Frame(parent)
         ticker_frame.pack(side="top", fill="x", padx=10, pady=(5, 0))
-        ttk.Button(
-            ticker_frame,
-            text="BITCOIN",
-            command=lambda: self.Switch_select_coin("btcusdt"),
-        ).pack(side="left")
-
-        ttk.Button(
-            ticker_frame,
-            text="Ethereum",
-            command=lambda: self.Switch_select_coin("ethusdt"),
-        ).pack(side="left")
-        ttk.Button(
-            ticker_frame,
-            text="Solana",
-            command=lambda: self.Switch_select_coin("solusdt"),
-        ).pack(side="left")
-        ttk.Button(
-            ticker_frame,
-            text="Doge COIN",
-            command=lambda: self.Switch_select_coin("dogeusdt"),
-        ).pack(side="left")
-        ttk.Button(
-            ticker_frame,
-            text="Pepe COIN",
-            command=lambda: self.Switch_select_coin("pepeusdt"),
-        ).pack(side="left")
+        self.health = HealthLabel(
+            ticker_frame, lambda: [self.tickerTracker, self.widget_trader]
+        )
+        self.health.label.pack(side="right")
+        for text, symbol in self.COINS:
+            ttk.Button(
+                ticker_frame,
+                text=text,
+                command=lambda symbol=symbol: self.Switch_select_coin(symbol),
+            ).pack(side="left")
 
         stats_frame = ttk.LabelFrame(parent, text="Summarize")
         stats_frame.pack(side="top", fill="x", padx=10, pady=5)
@@ -58,17 +158,6 @@ class StatusTracker:
         for i, text in enumerate(headers):
             ttk.Label(stats_frame, text=text).grid(row=0, column=i, sticky="w", padx=5)
 
-        self.tickerTracker = TickerTracker(
-            "btcusdt", "ticker", callback=self.Update_display
-        )
-
-        self.widget_trader = TraderTracker(
-            "btcusdt", "trade", callback=self.Update_trading
-        )
-
-        self.tickerTracker.start()
-        self.widget_trader.start()
-
         self.current_price = tk.Label(stats_frame, text="$312313", foreground="#00FF00")
         self.change_label = tk.Label(stats_frame, text="$312313", foreground="#00FF00")
         self.current_coin = tk.Label(stats_frame, text="$314124", foreground="#00FF00")
@@ -81,32 +170,60 @@ class StatusTracker:
         self.price.grid(row=1, column=3, sticky="w", padx=5)
         self.quantity.grid(row=1, column=4, sticky="w", padx=5)
 
-    def Switch_select_coin(self, symbol):
-        if self.tickerTracker is not None or self.widget_trader is not None:
-            self.tickerTracker.stop()
-            self.widget_trader.stop()
-
-        self.tickerTracker = TickerTracker(
-            symbol, "ticker", callback=self.Update_display
+        # The configured coins stay subscribed so switching between them is
+        # a callback swap; other symbols are kept warm up to `budget`.
+        pinned = [symbol for _, symbol in self.COINS]
+        self.tickers = SubscriptionPool(
+            lambda symbol: TickerTracker(symbol, "ticker"), budget, pinned
         )
-
-        self.widget_trader = TraderTracker(
-            symbol, "trade", callback=self.Update_trading
+        self.trades = SubscriptionPool(
+            lambda symbol: TraderTracker(symbol, "trade"), budget, pinned
         )
+        self.on_ticker = dispatcher.bind((self, "ticker"), self.Update_display)
+        self.on_trade = dispatcher.bind((self, "trade"), self.Update_trading)
 
-        self.current_price.config(text=f"Loading...")
-        self.change_label.config(
-            text=f"Loading..."
-        )
-        
-        self.current_coin.config(text=f"Loading...")
-        self.price.config(text=f"Loading...")
-        self.quantity.config(text=f"Loading...")
+        self.tickerTracker = None
+        self.widget_trader = None
+        self.Switch_select_coin(self.symbol)
+        when_shown(ticker_frame, lambda: self.prefetch(pinned))
+
+    def prefetch(self, symbols):
+        self.tickers.prefetch(symbols)
+        self.trades.prefetch(symbols)
+
+    def Switch_select_coin(self, symbol):
+        """Show `symbol` from its warm trackers, subscribing only if it is cold."""
+        if self.tickerTracker is not None or self.widget_trader is not None:
+            self.tickerTracker.callback = None
+            self.widget_trader.callback = None
+
+        self.symbol = symbol
+        self.tickerTracker = self.tickers.acquire(symbol)
+        self.widget_trader = self.trades.acquire(symbol)
+        self.tickerTracker.callback = self.on_ticker
+        self.widget_trader.callback = self.on_trade
+
+        # Last known state first; the all-market table covers cold tickers.
+        ticker = self.tickerTracker.information
+        if ticker is None and self.market:
+            ticker = self.market.row(symbol)
+        if ticker:
+            self.Update_display(ticker)
+        else:
+            self.current_price.config(text=f"Loading...")
+            self.change_label.config(text=f"Loading...")
 
-        self.tickerTracker.start()
-        self.widget_trader.start()
+        if self.widget_trader.information:
+            self.Update_trading(self.widget_trader.information)
+        else:
+            self.current_coin.config(text=f"Loading...")
+            self.price.config(text=f"Loading...")
+            self.quantity.config(text=f"Loading...")
 
     def Update_display(self, information):
+        if information["symbol"] != self.symbol:
+            return
+
         change = information["change"]
         price = information["price"]
         percent = information["percent"]
@@ -121,6 +238,9 @@ class StatusTracker:
 
     def Update_trading(self, information):
         symbol = information["symbol"]
+        if symbol != self.symbol:
+            return
+
         price = information["price"]
         quantity = information["quantity"]
 
@@ -129,150 +249,319 @@ class StatusTracker:
         self.quantity.config(text=f"${quantity}")
 
     def stop(self):
-        self.tickerTracker.stop()
-        self.widget_trader.stop()
+        self.tickers.stop()
+        self.trades.stop()
 
 
 class KlineGraph:
-    def __init__(self, parent, symbol, display_name) -> None:
+    TIMEFRAMES = ["5s", "15s", "1m", "5m", "15m", "1h", "4h", "1d", "100t", "1000t"]
+
+    def __init__(
+        self,
+        parent,
+        symbol,
+        display_name,
+        dispatcher,
+        interval="1h",
+        indicators=None,
+        base_days=3,
+        visible=500,
+    ) -> None:
         self.frame = ttk.Frame(parent)
         self.symbol = symbol
         self.display_name = display_name
         self.sol_visible = True
 
-        self.fig = Figure(figsize=(6, 4), dpi=100)
-
-        self.ax_price = self.fig.add_subplot(211)
-        self.ax_vol = self.fig.add_subplot(212, sharex=self.ax_price)
+        # Viewport: how many candles are shown and the open time of the last
+        # one, None while following the live candle.
+        self.visible = visible
+        self.end_time = None
+        self.candles = None
+        self.stop_index = 0
+        self.drag = None
+        self.loading = None
+
+        toolbar = ttk.Frame(self.frame)
+        toolbar.pack(side="top", fill="x")
+        ttk.Label(toolbar, text="Timeframe").pack(side="left", padx=(0, 5))
+        self.timeframe = tk.StringVar(value=interval)
+        picker = ttk.Combobox(
+            toolbar, textvariable=self.timeframe, values=self.TIMEFRAMES, width=6
+        )
+        picker.pack(side="left")
+        picker.bind("<<ComboboxSelected>>", lambda event: self.set_interval())
+        picker.bind("<Return>", lambda event: self.set_interval())
+        ttk.Button(toolbar, text="Latest", command=self.follow_live).pack(
+            side="right"
+        )
+        self.health = HealthLabel(toolbar, lambda: [self.tracker, self.bars])
+        self.health.label.pack(side="right", padx=5)
+
+        self.dispatcher = dispatcher
+        self.indicators = indicators
+        self.base_days = base_days
+        self.fig = None
+        self.canvas = None
+        self.chart = None
+        self.tracker = None
+
+        # Every timeframe is resampled locally from one cached 1m series;
+        # sub-minute, tick, volume and dollar bars are built from trades.
+        self.resampler = Resampler(interval)
+        self.base = None
+        self.rule = None
+        self.bars = None
+        self.bar_candles = None
+
+        # Matplotlib, the figure and the 1m stream wait until the panel is
+        # on screen, so the window can paint first.
+        when_shown(self.frame, self.build)
+
+    def build(self):
+        """Create the figure and start the 1m stream; a no-op once built."""
+        if self.chart is not None or not self.sol_visible:
+            return
+
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        from chart import CandleChart
 
-        self.ax = self.ax_price
+        self.fig = Figure(figsize=(6, 4), dpi=100)
 
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
         self.canvas.get_tk_widget().pack(fill="both", expand=True)
 
-        self.UpdateGraph()
-
-    def UpdateGraph(self):
-        list_dict_data = CaddleTracker().fetch_data(self.symbol)
-
-        stock_prices = pd.DataFrame(
-            {
-                "open_time": pd.to_datetime(list_dict_data["open_time"], unit="ms"),
-                "close_time": pd.to_datetime(list_dict_data["close_time"], unit="ms"),
-                "open": pd.to_numeric(list_dict_data["open"]),
-                "close": pd.to_numeric(list_dict_data["close"]),
-                "high": pd.to_numeric(list_dict_data["high"]),
-                "low": pd.to_numeric(list_dict_data["low"]),
-                "volume": pd.to_numeric(list_dict_data["volume"]),
-            }
-        )
-
-        self.DrawGraph(stock_prices)
-
-    def DrawGraph(self, stock_prices):
-        BG_COLOR = "#F5F7FA"
-        GRID_COLOR = "#E1E5EB"
-        TEXT_COLOR = "#2C2F36"
-
-        UP_COLOR = "#2DA44E"
-        DOWN_COLOR = "#D73A49"
-        VOLUME_UP_COLOR = "#9AD6B4"
-        VOLUME_DOWN_COLOR = "#F1A7A7"
-
-        self.fig.set_facecolor(BG_COLOR)
-        self.fig.patch.set_facecolor(BG_COLOR)
-
-        for ax in [self.ax_price, self.ax_vol]:
-            ax.clear()
-            ax.set_facecolor(BG_COLOR)
-
-            for spine in ax.spines.values():
-                spine.set_color(TEXT_COLOR)
-
-            ax.tick_params(axis="x", colors=TEXT_COLOR)
-            ax.tick_params(axis="y", colors=TEXT_COLOR)
-            ax.yaxis.label.set_color(TEXT_COLOR)
-
-            ax.grid(True, color=GRID_COLOR, linestyle="--", alpha=0.6)
+        indicators = self.indicators
+        if indicators is None:
+            indicators = [EMA(20), Bollinger(20, 2), RSI(14), MACD(12, 26, 9)]
+        self.chart = CandleChart(self.fig, self.canvas, self.display_name, indicators)
+        self.ax_price = self.chart.ax_price
+        self.ax_vol = self.chart.ax_vol
 
-        x = stock_prices["open_time"]
-
-        up = stock_prices[stock_prices.close >= stock_prices.open]
-        down = stock_prices[stock_prices.close < stock_prices.open]
-
-        width = (x.iloc[1] - x.iloc[0]).total_seconds() / 86400 * 0.8
-        wick = width * 0.2
-
-        self.ax_price.bar(
-            x[up.index], up.close - up.open, width, bottom=up.open, color=UP_COLOR
-        )
-        self.ax_price.bar(
-            x[up.index], up.high - up.close, wick, bottom=up.close, color=UP_COLOR
-        )
-        self.ax_price.bar(
-            x[up.index], up.low - up.open, wick, bottom=up.open, color=UP_COLOR
-        )
-
-        self.ax_price.bar(
-            x[down.index],
-            down.close - down.open,
-            width,
-            bottom=down.open,
-            color=DOWN_COLOR,
-        )
-        self.ax_price.bar(
-            x[down.index],
-            down.high - down.open,
-            wick,
-            bottom=down.open,
-            color=DOWN_COLOR,
-        )
-        self.ax_price.bar(
-            x[down.index],
-            down.low - down.close,
-            wick,
-            bottom=down.close,
-            color=DOWN_COLOR,
+        self.ax = self.ax_price
+        self.canvas.mpl_connect("scroll_event", self.on_scroll)
+        self.canvas.mpl_connect("button_press_event", self.on_press)
+        self.canvas.mpl_connect("motion_notify_event", self.on_motion)
+        self.canvas.mpl_connect("button_release_event", self.on_release)
+
+        self.tracker = KlineTracker(
+            self.symbol,
+            "1m",
+            callback=self.dispatcher.bind((self, "kline"), self.update_candles),
+            history=self.base_days * 1440,
         )
-
-        self.ax_vol.bar(
-            x[up.index],
-            stock_prices.loc[up.index, "volume"],
-            width,
-            color=VOLUME_UP_COLOR,
+        self.tracker.start()
+        self.dispatcher.on_done(
+            (self, "seed"), self.tracker.seeding, self.on_seeded
         )
-        self.ax_vol.bar(
-            x[down.index],
-            stock_prices.loc[down.index, "volume"],
-            width,
-            color=VOLUME_DOWN_COLOR,
+        if self.rule is not None:
+            self.start_bars()
+
+    def start_bars(self):
+        """Build the current bar rule from trades, rebuilding if already streaming."""
+        self.chart.index_axis(self.rule.kind != "time")
+        if self.bars is not None:
+            rebuilt = self.bars.set_rule(self.rule)
+            self.dispatcher.on_done((self, "bars rule"), rebuilt, self.on_rebuilt)
+            return
+
+        self.chart.set_status("Loading trades...")
+        self.bars = BarTracker(
+            self.symbol,
+            self.rule,
+            callback=self.dispatcher.bind((self, "bars"), self.update_bars),
         )
-
-        step = max(len(x) // 6, 1)
-        self.ax_vol.set_xticks(x.iloc[::step])
-        self.ax_vol.set_xticklabels(
-            stock_prices["close_time"].dt.strftime("%Y-%m-%d").iloc[::step],
-            rotation=15,
-            ha="right",
-            color=TEXT_COLOR,
-            fontsize=10,
+        self.bars.start()
+        self.dispatcher.on_done((self, "bars seed"), self.bars.seeding, self.on_seeded)
+
+    def stop_bars(self):
+        if self.bars is not None:
+            self.bars.callback = None
+            self.bars.stop()
+        self.bars = self.bar_candles = None
+
+    def release(self):
+        """Drop the stream and the figure; `build` recreates both from the cache."""
+        if self.tracker is not None:
+            # A history load still in flight must not reach the next chart.
+            self.tracker.callback = None
+            self.tracker.stop()
+        self.stop_bars()
+        if self.canvas is not None:
+            self.canvas.get_tk_widget().destroy()
+            self.fig.clear()
+
+        self.fig = self.canvas = self.chart = self.tracker = None
+        self.base = self.candles = None
+        self.drag = self.loading = None
+        self.resampler = Resampler(self.resampler.interval)
+
+    def on_seeded(self, future):
+        if self.chart is None:
+            return
+        if not future.cancelled() and future.exception():
+            self.chart.set_status("Could not load candles, retrying...")
+
+    def update_candles(self, information):
+        if self.chart is None:
+            return
+        self.base = information["candles"]
+        if self.rule is None:
+            self.show(full=information["full"])
+        startup.mark("first candles")
+
+    def on_rebuilt(self, future):
+        if self.chart is None or self.bars is None:
+            return
+        self.bar_candles = future.result()
+        self.show(full=True)
+
+    def update_bars(self, information):
+        if self.chart is None or self.bars is None:
+            return
+        self.bar_candles = information["candles"]
+        self.show(full=information["full"])
+
+    def set_interval(self):
+        """Switch timeframe by resampling the cached 1m series; no network.
+
+        Rules finer than a minute or not based on time ("100t", "50v",
+        "2M$") switch to bars built from the trade stream instead.
+        """
+        interval = self.timeframe.get().strip()
+        try:
+            rule = BarRule.parse(interval)
+            resampler = None if rule.needs_trades else Resampler(interval)
+        except ValueError:
+            self.timeframe.set(self.rule.text if self.rule else self.resampler.interval)
+            return
+
+        if resampler is None:
+            self.rule = rule
+            if self.chart is not None:
+                self.start_bars()
+            return
+
+        self.stop_bars()
+        self.rule = None
+        self.resampler = resampler
+        if self.chart is not None:
+            self.chart.index_axis(False)
+            if self.base is not None:
+                self.show(full=True)
+
+    def show(self, full):
+        """Draw the visible window; it never reaches past the oldest loaded candle."""
+        if self.rule is not None:
+            candles = self.bar_candles
+        else:
+            candles = self.resampler.update(self.base)
+        total = len(candles) if candles is not None else 0
+        if total == 0:
+            return
+
+        stop = total
+        if self.end_time is not None:
+            stop = int(np.searchsorted(candles["open_time"], self.end_time, "right"))
+            stop = max(stop, 1)
+        start = max(stop - self.visible, 0)
+
+        self.candles = candles
+        self.stop_index = stop
+        self.chart.render(
+            candles,
+            full=full,
+            window=(start, stop),
+            pixels=int(self.ax_price.bbox.width),
         )
 
-        self.ax_price.set_title(
-            f"{self.display_name} Candlestick + Volume", color=TEXT_COLOR
-        )
+    def load_older(self, missing):
+        """Page in 1m history for `missing` more candles, when the user asks."""
+        if self.rule is not None or self.tracker.exhausted:
+            return
+        if self.loading is not None and not self.loading.done():
+            return
+        # At most ten REST pages per call; the next pan or zoom asks again.
+        count = min(max(missing * self.resampler.step // 60_000, 1440), 10_000)
+        self.loading = self.tracker.load_older(count)
+
+    def shown(self):
+        """Candles in the current view; `visible` clamped to what is loaded."""
+        return min(self.visible, self.stop_index)
+
+    def pan_to(self, stop):
+        """Move the view's right edge to `stop`; dragging past the oldest
+        loaded candle pages older history in."""
+        shown = self.shown()
+        if stop < shown:
+            self.load_older(shown - stop)
+        stop = min(max(stop, shown, 1), len(self.candles))
+        if stop == len(self.candles):
+            self.end_time = None
+        else:
+            self.end_time = int(self.candles["open_time"][stop - 1])
+        self.show(full=False)
+
+    def follow_live(self):
+        if self.candles is not None:
+            self.pan_to(len(self.candles))
+
+    def on_scroll(self, event):
+        """Wheel zooms around the right edge of the view; zooming out past the
+        oldest loaded candle pages older history in."""
+        if self.candles is None:
+            return
+        shown = self.shown()
+        if event.button == "up":
+            self.visible = max(int(shown / 1.25), 20)
+        else:
+            wanted = int(shown * 1.25) + 1
+            if wanted > self.stop_index:
+                self.load_older(wanted - self.stop_index)
+            self.visible = max(min(wanted, self.stop_index), 20)
+        self.show(full=False)
+
+    def on_press(self, event):
+        if event.button == 1 and event.inaxes and self.candles is not None:
+            self.drag = (event.x, self.stop_index)
+
+    def on_motion(self, event):
+        """Dragging right reveals older candles."""
+        if self.drag is None:
+            return
+        x, stop = self.drag
+        per_pixel = self.shown() / max(self.ax_price.bbox.width, 1)
+        self.pan_to(stop - int((event.x - x) * per_pixel))
+
+    def on_release(self, event):
+        self.drag = None
 
-        self.ax_price.tick_params(labelbottom=False)
+    def UpdateGraph(self):
+        """Redraw everything from the live series; no network needed."""
+        if self.chart is None:
+            return
+        self.base = self.tracker.series.view()
+        if self.bars is not None:
+            self.bar_candles = self.bars.series.view()
+        self.show(full=True)
 
-        self.canvas.draw_idle()
+    def DrawGraph(self, candles, full=True):
+        self.chart.render(candles, full=full)
 
     def grid(self, **kwargs):
         self.frame.grid(**kwargs)
 
+    def stop(self):
+        if self.tracker is not None:
+            self.tracker.stop()
+        self.stop_bars()
+
     def toggle_visibility(self, button_ref=None):
         if self.sol_visible:
             self.frame.grid_forget()
             self.sol_visible = False
+            self.release()
             if button_ref:
                 button_ref.config(text=f"Show {self.display_name}")
         else:
@@ -283,13 +572,29 @@ class KlineGraph:
 
 
 class BookDepth:
-    def __init__(self, parent, symbol, display_name, limit) -> None:
+    def __init__(
+        self,
+        parent,
+        symbol,
+        display_name,
+        limit,
+        dispatcher,
+        autostart=True,
+        depth_levels=500,
+    ) -> None:
         self.parent = parent
         self.symbol = symbol
         self.display_name = display_name
         self.limit = limit
+        self.depth_levels = depth_levels
         self.sol_visible = True
 
+        # Depth chart mode; the figure exists only while it is shown.
+        self.heatmap = LiquidityHeatmap()
+        self.fig = None
+        self.canvas = None
+        self.depth = None
+
         self.bid_labels = [] 
         self.ask_labels = [] 
 
@@ -298,22 +603,35 @@ class BookDepth:
         
         self.header = ttk.Label(self.frame, text=f"{display_name} Order Book", font=("Arial", 12, "bold"))
         self.header.pack(pady=(5, 10))
+        self.health = HealthLabel(self.frame, lambda: [self.tracker])
+        self.health.label.pack()
+        self.mode_button = ttk.Button(
+            self.frame, text="Depth chart", command=self.toggle_mode
+        )
+        self.mode_button.pack(pady=(0, 5))
 
         self.create_book_view()
 
-        self.tracker = bookDepthTracker(self.symbol, "depth10", callback=self.update_information)
-        self.tracker.start()
+        self.tracker = bookDepthTracker(
+            self.symbol,
+            "depth@100ms",
+            callback=dispatcher.bind((self, "book"), self.update_information),
+            limit=self.limit,
+        )
+        if autostart:
+            when_shown(self.frame, self.start)
 
 
     def create_book_view(self):
-        raw_bids = [("---", "---") for _ in range(10)]
-        raw_asks = [("---", "---") for _ in range(10)]
+        raw_bids = [("---", "---") for _ in range(self.limit)]
+        raw_asks = [("---", "---") for _ in range(self.limit)]
 
         bid_data = [["BIDS", "High-Low"], ["Price", "Qty"]] + raw_bids
         ask_data = [["ASKS", "Low-High"], ["Price", "Qty"]] + raw_asks
 
         grid_container = ttk.Frame(self.frame)
         grid_container.pack(fill="both", expand=True, padx=10)
+        self.levels_view = grid_container
         
         grid_container.columnconfigure(0, weight=1)
         grid_container.columnconfigure(1, weight=1)
@@ -350,39 +668,478 @@ class BookDepth:
 
             self.ask_labels.append((a_label, a_val))
         
-    def update_information(self, information):
-        bids_dict, asks_dict = information
+    def toggle_mode(self):
+        """Switch between the level table and the depth chart with heatmap."""
+        if self.depth is None:
+            self.show_depth()
+        else:
+            self.show_levels()
 
-        bid_items = list(bids_dict.items())
-        ask_items = list(asks_dict.items())
+    def show_depth(self):
+        self.levels_view.pack_forget()
+        self.build_depth()
 
-        for i in range(10):
-            ui_index = i + 2 
-            
-            if ui_index < len(self.bid_labels):
-                if i < len(bid_items):
-                    self.bid_labels[ui_index][0].configure(text=bid_items[i][0])
-                    self.bid_labels[ui_index][1].configure(text=bid_items[i][1])
+        self.tracker.limit = self.depth_levels
+        self.tracker.arrays = True
+        self.mode_button.config(text="Levels")
+
+    def build_depth(self):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+
+        from chart import DepthChart
+
+        self.fig = Figure(figsize=(4, 4), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        title = self.display_name or self.symbol.upper()
+        self.depth = DepthChart(self.fig, self.canvas, title, self.heatmap)
 
-            if ui_index < len(self.ask_labels):
-                if i < len(ask_items):
-                
-                    self.ask_labels[ui_index][0].configure(text=ask_items[i][0])
-                    self.ask_labels[ui_index][1].configure(text=ask_items[i][1])
+    def release_depth(self):
+        """Drop the depth figure; the heatmap history is kept for `build_depth`."""
+        self.canvas.get_tk_widget().destroy()
+        self.fig.clear()
+        self.fig = self.canvas = self.depth = None
+
+    def show_levels(self):
+        self.release_depth()
+
+        self.tracker.limit = self.limit
+        self.tracker.arrays = False
+        self.levels_view.pack(fill="both", expand=True, padx=10)
+        self.mode_button.config(text="Depth chart")
+
+    def update_information(self, information):
+        # Payloads queued before the panel was hidden are not drawn.
+        if not self.sol_visible:
+            return
+        # Arrays come from depth mode; a payload from the other mode can
+        # still be queued right after a switch.
+        if len(information) == 4:
+            if self.depth is not None:
+                self.heatmap.add(*information)
+                self.depth.render(information)
+            return
+        if self.depth is not None:
+            return
+
+        bids, asks = information
+
+        for i in range(self.limit):
+            ui_index = i + 2
+
+            self.render_level(self.bid_labels[ui_index], bids, i)
+            self.render_level(self.ask_labels[ui_index], asks, i)
+
+    def render_level(self, labels, levels, i):
+        if i < len(levels):
+            price, quantity = levels[i]
+            labels[0].configure(text=f"${price:.3f}")
+            labels[1].configure(text=f"{quantity:.5f}")
+        else:
+            labels[0].configure(text="---")
+            labels[1].configure(text="---")
 
     def toggle_visibility(self, button_ref=None):
         if self.sol_visible:
             self.frame.grid_forget()
             self.sol_visible = False
             self.tracker.stop()
+            # tracker.arrays still says depth mode, so showing rebuilds it.
+            if self.depth is not None:
+                self.release_depth()
             if button_ref:
                 button_ref.config(text=f"Show {self.display_name}")
         else:
             self.frame.grid(row=0, column=0, sticky="nsew")
             self.sol_visible = True
+            if self.tracker.arrays and self.depth is None:
+                self.build_depth()
             self.tracker.start()
             if button_ref:
                 button_ref.config(text=f"Hide {self.display_name}")
     
+    def start(self):
+        if self.sol_visible:
+            self.tracker.start()
+
     def stop(self):
-        self.tracker.stop()
\ No newline at end of file
+        self.tracker.stop()
+
+class TimeAndSales:
+    """Scrolling trade tape and rolling statistics read from a TradeTape."""
+
+    def __init__(self, parent, tape_source, rows=12, fps=10) -> None:
+        self.tape_source = tape_source
+        self.rows = rows
+        self.interval = 1000 // fps
+        self.seen = None
+
+        self.frame = ttk.Frame(parent)
+        self.frame.pack(fill="both", expand=True)
+
+        self.table = ttk.Treeview(
+            self.frame,
+            columns=["time", "price", "qty"],
+            show="headings",
+            height=rows,
+        )
+        for name, text in [("time", "Time"), ("price", "Price"), ("qty", "Qty")]:
+            self.table.heading(name, text=text)
+            self.table.column(name, width=80, anchor="e")
+        self.table.tag_configure("buy", foreground="green")
+        self.table.tag_configure("sell", foreground="red")
+        self.table.pack(fill="both", expand=True)
+
+        for i in range(rows):
+            self.table.insert("", "end", iid=str(i), values=("", "", ""))
+
+        self.stats_label = ttk.Label(self.frame, text="", justify="left")
+        self.stats_label.pack(fill="x", pady=(5, 0))
+
+        self.frame.after(self.interval, self.refresh)
+
+    def refresh(self):
+        self.frame.after(self.interval, self.refresh)
+        tape = self.tape_source()
+        if tape is None:
+            return
+        if (id(tape), tape.count) != self.seen:
+            self.seen = (id(tape), tape.count)
+            self.show_trades(tape)
+
+        # Statistics age even without new trades, so they refresh every tick.
+        lines = []
+        for window in tape.stats():
+            if window["vwap"] is None:
+                lines.append(f"{window['seconds']}s: no trades")
+                continue
+            largest_price, largest_qty = window["largest"]
+            lines.append(
+                f"{window['seconds']}s: VWAP ${window['vwap']:,.4f}  "
+                f"buy {window['buy_volume']:.4f} / sell {window['sell_volume']:.4f}  "
+                f"{window['rate']:.1f} trades/s  "
+                f"max {largest_qty:.4f} @ ${largest_price:,.4f}"
+            )
+        self.stats_label.configure(text="\n".join(lines))
+
+    def show_trades(self, tape):
+        trades = tape.latest(self.rows)
+        for i in range(self.rows):
+            if i < len(trades):
+                price, qty, time_ms, buyer_maker = trades[i].tolist()
+                stamp = datetime.fromtimestamp(time_ms / 1000).strftime("%H:%M:%S")
+                values = (stamp, f"${price:,.4f}", f"{qty:.5f}")
+                tags = ("sell",) if buyer_maker else ("buy",)
+            else:
+                values, tags = ("", "", ""), ()
+            self.table.item(str(i), values=values, tags=tags)
+
+
+class Watchlist:
+    """Every market from one stream; only the visible rows exist as items."""
+
+    COLUMNS = [
+        ("symbol", "Symbol", 90),
+        ("price", "Price", 90),
+        ("percent", "24h %", 60),
+        ("quote_volume", "Volume", 80),
+    ]
+
+    def __init__(self, parent, on_select=None, rows=20, fps=4) -> None:
+        self.on_select = on_select
+        self.rows = rows
+        self.interval = 1000 // fps
+        self.sort_key = "quote_volume"
+        self.descending = True
+        self.offset = 0
+        self.order = np.empty(0, dtype=int)
+        self.shown = [None] * rows
+        self.current = None
+        self.seen = None
+
+        self.frame = ttk.Frame(parent)
+        self.frame.pack(fill="both", expand=True)
+
+        self.filter = tk.StringVar()
+        search = ttk.Entry(self.frame, textvariable=self.filter)
+        search.pack(side="top", fill="x", pady=(0, 5))
+        self.health = HealthLabel(self.frame, lambda: [self.tracker])
+        self.health.label.pack(side="bottom", anchor="w")
+        self.filter.trace_add("write", lambda *args: self.scroll_to(0))
+
+        body = ttk.Frame(self.frame)
+        body.pack(fill="both", expand=True)
+        self.table = ttk.Treeview(
+            body,
+            columns=[c[0] for c in self.COLUMNS],
+            show="headings",
+            height=rows,
+            selectmode="browse",
+        )
+        for name, text, width in self.COLUMNS:
+            self.table.heading(name, text=text, command=lambda name=name: self.sort_by(name))
+            self.table.column(name, width=width, anchor="e")
+        self.table.column("symbol", anchor="w")
+        self.table.tag_configure("up", foreground="green")
+        self.table.tag_configure("down", foreground="red")
+        self.table.tag_configure("current", background="#DDF4FF")
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.table.pack(side="left", fill="both", expand=True)
+
+        for i in range(rows):
+            self.table.insert("", "end", iid=str(i), values=("", "", "", ""))
+        self.table.bind("<<TreeviewSelect>>", self.on_click)
+        self.table.bind("<MouseWheel>", lambda e: self.scroll_to(self.offset + (-3 if e.delta > 0 else 3)))
+        self.table.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        self.table.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+
+        self.tracker = MarketTracker()
+        self.market = self.tracker.table
+        when_shown(self.frame, self.tracker.start)
+        self.frame.after(self.interval, self.refresh)
+
+    def refresh(self):
+        self.frame.after(self.interval, self.refresh)
+        if self.market.version != self.seen:
+            self.seen = self.market.version
+            self.draw()
+
+    def draw(self):
+        """Re-sort, then rewrite only the visible slots whose text changed."""
+        self.order = self.market.order(self.sort_key, self.descending, self.filter.get())
+        self.offset = max(min(self.offset, len(self.order) - self.rows), 0)
+        visible = self.market.rows(self.order[self.offset : self.offset + self.rows])
+
+        for slot in range(self.rows):
+            values, tags = ("", "", "", ""), ()
+            if slot < len(visible):
+                symbol, price, percent, volume = visible[slot]
+                values = (symbol, f"{price:.8g}", f"{percent:+.2f}", f"{volume / 1e6:,.1f}M")
+                tags = ("up",) if percent >= 0 else ("down",)
+                if symbol.lower() == self.current:
+                    tags += ("current",)
+            if (values, tags) != self.shown[slot]:
+                self.shown[slot] = (values, tags)
+                self.table.item(str(slot), values=values, tags=tags)
+
+        total = max(len(self.order), 1)
+        self.scrollbar.set(self.offset / total, min((self.offset + self.rows) / total, 1))
+
+    def scroll_to(self, offset):
+        self.offset = offset
+        self.draw()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.order)))
+        else:
+            step = self.rows if unit == "pages" else 1
+            self.scroll_to(self.offset + int(amount) * step)
+
+    def sort_by(self, key):
+        if key == self.sort_key:
+            self.descending = not self.descending
+        else:
+            self.sort_key = key
+            self.descending = key != "symbol"
+        self.draw()
+
+    def on_click(self, event):
+        selected = self.table.selection()
+        if not selected:
+            return
+        self.table.selection_remove(selected)
+
+        slot = self.offset + int(selected[0])
+        if slot >= len(self.order):
+            return
+        self.current = self.market.symbols[self.order[slot]].lower()
+        self.draw()
+        if self.on_select:
+            self.on_select(self.current)
+
+    def stop(self):
+        self.tracker.stop()
+
+
+class DiagnosticsPanel:
+    """Window listing per-stream rates and latency percentiles."""
+
+    COLUMNS = [
+        ("stream", "Stream", 170),
+        ("rate", "msg/s", 60),
+        ("conflated", "Conflated", 70),
+        ("dropped", "Dropped", 60),
+        ("network", "Network p50/p99", 110),
+        ("decode", "Decode p99", 80),
+        ("handle", "Handle p99", 80),
+        ("queue", "Queue p50/p99", 110),
+        ("render", "Render p99", 80),
+        ("total", "Total p50/p99", 110),
+    ]
+
+    def __init__(self, root) -> None:
+        self.window = tk.Toplevel(root)
+        self.window.title("Diagnostics")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.table = ttk.Treeview(
+            self.window, columns=[c[0] for c in self.COLUMNS], show="headings"
+        )
+        for name, text, width in self.COLUMNS:
+            self.table.heading(name, text=text)
+            self.table.column(name, width=width, anchor="e")
+        self.table.column("stream", anchor="w")
+        self.table.pack(fill="both", expand=True)
+
+        self.job = None
+        self.refresh()
+
+    @staticmethod
+    def micros(value):
+        if value is None:
+            return "-"
+        if value >= 1000:
+            return f"{value / 1000:.1f}ms"
+        return f"{value}us"
+
+    def refresh(self):
+        rows = {}
+        for row in metrics.snapshot():
+            values = [row["stream"], f"{row['rate']:.0f}", row["conflated"], row["dropped"]]
+            for stage, _, _ in self.COLUMNS[4:]:
+                p99 = self.micros(row[f"{stage}_p99"])
+                if stage in ("network", "queue", "total"):
+                    values.append(f"{self.micros(row[f'{stage}_p50'])} / {p99}")
+                else:
+                    values.append(p99)
+            rows[row["stream"]] = values
+
+        for stream, values in rows.items():
+            if self.table.exists(stream):
+                self.table.item(stream, values=values)
+            else:
+                self.table.insert("", "end", iid=stream, values=values)
+
+        self.job = self.window.after(1000, self.refresh)
+
+    def close(self):
+        if self.job:
+            self.window.after_cancel(self.job)
+        self.window.destroy()
+
+
+class AlertPanel:
+    """Window for adding and removing alert rules."""
+
+    COLUMNS = [
+        ("rule", "Rule", 230),
+        ("repeat", "Repeat", 60),
+        ("note", "Note", 150),
+    ]
+
+    def __init__(self, root, engine, symbol="btcusdt") -> None:
+        self.engine = engine
+        self.window = tk.Toplevel(root)
+        self.window.title("Alerts")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        form = ttk.Frame(self.window)
+        form.pack(side="top", fill="x", padx=5, pady=5)
+        self.symbol = tk.StringVar(value=symbol)
+        self.signal = tk.StringVar(value="price")
+        self.direction = tk.StringVar(value="above")
+        self.threshold = tk.StringVar()
+        self.seconds = tk.StringVar(value="300")
+        self.note = tk.StringVar()
+        self.repeat = tk.BooleanVar(value=False)
+
+        signal = ttk.Combobox(form, textvariable=self.signal, width=9, state="readonly")
+        signal["values"] = AlertRule.SIGNALS
+        direction = ttk.Combobox(
+            form, textvariable=self.direction, width=6, state="readonly"
+        )
+        direction["values"] = AlertRule.DIRECTIONS
+        fields = [
+            ("Symbol", ttk.Entry(form, textvariable=self.symbol, width=10)),
+            ("Signal", signal),
+            ("When", direction),
+            ("Threshold", ttk.Entry(form, textvariable=self.threshold, width=10)),
+            ("Window s", ttk.Entry(form, textvariable=self.seconds, width=6)),
+            ("Note", ttk.Entry(form, textvariable=self.note, width=14)),
+        ]
+        for column, (text, field) in enumerate(fields):
+            ttk.Label(form, text=text).grid(row=0, column=column, sticky="w", padx=2)
+            field.grid(row=1, column=column, sticky="w", padx=2)
+        column = len(fields)
+        ttk.Checkbutton(form, text="Repeat", variable=self.repeat).grid(
+            row=1, column=column, padx=2
+        )
+        ttk.Button(form, text="Add", command=self.add).grid(row=1, column=column + 1, padx=2)
+
+        self.error = ttk.Label(self.window, text="", foreground="red")
+        self.error.pack(side="top", anchor="w", padx=5)
+
+        self.table = ttk.Treeview(
+            self.window, columns=[c[0] for c in self.COLUMNS], show="headings"
+        )
+        for name, text, width in self.COLUMNS:
+            self.table.heading(name, text=text)
+            self.table.column(name, width=width, anchor="w")
+        self.table.pack(fill="both", expand=True, padx=5)
+        ttk.Button(self.window, text="Remove", command=self.remove).pack(
+            side="right", padx=5, pady=5
+        )
+
+        self.job = None
+        self.refresh()
+
+    def add(self):
+        try:
+            rule = AlertRule(
+                self.symbol.get().strip(),
+                self.signal.get(),
+                self.direction.get(),
+                float(self.threshold.get()),
+                window=int(self.seconds.get()) if self.signal.get() == "move" else None,
+                repeat=self.repeat.get(),
+                note=self.note.get().strip(),
+            )
+        except ValueError as error:
+            self.error.config(text=str(error))
+            return
+
+        self.error.config(text="")
+        self.engine.add(rule)
+        self.threshold.set("")
+        self.refresh()
+
+    def remove(self):
+        for item in self.table.selection():
+            self.engine.remove(int(item))
+        self.refresh()
+
+    def refresh(self):
+        if self.job:
+            self.window.after_cancel(self.job)
+
+        # Rules vanish from here once a one-shot alert fires.
+        rules = {str(rule_id): rule for rule_id, rule in list(self.engine.rules.items())}
+        for item in self.table.get_children():
+            if item not in rules:
+                self.table.delete(item)
+        for item, rule in rules.items():
+            values = (rule.describe(), "yes" if rule.repeat else "", rule.note)
+            if self.table.exists(item):
+                self.table.item(item, values=values)
+            else:
+                self.table.insert("", "end", iid=item, values=values)
+
+        self.job = self.window.after(1000, self.refresh)
+
+    def close(self):
+        if self.job:
+            self.window.after_cancel(self.job)
+        self.window.destroy()